@@ -2,6 +2,7 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Broker API"
@@ -12,7 +13,41 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./app.db"
     CSV_FILE_PATH: Path = Path("backend_table.csv")
     BACKUP_DIR: Path = Path("broker-api-backup")
+    # File format of the table, or sql for the broker_data database table
+    TABLE_STORAGE: Literal["csv", "feather", "parquet", "sql"] = "csv"
+    # One file, lock, journal and backups per broker instead of one table file
+    CSV_PARTITION_BY_BROKER: bool = False
+    # Publish the parsed table as a memory-mapped Arrow file that other
+    # worker processes map instead of parsing the table file again
+    CSV_SHARED_SNAPSHOT: bool = False
+    CSV_SHARED_SNAPSHOT_DIR: Optional[Path] = None  # default: /dev/shm, else next to the table
+    CSV_LOCK_TIMEOUT: float = 10  # seconds to wait for the table lock
+    CSV_SNAPSHOT_INTERVAL: int = 100  # journal records between table snapshots
+    CSV_SNAPSHOT_RETENTION: int = 5  # snapshots kept for restore
+    BACKUP_RETENTION_DAYS: float = 0  # drop snapshots older than this; 0 keeps all
+    BACKUP_RETENTION_MB: float = 0  # cap on the snapshots' size on disk; 0 is no cap
+    BACKUP_COMPRESS: bool = True  # gzip CSV snapshots in the background
+    CSV_READ_WORKERS: int = 4  # threads serving blocking table reads
+    CSV_WRITE_QUEUE_SIZE: int = 100  # pending mutations before answering 503
+    CSV_RETRY_AFTER_SECONDS: int = 1  # Retry-After sent with that 503
+    CSV_GROUP_COMMIT_WINDOW_MS: float = 2  # wait this long for more mutations to batch
+    CSV_GROUP_COMMIT_MAX_OPS: int = 64  # most mutations flushed in one write
+    CSV_BATCH_MAX_OPS: int = 10000  # operations accepted by POST /csv/batch
+    CSV_STREAM_CHUNK_ROWS: int = 10000  # rows per chunk in NDJSON exports
+    CSV_STREAM_CHUNK_BYTES: int = 65536  # bytes per chunk in CSV exports
+    GZIP_MIN_BYTES: int = 65536  # gzip larger responses for clients that accept it
+    GZIP_LEVEL: int = 5  # zlib level: higher is smaller but slower to compress
+    CSV_CHANGES_POLL_SECONDS: float = 1  # check for other processes' changes this often
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
+    SESSION_PRUNE_INTERVAL_SECONDS: float = 3600  # delete dead sessions this often; 0 never
+    SESSION_PRUNE_BATCH_SIZE: int = 1000  # sessions deleted per transaction
+    BCRYPT_ROUNDS: int = 12  # log2 of the bcrypt work factor for new password hashes
+    PASSWORD_HASH_WORKERS: int = 2  # processes hashing and checking passwords
+    PASSWORD_HASH_QUEUE_SIZE: int = 64  # pending password checks before answering 503
+    SESSION_CACHE_SIZE: int = 10000  # active sessions kept in memory per process
+    # Trust a cached session this long before checking the database again:
+    # the most a logout in another process takes to apply here; 0 disables
+    SESSION_CACHE_SECONDS: float = 30
 
     class Config:
         case_sensitive = True
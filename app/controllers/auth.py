@@ -17,7 +17,7 @@ async def register(
     user_data: UserCreate,
     db: Session = Depends(get_db)
 ):
-    user = AuthService.create_user(db, user_data)
+    user = await AuthService.register(db, user_data)
     return {"message": "User created successfully"}
 
 @router.post("/token", response_model=Token)
@@ -47,13 +47,8 @@ async def login(
     if not username or not password:
         raise HTTPException(status_code=400, detail="Username and password are required")
     
-    user = AuthService.authenticate_user(db, username=username, password=password)
-    if not user:
-        # Register the user if not found
-        user_data = UserCreate(username=username, password=password)
-        user = AuthService.create_user(db, user_data)
-        # Authenticate again after registration
-        user = AuthService.authenticate_user(db, username=username, password=password)
+    # Registers the user if not found
+    user = await AuthService.login_or_register(db, username=username, password=password)
     
     return AuthService.create_session(db, user)
 
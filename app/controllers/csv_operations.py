@@ -1,25 +1,184 @@
 # app/controllers/csv_operations.py
-import pandas as pd
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import Literal, Optional
+from datetime import datetime
+import hashlib
 from ..services.csv_manager import CSVManager
+from ..services.sql_table import SQLTableManager
+from ..services.table_service import TableService
+from ..services.table_diff import diff_tables
+from ..services.table_json import columns, dumps, json_response, ndjson
+from ..services.table_partitions import PartitionedTableManager
+from ..services.table_query import query_table
+from ..services.table_validation import check_row, validate_rows
 from ..database import get_db
+from ..config import get_settings
 from ..controllers.auth import get_current_user
 from ..models.user import UserSession
 
 router = APIRouter()
-csv_manager = CSVManager()
+settings = get_settings()
+# The broker table lives in a file, one file per broker with
+# CSV_PARTITION_BY_BROKER, or in the broker_data table with TABLE_STORAGE=sql
+if settings.TABLE_STORAGE == "sql":
+    csv_manager = SQLTableManager()
+elif settings.CSV_PARTITION_BY_BROKER:
+    csv_manager = PartitionedTableManager()
+else:
+    csv_manager = CSVManager()
+table_service = TableService(csv_manager)
+
+# Query parameters of GET /csv that are not column filters
+QUERY_PARAMS = {"fields", "sort", "offset", "limit", "orient"}
+
+def _etag(request: Request) -> Optional[str]:
+    """
+    ETag of a GET /csv response: the table's tag and the query. Weak, as
+    the same rows may be sent gzipped or not.
+    """
+    table_tag = csv_manager.etag()
+    if table_tag is None:
+        return None
+    query = request.url.query
+    if query:
+        table_tag += "-" + hashlib.blake2b(query.encode(), digest_size=8).hexdigest()
+    return f'W/"{table_tag}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison, as If-None-Match calls for."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
 
 @router.get("/csv")
 async def read_csv(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma separated columns to return, e.g. user,pnl"),
+    sort: Optional[str] = Query(None, description="Comma separated sort columns, prefix with - for descending"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    orient: Literal["records", "columns"] = Query(
+        "records", description="records for a list of rows, columns for {column: [values]}"
+    ),
     current_user: UserSession = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Get CSV data. Requires authentication.
+    Any other query parameter filters on a column: `broker=BrokerA`, or
+    with an `_lt`, `_lte`, `_gt`, `_gte`, `_ne` or `_in` suffix such as
+    `pnl_lt=0`. Columns may be named as in the file or in snake case
+    (`api_key`). Paginated responses carry X-Total-Count and, when more
+    rows follow, X-Next-Offset headers. Responses carry an ETag; send it
+    back in If-None-Match to get 304 Not Modified while the table is
+    unchanged. Missing values are null.
+    """
+    headers = {}
+    etag = _etag(request)
+    if etag is not None:
+        if _etag_matches(request, etag):
+            # Unchanged since the client's copy: no read, no serialization
+            return Response(status_code=304, headers={"ETag": etag})
+        headers["ETag"] = etag
+
+    filters = {
+        name: value for name, value in request.query_params.items()
+        if name not in QUERY_PARAMS
+    }
+    paginated = bool(filters or fields or sort or offset or limit)
+
+    def run_query():
+        # Encoded in the read pool too: for large tables it is the bulk of the work
+        if not paginated and orient == "records":
+            # Row dicts are cached with the table
+            return dumps(csv_manager.read_records()), None, None
+        if isinstance(csv_manager, PartitionedTableManager) and "broker" in filters:
+            # Only that broker's partition is read
+            page = csv_manager.read_cached(broker=filters["broker"])
+        else:
+            page = csv_manager.read_cached()
+        total = None
+        if paginated:
+            page, total = query_table(
+                page, filters, fields=fields, sort=sort, offset=offset, limit=limit
+            )
+        content = page.to_dict('records') if orient == "records" else columns(page)
+        return dumps(content), total, len(page)
+
+    body, total, count = await table_service.read(run_query)
+    if total is not None:
+        headers["X-Total-Count"] = str(total)
+        if offset + count < total:
+            headers["X-Next-Offset"] = str(offset + count)
+    return json_response(body, headers=headers)
+
+@router.get("/csv/aggregates")
+async def csv_aggregates(
+    group_by: Literal["broker", "user_prefix"] = Query(
+        "broker", description="broker, or user_prefix to group user_4 under user"
+    ),
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Per-group risk totals: row count, total pnl and margin, max and average
+    max_risk and the number of losing (pnl < 0) accounts. Served from
+    aggregates the server keeps up to date as rows change.
+    """
+    return await table_service.read(table_service.aggregates, group_by)
+
+def _stream_snapshot(snapshot, format: str):
+    """Yield the table in `format`, reading the file chunk by chunk."""
+    try:
+        if format == "csv":
+            yield from snapshot.iter_csv(settings.CSV_STREAM_CHUNK_ROWS, settings.CSV_STREAM_CHUNK_BYTES)
+        else:
+            for chunk in snapshot.iter_records(settings.CSV_STREAM_CHUNK_ROWS):
+                if len(chunk):
+                    yield ndjson(chunk)
+    finally:
+        snapshot.close()
+
+@router.get("/csv/stream")
+async def stream_csv(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="ndjson or csv"),
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream the whole table as NDJSON (one row per line) or CSV.
+    Rows are read and sent in chunks, so memory use does not grow with the
+    size of the table.
+    """
+    snapshot = await table_service.read(csv_manager.open_snapshot)
+    if format == "csv":
+        return StreamingResponse(
+            _stream_snapshot(snapshot, format),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{csv_manager.csv_path.name}"'}
+        )
+    return StreamingResponse(_stream_snapshot(snapshot, format), media_type="application/x-ndjson")
+
+@router.get("/csv/export")
+async def export_csv(
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """
-    return csv_manager.read().to_dict('records')
+    Download the table as a CSV file in the format of backend_table.csv,
+    whichever storage it is kept in.
+    """
+    snapshot = await table_service.read(csv_manager.open_snapshot)
+    return StreamingResponse(
+        _stream_snapshot(snapshot, "csv"),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{csv_manager.csv_path.name}"'}
+    )
 
 @router.post("/csv")
 async def create_csv_entry(
@@ -29,14 +188,178 @@ async def create_csv_entry(
 ):
     """
     Create new CSV entry. Requires authentication.
+    Every column is required and must fit the broker data schema (422).
     """
-    df = csv_manager.read()
-    new_row = pd.DataFrame([data])
-    df = pd.concat([df, new_row], ignore_index=True)
-    
-    csv_manager.write(df)
+    check_row(data)
+    await table_service.mutate("insert", user_id=current_user.user_id, rows=[data])
     return {"message": "Successfully wrote to CSV"}
 
+class BatchOperation(BaseModel):
+    op: Literal["insert", "update", "delete"]
+    row_id: Optional[int] = None  # position; update and delete need row_id or id
+    id: Optional[int] = None  # stable row id
+    data: Optional[dict] = None  # required for insert and update
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+    mode: Literal["atomic", "best_effort"] = "atomic"
+
+def _validate_operations(operations: list[BatchOperation]) -> list[Optional[HTTPException]]:
+    """Schema check of every insert and update: a 422 per invalid operation, else None."""
+    errors = [None] * len(operations)
+    for op, partial in (("insert", False), ("update", True)):
+        positions = [position for position, operation in enumerate(operations) if operation.op == op]
+        rows = [operations[position].data for position in positions]
+        for position, error in zip(positions, validate_rows(rows, partial=partial)):
+            if error is not None:
+                errors[position] = HTTPException(status_code=422, detail=error)
+    return errors
+
+@router.post("/csv/batch")
+async def batch_csv_entries(
+    request: BatchRequest,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Apply a list of insert/update/delete operations in order under a single
+    lock acquisition. In atomic mode nothing is written unless every
+    operation succeeds; in best_effort mode the valid operations are applied.
+    Inserted rows and update data are checked against the broker data
+    schema first, all of them at once; rows that do not fit fail with 422.
+    """
+    if len(request.operations) > settings.CSV_BATCH_MAX_OPS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.CSV_BATCH_MAX_OPS} operations per batch"
+        )
+    mutations = []
+    for position, operation in enumerate(request.operations):
+        if operation.op != "delete" and operation.data is None:
+            raise HTTPException(status_code=400, detail=f"Operation {position}: data is required")
+        if operation.op != "insert" and operation.row_id is None and operation.id is None:
+            raise HTTPException(status_code=400, detail=f"Operation {position}: row_id or id is required")
+        target = {"id": operation.id} if operation.id is not None else {"index": operation.row_id}
+        if operation.op == "insert":
+            mutations.append({"op": "insert", "rows": [operation.data]})
+        elif operation.op == "update":
+            mutations.append({"op": "update", **target, "values": operation.data})
+        else:
+            mutations.append({"op": "delete", **target})
+        mutations[-1]["user_id"] = current_user.user_id
+
+    atomic = request.mode == "atomic"
+    errors = _validate_operations(request.operations)
+    valid = [position for position, error in enumerate(errors) if error is None]
+    if valid and not (atomic and len(valid) < len(errors)):
+        results = await table_service.submit(
+            csv_manager.apply_mutations, [mutations[position] for position in valid], atomic=atomic
+        )
+        for position, error in zip(valid, results):
+            errors[position] = error
+    applied = not atomic or all(error is None for error in errors)
+    results = []
+    for position, error in enumerate(errors):
+        if error is not None:
+            results.append({"index": position, "status": "error",
+                            "status_code": error.status_code, "detail": error.detail})
+        else:
+            results.append({"index": position, "status": "ok" if applied else "rolled_back"})
+    return {"applied": applied, "results": results}
+
+# Path segments of the by-key routes and the unique column each one looks up
+LOOKUP_COLUMNS = {"user": "user", "api-key": "API key"}
+
+async def _get_row(column: str, value):
+    row = await table_service.read(csv_manager.get_row, column, value)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Row not found")
+    return json_response(dumps(row))
+
+@router.get("/csv/rows/{id}")
+async def read_csv_row(
+    id: int,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the row with the given id. Ids stay the same when other rows are
+    deleted, unlike the positions used by /csv/{row_id}.
+    """
+    return await _get_row("id", id)
+
+@router.put("/csv/rows/{id}")
+async def update_csv_row(
+    id: int,
+    data: dict,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Update the row with the given id.
+    """
+    check_row(data, partial=True)
+    await table_service.mutate("update", user_id=current_user.user_id, id=id, values=data)
+    return {"message": f"Successfully updated row {id}"}
+
+@router.delete("/csv/rows/{id}")
+async def delete_csv_row(
+    id: int,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete the row with the given id.
+    """
+    await table_service.mutate("delete", user_id=current_user.user_id, id=id)
+    return {"message": f"Successfully deleted row {id}"}
+
+@router.get("/csv/by-{lookup}/{value}")
+async def read_csv_row_by_key(
+    lookup: Literal["user", "api-key"],
+    value: str,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the row for a user (/csv/by-user/{user}) or an API key
+    (/csv/by-api-key/{key}) from the table's hash indexes.
+    """
+    return await _get_row(LOOKUP_COLUMNS[lookup], value)
+
+@router.put("/csv/by-{lookup}/{value}")
+async def update_csv_row_by_key(
+    lookup: Literal["user", "api-key"],
+    value: str,
+    data: dict,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Update the row for a user or an API key.
+    """
+    check_row(data, partial=True)
+    await table_service.mutate(
+        "update", user_id=current_user.user_id,
+        key=[LOOKUP_COLUMNS[lookup], value], values=data
+    )
+    return {"message": f"Successfully updated row for {value}"}
+
+@router.delete("/csv/by-{lookup}/{value}")
+async def delete_csv_row_by_key(
+    lookup: Literal["user", "api-key"],
+    value: str,
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Delete the row for a user or an API key.
+    """
+    await table_service.mutate(
+        "delete", user_id=current_user.user_id, key=[LOOKUP_COLUMNS[lookup], value]
+    )
+    return {"message": f"Successfully deleted row for {value}"}
+
 @router.put("/csv/{row_id}")
 async def update_csv_entry(
     row_id: int,
@@ -45,9 +368,11 @@ async def update_csv_entry(
     db: Session = Depends(get_db)
 ):
     """
-    Update CSV entry. Requires authentication.
+    Update CSV entry at position `row_id`. Requires authentication.
+    Prefer /csv/rows/{id}, which is not shifted by deletes.
     """
-    csv_manager.update_row(row_id, data)
+    check_row(data, partial=True)
+    await table_service.mutate("update", user_id=current_user.user_id, index=row_id, values=data)
     return {"message": f"Successfully updated row {row_id}"}
 
 @router.delete("/csv/{row_id}")
@@ -57,9 +382,10 @@ async def delete_csv_entry(
     db: Session = Depends(get_db)
 ):
     """
-    Delete CSV entry. Requires authentication.
+    Delete CSV entry at position `row_id`. Requires authentication.
+    Prefer /csv/rows/{id}, which is not shifted by deletes.
     """
-    csv_manager.delete_row(row_id)
+    await table_service.mutate("delete", user_id=current_user.user_id, index=row_id)
     return {"message": f"Successfully deleted row {row_id}"}
 
 @router.get("/csv/backups")
@@ -71,11 +397,49 @@ async def list_backups(
     """
     Return a list of the most recent backup file names.
     """
-    backups = csv_manager.get_previous_backups(count)
+    backups = await table_service.read(csv_manager.get_previous_backups, count)
     return {"backups": backups}
 
+def _table_version(name: str):
+    if name == "current":
+        return csv_manager.read_cached()
+    return csv_manager.read_backup(name)
+
+@router.get("/csv/diff")
+async def diff_csv(
+    from_: str = Query(..., alias="from", description="Backup name, or current"),
+    to: str = Query("current", description="Backup name, or current for the live table"),
+    summary: bool = Query(False, description="Return only the counts"),
+    limit: Optional[int] = Query(None, ge=1, description="Most rows listed per kind of change"),
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Show what changed between two versions of the table, e.g. what a
+    restore of `from` would undo: added and removed rows, and changed rows
+    with the old and new value of each changed column. Rows are matched by
+    id, or by user for backups taken before rows had ids.
+    """
+    def run_diff():
+        return dumps(diff_tables(
+            _table_version(from_), _table_version(to), summary=summary, limit=limit
+        ))
+
+    return json_response(await table_service.read(run_diff))
+
+@router.get("/csv/lock-stats")
+async def csv_lock_stats(
+    current_user: UserSession = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Return read/write lock wait times for tuning.
+    """
+    return csv_manager.lock_stats()
+
 class RestoreBackupRequest(BaseModel):
-    backup_filename: str
+    backup_filename: Optional[str] = None
+    timestamp: Optional[datetime] = None  # point in time to restore to
 
 @router.post("/csv/restore")
 async def restore_csv_backup(
@@ -84,8 +448,17 @@ async def restore_csv_backup(
     db: Session = Depends(get_db)
 ):
     """
-    Restore the main CSV file using the specified backup.
+    Restore the main CSV file using the specified backup, or to the state
+    it had at the given point in time.
     """
-    print(request);
-    csv_manager.restore_backup(request.backup_filename)
-    return {"message": f"Successfully restored backup {request.backup_filename}"}
+    if request.backup_filename:
+        await table_service.submit(
+            csv_manager.restore_backup, request.backup_filename, user_id=current_user.user_id
+        )
+        return {"message": f"Successfully restored backup {request.backup_filename}"}
+    if request.timestamp:
+        await table_service.submit(
+            csv_manager.restore_to, request.timestamp, user_id=current_user.user_id
+        )
+        return {"message": f"Successfully restored table to {request.timestamp.isoformat()}"}
+    raise HTTPException(status_code=400, detail="Provide backup_filename or timestamp")
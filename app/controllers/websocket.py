@@ -1,11 +1,17 @@
 # app/controllers/websocket.py
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status, Depends, Query
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status, Depends, Query
+from typing import Optional
 from ..database import get_db
 from ..services.auth import AuthService
+from ..services.table_json import dumps
 from ..services.websocket_manager import websocket_manager
+from .csv_operations import table_service
 from sqlalchemy.orm import Session
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.websocket("/ws/random-numbers")
 async def websocket_endpoint(
@@ -39,4 +45,47 @@ async def websocket_endpoint(
         websocket_manager.disconnect(str(user_session.user_id))
     except Exception as e:
         print(f"Error in WebSocket connection: {str(e)}")
-        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
\ No newline at end of file
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+@router.websocket("/ws/table-changes")
+async def table_changes_endpoint(
+    websocket: WebSocket,
+    token: str = Query(...),
+    since: Optional[int] = Query(None, ge=0, description="Last table version the client has"),
+    db: Session = Depends(get_db)
+):
+    """
+    Push broker table changes as they commit: one message per inserted,
+    updated or deleted row with its id, the columns written, their values
+    and the table version. After reconnecting, pass the last version seen
+    as `since` to receive what was missed; a `reset` message means the
+    table must be read again.
+    """
+    await websocket.accept()
+    try:
+        user_session = AuthService.get_session(db, token)
+    except HTTPException:
+        user_session = None
+    if not user_session:
+        logger.info("Table change stream refused: invalid token")
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    async def send_changes():
+        async for event in table_service.watch(since):
+            # Missing values as null: send_json would write them as NaN
+            await websocket.send_text(dumps(event).decode())
+
+    async def wait_for_disconnect():
+        # Clients send nothing; receiving is how a closed connection shows up
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = {asyncio.create_task(send_changes()), asyncio.create_task(wait_for_disconnect())}
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    for task in done:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Error in table change stream: {str(task.exception())}")
+    logger.info(f"Table change stream closed for user ID: {user_session.user_id}")
@@ -1,2 +1,2 @@
-from .security import create_token, verify_password, get_password_hash
+from .security import create_token, decode_token, verify_password, get_password_hash
 from .exceptions import CustomHTTPException
\ No newline at end of file
@@ -0,0 +1,157 @@
+# app/core/rwlock.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from filelock import FileLock, Timeout
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+
+class LockStats:
+    """Thread-safe counters for lock acquisitions and wait times."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            mode: {"acquired": 0, "timeouts": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for mode in ("read", "write")
+        }
+
+    def record(self, mode: str, waited: float, timed_out: bool = False):
+        with self._lock:
+            stats = self._stats[mode]
+            if timed_out:
+                stats["timeouts"] += 1
+            else:
+                stats["acquired"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def snapshot(self) -> dict:
+        """Return wait statistics in seconds, per lock mode."""
+        with self._lock:
+            result = {}
+            for mode, stats in self._stats.items():
+                attempts = stats["acquired"] + stats["timeouts"]
+                result[mode] = {
+                    **stats,
+                    "avg_wait": stats["total_wait"] / attempts if attempts else 0.0,
+                }
+            return result
+
+
+class ReadWriteFileLock:
+    """
+    Cross-process reader-writer lock built on fcntl.flock.
+
+    Readers take a shared lock on `path`, writers an exclusive one. Writers
+    first take an exclusive lock on a companion `.pending` file and hold it
+    until they are done; readers pass through that file before taking their
+    shared lock, so a waiting writer stops new readers from getting in and
+    cannot be starved.
+
+    Every acquisition opens its own descriptor, so threads of one process
+    contend with each other just like separate processes do. Nested
+    acquisitions by the thread that already holds the lock are re-entrant
+    (a read inside a write is allowed, a write inside a read is not).
+    On platforms without fcntl both modes fall back to an exclusive FileLock.
+    """
+
+    def __init__(self, path: Path, timeout: float = 10, poll_interval: float = 0.01):
+        self.path = Path(path)
+        self.pending_path = self.path.with_name(self.path.name + ".pending")
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stats = LockStats()
+        self._local = threading.local()
+        self._fallback = None if fcntl else FileLock(str(self.path), timeout=timeout)
+
+    @property
+    def _held(self):
+        return getattr(self._local, "held", None)
+
+    def _flock(self, path: Path, operation: int, deadline: float) -> int:
+        """Open `path` and flock it, polling until `deadline`."""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        delay = 0.0005
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise Timeout(str(path))
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+
+    def _acquire(self, mode: str) -> list:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        fds = []
+        try:
+            if self._fallback is not None:
+                self._fallback.acquire()
+            elif mode == "write":
+                fds.append(self._flock(self.pending_path, fcntl.LOCK_EX, deadline))
+                fds.append(self._flock(self.path, fcntl.LOCK_EX, deadline))
+            else:
+                pending = self._flock(self.pending_path, fcntl.LOCK_EX, deadline)
+                try:
+                    fds.append(self._flock(self.path, fcntl.LOCK_SH, deadline))
+                finally:
+                    os.close(pending)
+        except Timeout:
+            self._release(fds)
+            self.stats.record(mode, time.monotonic() - start, timed_out=True)
+            raise
+        except BaseException:
+            self._release(fds)
+            raise
+        self.stats.record(mode, time.monotonic() - start)
+        return fds
+
+    def _release(self, fds: list):
+        if self._fallback is not None and self._fallback.is_locked:
+            self._fallback.release()
+        # Closing the descriptor drops its flock.
+        for fd in reversed(fds):
+            os.close(fd)
+
+    @contextmanager
+    def _hold(self, mode: str):
+        held = self._held
+        if held is not None:
+            if mode == "write" and held["mode"] == "read":
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            held["depth"] += 1
+            try:
+                yield
+            finally:
+                held["depth"] -= 1
+            return
+
+        fds = self._acquire(mode)
+        self._local.held = {"mode": mode, "depth": 1}
+        try:
+            yield
+        finally:
+            self._local.held = None
+            self._release(fds)
+
+    def read(self):
+        """Context manager holding the lock in shared mode."""
+        return self._hold("read")
+
+    def write(self):
+        """Context manager holding the lock in exclusive mode."""
+        return self._hold("write")
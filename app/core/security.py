@@ -1,14 +1,17 @@
 # app/core/security.py
 from datetime import datetime, timedelta
 from typing import Union, Any
-from jose import jwt
+from uuid import uuid4
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 from ..config import get_settings
 
 settings = get_settings()
 
 # Password hashing setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 def create_token(subject: Union[str, Any], token_type: str = "access") -> tuple[str, datetime]:
     """Create a JWT token"""
@@ -21,7 +24,9 @@ def create_token(subject: Union[str, Any], token_type: str = "access") -> tuple[
     to_encode = {
         "sub": str(subject),
         "exp": expire,
-        "token_type": token_type
+        "token_type": token_type,
+        # Unique per token, so that a revoked token is never issued again
+        "jti": uuid4().hex
     }
     
     encoded_jwt = jwt.encode(
@@ -31,10 +36,23 @@ def create_token(subject: Union[str, Any], token_type: str = "access") -> tuple[
     )
     return encoded_jwt, expire
 
+def decode_token(token: str, token_type: str = "access") -> dict | None:
+    """
+    Return the claims of a token signed by us, of the given type and not
+    expired, or None. Checked locally, without looking up the session.
+    """
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if claims.get("token_type") != token_type:
+        return None
+    return claims
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
\ No newline at end of file
+def get_password_hash(password: str, rounds: int | None = None) -> str:
+    """Hash a password, with 2**rounds bcrypt iterations (BCRYPT_ROUNDS by default)"""
+    return pwd_context.hash(password, rounds=rounds or settings.BCRYPT_ROUNDS)
\ No newline at end of file
@@ -1,5 +1,5 @@
 # app/database.py
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import get_settings
@@ -11,6 +11,33 @@ engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+def _begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+def configure_sqlite(engine: Engine):
+    """
+    Let SQLAlchemy issue BEGIN itself on SQLite connections. pysqlite's own
+    transaction handling breaks SAVEPOINT (Session.begin_nested).
+    """
+    if engine.dialect.name != "sqlite" or event.contains(engine, "begin", _begin):
+        return
+    event.listen(engine, "connect", _disable_pysqlite_transactions)
+    event.listen(engine, "begin", _begin)
+    # Connections opened before the listeners were added keep pysqlite's handling
+    engine.dispose()
+
+def create_indexes(engine: Engine):
+    """
+    Create indexes declared after their table was: create_all leaves
+    existing tables, and so their indexes, as they are.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -1,14 +1,18 @@
 import asyncio
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from .config import get_settings
 from .controllers import auth, csv_operations
-from .database import Base, engine
+from .database import Base, create_indexes, engine
 from .services.number_generator import number_generator
+from .services.password_hasher import password_hasher
+from .services.session_pruner import session_pruner
 from .controllers.websocket import router as websocket_router
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+create_indexes(engine)
 
 settings = get_settings()
 
@@ -30,6 +34,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Large table responses are compressed when the client sends Accept-Encoding: gzip
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.GZIP_MIN_BYTES,
+    compresslevel=settings.GZIP_LEVEL
+)
+
 # Include routers
 app.include_router(auth.router, prefix=settings.API_V1_STR)
 app.include_router(csv_operations.router, prefix=settings.API_V1_STR)
@@ -42,11 +53,17 @@ app.include_router(websocket_router, prefix=settings.API_V1_STR)
 @app.on_event("startup")
 async def startup_event():
     number_generator.start()
+    csv_operations.table_service.start()
+    password_hasher.start()
+    session_pruner.start()
     print("Available routes:", [route.path for route in app.routes])
 
 @app.on_event("shutdown")
 async def shutdown_event():
     number_generator.stop()
+    csv_operations.table_service.stop()
+    password_hasher.stop()
+    session_pruner.stop()
 
 
 
@@ -1,4 +1,6 @@
 from .auth import AuthService
 from .csv_manager import CSVManager
+from .sql_table import SQLTableManager
+from .table_service import TableService
 from .number_generator import NumberGenerator
 from .websocket_manager import WebSocketManager
\ No newline at end of file
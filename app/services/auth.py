@@ -1,29 +1,35 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from datetime import datetime
 from fastapi import HTTPException, status
 from ..models.user import User, UserSession
-from ..core.security import get_password_hash, verify_password, create_token
+from ..core.security import get_password_hash, verify_password, create_token, decode_token
 from ..schemas.user import UserCreate, UserLogin
+from .password_hasher import password_hasher
+from .session_cache import CachedSession, session_cache
 
 class AuthService:
     @staticmethod
-    def create_user(db: Session, user_data: UserCreate) -> User:
-        """Create a new user"""
+    def create_user(
+        db: Session, user_data: UserCreate, hashed_password: str | None = None
+    ) -> User:
+        """Create a new user, hashing the password unless the hash is given"""
         if db.query(User).filter(User.username == user_data.username).first():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already registered"
             )
         
-        hashed_password = get_password_hash(user_data.password)
+        if hashed_password is None:
+            hashed_password = get_password_hash(user_data.password)
         db_user = User(
             username=user_data.username,
             hashed_password=hashed_password
         )
         
         db.add(db_user)
+        # Loaded again on first use rather than refreshed (see create_session)
         db.commit()
-        db.refresh(db_user)
         return db_user
 
     @staticmethod
@@ -39,15 +45,55 @@ class AuthService:
         
         return user
 
+    @staticmethod
+    async def register(db: Session, user_data: UserCreate) -> User:
+        """Create a new user, hashing the password in the password hasher's pool"""
+        if db.query(User).filter(User.username == user_data.username).first():
+            # Checked before hashing too, so that a taken name costs no hash
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already registered"
+            )
+        # End the read transaction before waiting: on SQLite it would hold
+        # a shared lock meanwhile, stalling other requests' commits
+        db.rollback()
+        hashed_password = await password_hasher.hash(user_data.password)
+        return AuthService.create_user(db, user_data, hashed_password=hashed_password)
+
+    @staticmethod
+    async def login_or_register(db: Session, username: str, password: str) -> User:
+        """
+        Authenticate the user, registering unknown usernames on the way:
+        a single bcrypt hash or check either way, run in the password
+        hasher's pool. A known username with the wrong password, or of an
+        inactive user, is refused as already registered.
+        """
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            return await AuthService.register(
+                db, UserCreate(username=username, password=password)
+            )
+        is_active, hashed_password = user.is_active, user.hashed_password
+        # As in register, not waiting inside a read transaction
+        db.rollback()
+        if not is_active or not await password_hasher.verify(password, hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username already registered"
+            )
+        return user
+
 
     @staticmethod
     def create_session(db: Session, user: User) -> dict:
         """Create new session for user"""
         # Deactivate all existing sessions
-        db.query(UserSession).filter(
+        active = db.query(UserSession).filter(
             UserSession.user_id == user.id,
             UserSession.is_active == True
-        ).update({"is_active": False})
+        )
+        replaced = [token for (token,) in active.with_entities(UserSession.access_token)]
+        active.update({"is_active": False})
         
         # Create new tokens
         access_token, access_exp = create_token(user.username, "access")
@@ -62,8 +108,10 @@ class AuthService:
         )
         
         db.add(session)
+        # Not refreshed: that would begin a read transaction left open
+        # until the request ends, blocking other requests' commits
         db.commit()
-        db.refresh(session)
+        session_cache.revoke(replaced)
         
         return {
             "access_token": access_token,
@@ -75,31 +123,32 @@ class AuthService:
     @staticmethod
     def refresh_session(db: Session, refresh_token: str) -> dict:
         """Create new access token using refresh token"""
-        session = (
-            db.query(UserSession)
+        # The session and its user's name in one query
+        found = (
+            db.query(UserSession, User.username)
+            .join(User)
             .filter(
                 UserSession.refresh_token == refresh_token,
                 UserSession.is_active == True
             )
-            .join(User)  # Join with User table
             .first()
         )
         
-        if not session or session.refresh_token_expires < datetime.utcnow():
+        if not found or found[0].refresh_token_expires < datetime.utcnow():
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid or expired refresh token"
             )
         
-        # Get username from the joined user relationship
-        username = db.query(User).filter(User.id == session.user_id).first().username
+        session, username = found
         access_token, access_exp = create_token(username, "access")
         
+        replaced = session.access_token
         session.access_token = access_token
         session.access_token_expires = access_exp
         
         db.commit()
-        db.refresh(session)
+        session_cache.revoke([replaced])
         
         return {
             "access_token": access_token,
@@ -109,19 +158,67 @@ class AuthService:
 
     @staticmethod
     def get_session(db: Session, token: str) -> UserSession:
-        """Get active session by token"""
-        session = db.query(UserSession).filter(
-            UserSession.access_token == token,
-            UserSession.is_active == True
-        ).first()
-        
-        if not session or session.access_token_expires < datetime.utcnow():
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid or expired access token"
+        """
+        Get active session by token. The token's signature and expiry are
+        checked first, then the session cache; the database is queried
+        only for sessions not seen recently.
+        """
+        invalid = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired access token"
+        )
+        if decode_token(token) is None or session_cache.is_revoked(token):
+            raise invalid
+
+        cached = session_cache.get(token)
+        if cached is None:
+            session = db.query(UserSession).filter(
+                UserSession.access_token == token,
+                UserSession.is_active == True
+            ).first()
+            if session and session.access_token_expires >= datetime.utcnow():
+                cached = CachedSession(
+                    id=session.id,
+                    user_id=session.user_id,
+                    access_token_expires=session.access_token_expires
+                )
+            # The request goes on to wait for other work; not inside a read
+            # transaction (see register)
+            db.rollback()
+            if cached is None:
+                raise invalid
+            session_cache.put(token, cached)
+
+        # Detached from the database, whether it was just read or cached
+        return UserSession(
+            id=cached.id,
+            user_id=cached.user_id,
+            access_token=token,
+            access_token_expires=cached.access_token_expires,
+            is_active=True
+        )
+
+    @staticmethod
+    def prune_sessions(db: Session, batch_size: int) -> int:
+        """
+        Delete up to `batch_size` sessions that are of no further use:
+        logged out or replaced, or with an expired refresh token. Returns
+        how many were deleted.
+        """
+        ids = [
+            session_id for (session_id,) in db.query(UserSession.id)
+            .filter(or_(
+                UserSession.is_active == False,
+                UserSession.refresh_token_expires < datetime.utcnow()
+            ))
+            .limit(batch_size)
+        ]
+        if ids:
+            db.query(UserSession).filter(UserSession.id.in_(ids)).delete(
+                synchronize_session=False
             )
-            
-        return session
+        db.commit()
+        return len(ids)
 
     @staticmethod
     def logout(db: Session, token: str) -> bool:
@@ -133,6 +230,7 @@ class AuthService:
         if session:
             session.is_active = False
             db.commit()
+            session_cache.revoke([token])
             return True
             
         return False
\ No newline at end of file
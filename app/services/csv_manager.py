@@ -1,13 +1,35 @@
 # app/services/csv_manager.py
 import pandas as pd
 from pathlib import Path
-from filelock import FileLock, Timeout
-from datetime import datetime
-import shutil
+from filelock import Timeout
+from datetime import datetime, timezone
 import logging
 from fastapi import HTTPException
 from ..config import get_settings
-from contextlib import contextmanager
+from ..core.rwlock import ReadWriteFileLock
+from .table_backups import BackupStore
+from .table_events import ChangeFeed, row_events
+from .table_ids import IdAllocator
+from .table_journal import TableJournal
+from .table_shared import SharedSnapshot, snapshot_path
+from .table_storage import STORAGES, TableStorage, get_storage
+from .table_rows import (
+    COLUMNS, ID_COLUMN, RowIndex, UniqueGuard,
+    apply_mutations as _apply_mutations, assign_ids, check_insert, with_ids
+)
+from .table_schema import apply_schema, read_csv
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Iterator, Optional
+import argparse
+import bisect
+import copy
+import hashlib
+import io
+import os
+import threading
+
+import numpy as np
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -15,31 +37,168 @@ logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+class TableSnapshot(io.RawIOBase):
+    """
+    Read-only view of the table file truncated to a fixed size. `ids` are
+    the row ids of a file written without them (see CSVManager.add_ids).
+    """
+
+    def __init__(self, f, size: int, storage: TableStorage, ids: Optional[np.ndarray] = None):
+        self._file = f
+        self.remaining = size
+        self.storage = storage
+        self.ids = ids
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(buffer)[:self.remaining]
+        count = self._file.readinto(view)
+        self.remaining -= count
+        return count
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    @property
+    def source(self) -> BinaryIO:
+        """
+        What the storage backend reads from. Files that are only ever
+        replaced, never appended to, are complete and can be read directly.
+        """
+        return self if self.storage.appendable else self._file
+
+    def iter_records(self, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """Yield the table as DataFrames of at most `chunk_rows` rows."""
+        chunks = self.storage.iter_chunks(self.source, chunk_rows)
+        if self.ids is None:
+            return chunks
+        return self._with_ids(chunks)
+
+    def _with_ids(self, chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        offset = 0
+        for chunk in chunks:
+            chunk.insert(0, ID_COLUMN, self.ids[offset:offset + len(chunk)])
+            offset += len(chunk)
+            yield chunk
+
+    def iter_csv(self, chunk_rows: int, chunk_bytes: int) -> Iterator[bytes]:
+        """Yield the table as CSV bytes, whatever format it is stored in."""
+        if self.ids is None:
+            return self.storage.iter_csv(self.source, chunk_rows, chunk_bytes)
+        return self._encode_csv(chunk_rows)
+
+    def _encode_csv(self, chunk_rows: int) -> Iterator[bytes]:
+        header = True
+        for chunk in self.iter_records(chunk_rows):
+            yield chunk.to_csv(index=False, header=header).encode()
+            header = False
+
+@dataclass
+class _TableCache:
+    """Parsed table together with the state it was read from."""
+    version: int
+    signature: tuple
+    frame: pd.DataFrame
+    records: Optional[list] = None
+    row_index: Optional[RowIndex] = None
+
+    def index(self) -> RowIndex:
+        if self.row_index is None:
+            self.row_index = RowIndex(self.frame)
+        return self.row_index
+
+@dataclass
+class _JournalEvents:
+    """Change events parsed from the journal file up to byte `offset`."""
+    inode: Optional[int]
+    offset: int
+    # Changes after `since` can be told, older ones were compacted away
+    since: int
+    last_seq: int
+    last_reset: int
+    events: list
+    versions: list
+
 class CSVManager:
-    def __init__(self):
-        self.file_path = Path(settings.CSV_FILE_PATH)
-        self.backup_dir = Path(settings.BACKUP_DIR)
+    def __init__(
+        self,
+        file_path: Path | None = None,
+        backup_dir: Path | None = None,
+        storage: str | None = None,
+        allocate_ids: Optional[Callable[[int], int]] = None
+    ):
+        # The table is kept in the format of the configured storage backend,
+        # next to the CSV path: backend_table.feather for Feather. An
+        # existing CSV file there is imported when the table is first created.
+        if storage is None:
+            # Under sql storage, files are plain CSV imports and exports
+            storage = settings.TABLE_STORAGE if settings.TABLE_STORAGE in STORAGES else "csv"
+        self.storage = get_storage(storage)
+        self.csv_path = Path(file_path or settings.CSV_FILE_PATH)
+        self.file_path = self.csv_path.with_suffix(self.storage.suffix)
+        self.backup_dir = Path(backup_dir or settings.BACKUP_DIR)
         self.lock_path = self.file_path.with_suffix('.lock')
-        self.lock = FileLock(str(self.lock_path), timeout=10)  # 10 seconds timeout
+        # Row ids of a table file written without them (see add_ids)
+        self.ids_path = self.file_path.with_suffix('.ids')
+        # Shared for readers, exclusive for writers, across processes
+        self.lock = ReadWriteFileLock(self.lock_path, timeout=settings.CSV_LOCK_TIMEOUT)
+        # Returns the first of `count` new row ids. Tables that share one id
+        # space (table_partitions) pass theirs; by default the table keeps
+        # its next id in a file beside it, so ids of deleted rows are never
+        # handed out again.
+        self.ids: Optional[IdAllocator] = None
+        if allocate_ids is None:
+            self.ids = IdAllocator(self.file_path.with_suffix('.next_id'))
+            allocate_ids = self._allocate_ids
+        self.allocate_ids = allocate_ids
+
+        # Bumped by every write path; together with the file signature it
+        # decides whether the cached table is still current.
+        self.version = 0
+        self._cache: Optional[_TableCache] = None
+        self._journal_events: Optional[_JournalEvents] = None
+        self._journal_events_lock = threading.Lock()
+        # Committed changes, for state kept up to date incrementally
+        self.changes = ChangeFeed()
 
         # Ensure directories exist
         self.file_path.parent.mkdir(parents=True, exist_ok=True)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
 
-        # Initialize CSV if it doesn't exist
+        # Row-level change log; backups are periodic snapshots on top of it
+        self.journal = TableJournal(self.backup_dir / "backend_table.journal")
+        self.backups = BackupStore(self.backup_dir, on_prune=self._compact_journal)
+        # Parsed table shared with the other processes serving it
+        self.shared: Optional[SharedSnapshot] = None
+        if settings.CSV_SHARED_SNAPSHOT:
+            self.shared = SharedSnapshot(
+                snapshot_path(self.file_path, settings.CSV_SHARED_SNAPSHOT_DIR)
+            )
+
+        # Initialize CSV if it doesn't exist. A table from before rows had
+        # ids is left as it is: see add_ids.
         if not self.file_path.exists():
             self._create_empty_csv()
 
     def _create_empty_csv(self):
-        """Create an empty CSV file with headers."""
-        try:
-            with self.lock:
-                if not self.file_path.exists():
-                    df = pd.DataFrame(columns=[
-                        'user', 'broker', 'API key', 'API secret', 
-                        'pnl', 'margin', 'max_risk'
-                    ])
-                    df.to_csv(self.file_path, index=False)
+        """
+        Create the table file: from the CSV file if the table is stored in
+        another format and one exists, otherwise empty with headers.
+        """
+        try:
+            with self.lock.write():
+                if self.file_path.exists():
+                    return
+                if self.csv_path != self.file_path and self.csv_path.exists():
+                    self._write_frame(with_ids(read_csv(self.csv_path)))
+                    logger.info(f"Imported {self.csv_path} into {self.file_path}")
+                else:
+                    self._write_frame(pd.DataFrame(columns=[ID_COLUMN] + COLUMNS))
                     logger.info(f"Created new CSV file at {self.file_path}")
         except Exception as e:
             logger.error(f"Failed to create CSV file: {str(e)}")
@@ -48,12 +207,189 @@ class CSVManager:
                 detail="Failed to initialize CSV file"
             )
 
+    def _file_signature(self) -> Optional[tuple]:
+        """Return (mtime, size, inode) of the CSV file, or None if it is missing."""
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _replace_file(self, write):
+        """
+        Produce the new table with `write(tmp_path)` and move it into place.
+        Readers that already opened the file keep seeing the old version.
+        """
+        tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self.file_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _write_frame(self, df: pd.DataFrame):
+        """Atomically replace the table file with `df`."""
+        self._replace_file(lambda tmp_path: self.storage.write(df, tmp_path))
+        if ID_COLUMN in df.columns:
+            self.ids_path.unlink(missing_ok=True)
+
+    def _read_frame(self) -> pd.DataFrame:
+        """Parse the table file, with its ids. Call holding the lock."""
+        df = self.storage.read(self.file_path)
+        if ID_COLUMN not in df.columns:
+            df.insert(0, ID_COLUMN, self._stored_ids(len(df)))
+        return df
+
+    def _stored_ids(self, count: int) -> np.ndarray:
+        """
+        Ids of the `count` rows of a file written without them: those in
+        the ids file, or 1..count while no row was deleted. Rows appended
+        by a process that did not keep the ids file get new ids.
+        """
+        try:
+            ids = np.loadtxt(self.ids_path, dtype=np.int64, ndmin=1)
+        except FileNotFoundError:
+            return np.arange(1, count + 1)
+        if len(ids) < count:
+            ids = self._extend_ids(count)
+        return ids[:count]
+
+    def _extend_ids(self, count: int) -> np.ndarray:
+        """Allocate and record ids for rows appended without them."""
+        with self.ids.lock.write() if self.ids is not None else nullcontext():
+            # Another process may have recorded them meanwhile
+            ids = np.loadtxt(self.ids_path, dtype=np.int64, ndmin=1)
+            if len(ids) < count:
+                self._start_ids(int(ids.max()) + 1 if len(ids) else 1)
+                first = self.allocate_ids(count - len(ids))
+                new = np.arange(first, first + count - len(ids))
+                with open(self.ids_path, 'a') as f:
+                    f.writelines(f"{row_id}\n" for row_id in new)
+                ids = np.concatenate([ids, new])
+            return ids
+
+    def _write_ids(self, ids):
+        """
+        Record the row ids of a file written without them. Call holding
+        the write lock. Ids 1..n in order, with n + 1 the next one, need no
+        ids file.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if np.array_equal(ids, np.arange(1, len(ids) + 1)) and (
+            self.ids is None or self.ids.current() in (None, len(ids) + 1)
+        ):
+            self.ids_path.unlink(missing_ok=True)
+            return
+        tmp_path = self.ids_path.with_name(self.ids_path.name + ".tmp")
+        np.savetxt(tmp_path, ids, fmt="%d")
+        os.replace(tmp_path, self.ids_path)
+
+    def _allocate_ids(self, count: int) -> int:
+        """Reserve `count` new row ids of this table and return the first."""
+        self._start_ids()
+        return self.ids.allocate(count)
+
+    def _start_ids(self, next_id: Optional[int] = None):
+        """
+        Start keeping the next id of a table that did not keep one: above
+        `next_id` (by default the one after the ids in use) and above every
+        id in the journal. Call holding the write lock, before any row goes.
+        """
+        if self.ids is None or self.ids.current() is not None:
+            return
+        if next_id is None:
+            next_id = self._cached_table().index().next_id
+        for entry in self.journal.entries():
+            for mutation in entry.get("changes", [entry]):
+                if mutation["op"] == "insert":
+                    for row in mutation["rows"]:
+                        next_id = max(next_id, (row.get(ID_COLUMN) or 0) + 1)
+        self.ids.advance(next_id)
+
+    def _advance_ids(self, df: pd.DataFrame):
+        """Keep the ids of a table that replaced this one from being handed out."""
+        if self.ids is not None and ID_COLUMN in df.columns and len(df):
+            self.ids.advance(int(df[ID_COLUMN].max()) + 1)
+
+    def _invalidate_cache(self):
+        """Mark the table as changed. Must be called while holding the lock."""
+        self.version += 1
+        self._cache = None
+
+    def state_token(self) -> tuple:
+        """
+        Identifies the current table contents: changes when this manager
+        writes and when another process replaces the file.
+        """
+        return (self.version, self._file_signature())
+
+    def etag(self) -> Optional[str]:
+        """
+        Entity tag of the table contents, the same in every process: the
+        last journal seq, which every write advances, and a stat of the file
+        for edits made without a manager. A stat alone can come back to an
+        old value (a reused inode, coarse mtimes). None while the file is
+        missing.
+        """
+        signature = self._file_signature()
+        if signature is None:
+            return None
+        self.journal.refresh()
+        return hashlib.blake2b(
+            repr((self.journal.last_seq, signature)).encode(), digest_size=8
+        ).hexdigest()
+
+    def _table_replaced(self):
+        """Tell listeners the whole table changed. Call holding the write lock."""
+        self.changes.publish(None, None, self.state_token())
+
+    def _cached_table(self) -> _TableCache:
+        """
+        Return the parsed table, re-reading the file only when it changed.
+        The cache is valid while our version is unchanged and the file still
+        has the same mtime/size/inode, so edits made by other processes are
+        picked up as well.
+        """
+        cache = self._cache
+        if (
+            cache is not None
+            and cache.version == self.version
+            and cache.signature == self._file_signature()
+        ):
+            return cache
+
+        with self.lock.read():
+            signature = self._file_signature()
+            if signature is None:
+                raise FileNotFoundError("CSV file not found")
+            cache = self._cache
+            if (
+                cache is None
+                or cache.version != self.version
+                or cache.signature != signature
+            ):
+                frame = self.shared.load(signature) if self.shared is not None else None
+                if frame is None:
+                    frame = self._read_frame()
+                    self._publish(frame, signature)
+                cache = _TableCache(version=self.version, signature=signature, frame=frame)
+                self._cache = cache
+            return cache
+
+    def _publish(self, frame: pd.DataFrame, signature: Optional[tuple]):
+        """Offer the table as of `signature` to the other processes serving it."""
+        if self.shared is not None and signature is not None:
+            self.shared.publish(frame, signature)
+
     @contextmanager
     def atomic_write(self):
         """Context manager for atomic file operations with locking."""
         try:
-            with self.lock:
+            with self.lock.write():
                 yield
+        except HTTPException:
+            raise
         except Timeout:
             logger.error("Lock acquisition timed out")
             raise HTTPException(
@@ -67,19 +403,26 @@ class CSVManager:
                 detail="Internal server error during file operation"
             )
 
-    def backup(self):
-        """Create a backup of the CSV file."""
-        try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = self.backup_dir / f"backend_table_{timestamp}.csv"
-            
-            with self.lock:
-                shutil.copy2(self.file_path, backup_path)
-                logger.info(f"Created backup at {backup_path}")
-                
-                # Clean up old backups (keep last 5)
-                self._cleanup_old_backups()
-                
+    def backup(self, user_id: Optional[int] = None, replaced: bool = False) -> str:
+        """
+        Snapshot the table into the backup directory and record the
+        snapshot in the journal, marked `replaced` when it follows a
+        replacement of the whole table. Returns the snapshot name.
+        Compression and pruning of old snapshots happen in the background.
+        """
+        try:
+            with self.lock.write():
+                self.journal.refresh()
+                # The journal seq keeps names unique and ordered
+                seq = self.journal.last_seq + 1
+                if ID_COLUMN in self._read_header():
+                    backup_name = self.backups.create(self.file_path, seq=seq)
+                else:
+                    backup_name = self._backup_with_ids(seq)
+                fields = {"replaced": True} if replaced else {}
+                self.journal.append("snapshot", user_id=user_id, file=backup_name, **fields)
+                return backup_name
+
         except Exception as e:
             logger.error(f"Backup failed: {str(e)}")
             raise HTTPException(
@@ -87,65 +430,240 @@ class CSVManager:
                 detail="Failed to create backup"
             )
 
-    def _cleanup_old_backups(self, keep_last=5):
-        """Clean up old backup files, keeping only the specified number."""
+    def _backup_with_ids(self, seq: int) -> str:
+        """Snapshot a table file written without ids, adding them."""
+        # Not named like a snapshot, so the backup store never lists it
+        pending = self.backup_dir / f".pending{self.storage.suffix}"
         try:
-            backups = sorted(
-                self.backup_dir.glob("backend_table_*.csv"),
-                key=lambda x: x.stat().st_mtime
-            )
-            for backup in backups[:-keep_last]:
-                backup.unlink()
-                logger.info(f"Deleted old backup: {backup}")
+            self.storage.write(self._cached_table().frame, pending)
+            return self.backups.create(pending, seq=seq)
+        finally:
+            pending.unlink(missing_ok=True)
+
+    def _compact_journal(self, kept: list):
+        """
+        Drop journal records that predate the oldest remaining snapshot.
+        Called by the backup store after it pruned snapshots.
+        """
+        try:
+            with self.lock.write():
+                self.journal.refresh()
+                oldest_seq = next(
+                    (entry["seq"] for entry in self.journal.entries()
+                     if entry["op"] == "snapshot" and entry["file"] in kept),
+                    None
+                )
+                if oldest_seq is not None:
+                    self.journal.compact(oldest_seq)
         except Exception as e:
-            logger.warning(f"Failed to cleanup old backups: {str(e)}")
+            logger.warning(f"Failed to compact the journal: {str(e)}")
+
+    @contextmanager
+    def _journaled(self, op: str, user_id: Optional[int] = None, **fields):
+        """
+        Record a change in the journal before it is applied to the table.
+        If applying it fails the record is marked aborted. Must be called
+        while holding the write lock.
+        """
+        self.journal.refresh()
+        if self.journal.last_snapshot_seq is None:
+            # Replays need a base state to start from
+            self.backup(user_id=user_id)
+        seq = self.journal.append(op, user_id=user_id, **fields)
+        try:
+            yield seq
+        except BaseException:
+            self.journal.append("abort", user_id=user_id, target=seq)
+            raise
+        if self.journal.changes_since_snapshot >= settings.CSV_SNAPSHOT_INTERVAL:
+            self.backup(user_id=user_id)
 
     def get_previous_backups(self, count=5) -> list:
         """
-        Return a list of the most recent backup file names.
-        The list is sorted by modification time (most recent first).
+        Return a list of the most recent backup names, most recent first.
         """
         try:
-            backups = sorted(
-                self.backup_dir.glob("backend_table_*.csv"),
-                key=lambda x: x.stat().st_mtime,
-                reverse=True
-            )
-            # Return the file names of the most recent `count` backups
-            return [backup.name for backup in backups[:count]]
+            return self.backups.names(count)
         except Exception as e:
             logger.error(f"Error retrieving backups: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to retrieve backups")
 
-    def restore_backup(self, backup_filename: str):
+    def read_backup(self, backup_filename: str) -> pd.DataFrame:
+        """
+        Return the table as it was in the specified backup. Backups taken
+        before rows had ids come without them.
+        """
+        try:
+            return self.backups.load(backup_filename)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Backup file not found")
+
+    def restore_backup(self, backup_filename: str, user_id: Optional[int] = None):
         """
-        Restore the main CSV file using the specified backup file.
+        Restore the main CSV file using the specified backup.
         """
-        backup_path = self.backup_dir / backup_filename
-        if not backup_path.exists():
+        if not self.backups.exists(backup_filename):
             logger.error(f"Backup file {backup_filename} not found")
             raise HTTPException(status_code=404, detail="Backup file not found")
         try:
             with self.atomic_write():
-                shutil.copy2(backup_path, self.file_path)
+                # Snapshots may be compressed or in another storage format
+                df = with_ids(self.backups.load(backup_filename))
+                self._start_ids()
+                self._write_frame(df)
+                self._advance_ids(df)
+                self._invalidate_cache()
+                self._table_replaced()
+                self.backup(user_id=user_id, replaced=True)
             logger.info(f"Restored backup from {backup_filename}")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error restoring backup: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to restore backup")
 
-    def read(self) -> pd.DataFrame:
-        """Read the CSV file with proper locking."""
+    def _replay(self, until: datetime) -> pd.DataFrame:
+        """
+        Rebuild the table as of `until` (UTC) from the latest snapshot taken
+        at or before that time plus the journal records that follow it.
+        """
+        entries = []
+        for entry in self.journal.entries():
+            if datetime.fromisoformat(entry["ts"]) > until:
+                break
+            entries.append(entry)
+
+        available = set(self.backups.names())
+        base = None
+        for position, entry in enumerate(entries):
+            if entry["op"] == "snapshot" and entry["file"] in available:
+                base = position
+        if base is None:
+            raise LookupError("No snapshot covers the requested time")
+
+        aborted = {entry["target"] for entry in entries if entry["op"] == "abort"}
+        df = with_ids(self.backups.load(entries[base]["file"]))
+        for entry in entries[base + 1:]:
+            if entry["seq"] in aborted:
+                continue
+            if entry["op"] in ("insert", "update", "delete"):
+                df, _ = _apply_mutations(df, [entry])
+            elif entry["op"] == "batch":
+                df, _ = _apply_mutations(df, entry["changes"])
+        return df
+
+    def state_at(self, timestamp: datetime) -> pd.DataFrame:
+        """
+        Rebuild the table as it was at `timestamp` from the snapshots and
+        the journal. Naive timestamps are taken to be UTC. Raises 404 if no
+        snapshot goes back that far. Call holding the write lock.
+        """
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        try:
+            return self._replay(timestamp)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    def restore_to(self, timestamp: datetime, user_id: Optional[int] = None):
+        """
+        Restore the main CSV file to its state at `timestamp`.
+        Naive timestamps are taken to be UTC.
+        """
         try:
-            with self.lock:
-                if not self.file_path.exists():
-                    raise FileNotFoundError("CSV file not found")
-                return pd.read_csv(self.file_path)
+            with self.atomic_write():
+                df = self.state_at(timestamp)
+                self._start_ids()
+                self._write_frame(df)
+                self._advance_ids(df)
+                self._invalidate_cache()
+                self._table_replaced()
+                self.backup(user_id=user_id, replaced=True)
+            logger.info(f"Restored table to {timestamp.isoformat()}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error restoring to point in time: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to restore backup")
+
+    def _parse_journal_events(self) -> _JournalEvents:
+        """
+        Turn the journal into change events. Only the records appended since
+        the last call are parsed; a compacted journal is a new file, and is
+        parsed from the start. Call holding the read lock and
+        _journal_events_lock.
+        """
+        try:
+            stat = os.stat(self.journal.path)
+        except FileNotFoundError:
+            stat = None
+        inode = stat.st_ino if stat else None
+        parsed = self._journal_events
+        if parsed is None or parsed.inode != inode or (stat and stat.st_size < parsed.offset):
+            parsed = _JournalEvents(
+                inode=inode, offset=0, since=0, last_seq=0, last_reset=0, events=[], versions=[]
+            )
+            self._journal_events = parsed
+        if stat is None or stat.st_size == parsed.offset:
+            return parsed
+
+        entries, offset = self.journal.read_from(parsed.offset)
+        if entries and parsed.last_seq and entries[0]["seq"] != parsed.last_seq + 1:
+            # Compacted into a file that reused the inode
+            self._journal_events = None
+            return self._parse_journal_events()
+        parsed.offset = offset
+        if entries and not parsed.last_seq:
+            parsed.since = entries[0]["seq"] - 1
+        for entry in entries:
+            parsed.last_seq = entry["seq"]
+            if entry["op"] == "abort":
+                # Drop the events of the change that was never applied
+                start = bisect.bisect_left(parsed.versions, entry["target"])
+                end = bisect.bisect_right(parsed.versions, entry["target"])
+                del parsed.events[start:end], parsed.versions[start:end]
+                continue
+            if entry["op"] == "snapshot" and entry.get("replaced"):
+                parsed.last_reset = entry["seq"]
+            events = row_events(entry["seq"], [entry])
+            parsed.events.extend(events)
+            parsed.versions.extend(event["version"] for event in events)
+        return parsed
+
+    def changes_since(self, version: Optional[int]) -> tuple[Optional[list], int]:
+        """
+        Return the row change events (see table_events.row_events) committed
+        after `version`, and the current version: the seq of the last
+        journal record. Events are None if they cannot be told because the
+        journal was compacted past `version` or the whole table was replaced
+        since; the table must then be read again. A `version` of None asks
+        for the current version only.
+        """
+        with self.lock.read(), self._journal_events_lock:
+            parsed = self._parse_journal_events()
+            if version is None:
+                return [], parsed.last_seq
+            if version < parsed.since or version > parsed.last_seq or version < parsed.last_reset:
+                return None, parsed.last_seq
+            start = bisect.bisect_right(parsed.versions, version)
+            return parsed.events[start:], parsed.last_seq
+
+    def _read_table(self) -> _TableCache:
+        """Return the cached table, translating failures into HTTP errors."""
+        try:
+            return self._cached_table()
         except FileNotFoundError:
             logger.error("CSV file not found")
             raise HTTPException(
                 status_code=404,
                 detail="CSV file not found"
             )
+        except Timeout:
+            logger.error("Read lock acquisition timed out")
+            raise HTTPException(
+                status_code=503,
+                detail="Service temporarily unavailable. Please try again."
+            )
         except Exception as e:
             logger.error(f"Error reading CSV: {str(e)}")
             raise HTTPException(
@@ -153,13 +671,83 @@ class CSVManager:
                 detail="Failed to read CSV file"
             )
 
-    def write(self, df: pd.DataFrame):
-        """Write to CSV file with proper locking and backup."""
+    def read(self) -> pd.DataFrame:
+        """Read the CSV file with proper locking."""
+        return self._read_table().frame.copy()
+
+    def open_snapshot(self) -> "TableSnapshot":
+        """
+        Open the CSV file for streaming without holding the lock while it is
+        read. Rewrites replace the file atomically and appends only add
+        bytes past the size recorded here, so the snapshot stays consistent.
+        """
+        try:
+            with self.lock.read():
+                f = open(self.file_path, 'rb')
+                ids = None
+                if ID_COLUMN not in self._read_header():
+                    ids = self._cached_table().frame[ID_COLUMN].to_numpy()
+                return TableSnapshot(f, os.fstat(f.fileno()).st_size, self.storage, ids)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="CSV file not found")
+        except Timeout:
+            raise HTTPException(
+                status_code=503,
+                detail="Service temporarily unavailable. Please try again."
+            )
+
+    def read_cached(self) -> pd.DataFrame:
+        """Return the cached frame without copying; it must not be modified."""
+        return self._read_table().frame
+
+    def read_versioned(self) -> tuple[tuple, pd.DataFrame]:
+        """Return the state token and the cached frame it belongs to."""
+        cache = self._read_table()
+        return (cache.version, cache.signature), cache.frame
+
+    def get_row(self, column: str, value) -> Optional[dict]:
+        """
+        Look up a row by `id` or a unique column (`user`, `API key`,
+        `API secret`) through the cached hash indexes.
+        """
+        cache = self._read_table()
+        position = cache.index().position(column, value)
+        if position is None:
+            return None
+        if cache.records is not None:
+            return cache.records[position]
+        return cache.frame.iloc[[position]].to_dict('records')[0]
+
+    def row_index(self) -> RowIndex:
+        """Hash indexes of the current table; they must not be modified."""
+        return self._read_table().index()
+
+    def read_records(self) -> list:
+        """
+        Return the table as a list of row dicts.
+        The list is cached alongside the parsed frame and must not be modified.
+        """
+        cache = self._read_table()
+        if cache.records is None:
+            cache.records = cache.frame.to_dict('records')
+        return cache.records
+
+    def write(self, df: pd.DataFrame, user_id: Optional[int] = None):
+        """
+        Replace the CSV file with proper locking. A full replacement is not
+        a row-level change, so it is recorded as a new snapshot.
+        """
         try:
             with self.atomic_write():
-                self.backup()  # Create backup before writing
-                df.to_csv(self.file_path, index=False)
+                self._start_ids()
+                self._write_frame(df)
+                self._advance_ids(df)
+                self._invalidate_cache()
+                self._table_replaced()
+                self.backup(user_id=user_id, replaced=True)
                 logger.info("Successfully wrote to CSV file")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error writing to CSV: {str(e)}")
             raise HTTPException(
@@ -167,61 +755,265 @@ class CSVManager:
                 detail="Failed to write to CSV file"
             )
 
-    def update_row(self, index: int, row_data: dict):
-        """Update a specific row in the CSV file."""
+    def _read_header(self) -> list:
+        """Return the column names of the table file."""
+        return self.storage.read_header(self.file_path)
+
+    def _journaled_group(self, mutations: list[dict]):
+        """Journal a group of mutations as a single record."""
+        if len(mutations) == 1:
+            fields = dict(mutations[0])
+            return self._journaled(fields.pop("op"), fields.pop("user_id", None), **fields)
+        return self._journaled("batch", changes=mutations)
+
+    def add_ids(self) -> bool:
+        """
+        Store the row ids of a table from before rows had ids in its file.
+        Until then the file keeps its layout, and ids no longer 1..n in
+        file order are kept in the ids file beside it. Returns False if the
+        file has ids already.
+        """
+        with self.atomic_write():
+            if ID_COLUMN in self._read_header():
+                return False
+            self._write_frame(self._cached_table().frame)
+            self._invalidate_cache()
+            logger.info(f"Added row ids to {self.file_path}")
+            return True
+
+    def _extend_cache(self, cache: _TableCache, new: pd.DataFrame):
+        """Add appended rows to the cached table instead of re-reading the file."""
+        if len(cache.frame):
+            frame = apply_schema(pd.concat([cache.frame, new], ignore_index=True))
+        else:
+            frame = apply_schema(new.reset_index(drop=True))
+        records = None
+        if cache.records is not None:
+            records = cache.records + new.to_dict('records')
+        row_index = cache.row_index
+        if row_index is not None:
+            offset = len(cache.frame)
+            for position, row in enumerate(new.to_dict('records')):
+                row_index.positions[row[ID_COLUMN]] = offset + position
+                for column, values in row_index.unique.items():
+                    values.setdefault(row[column], row[ID_COLUMN])
+            row_index.next_id = max(row_index.next_id, int(new[ID_COLUMN].max()) + 1)
+        self.version += 1
+        self._cache = _TableCache(
+            version=self.version,
+            signature=self._file_signature(),
+            frame=frame,
+            records=records,
+            row_index=row_index
+        )
+        self._publish(frame, self._cache.signature)
+
+    def _append_group(self, mutations: list[dict], atomic: bool = False) -> list:
+        """
+        Group commit for inserts only: append all new lines at once. Ids and
+        uniqueness come from the cached hash indexes, which are extended
+        rather than rebuilt, so existing rows are never re-read.
+        """
+        cache = self._cached_table()
+        header = self._read_header()
+        index = cache.index()
+        guard = UniqueGuard(index)
+        row_id = index.next_id
+
+        results, applied = [], []
+        for mutation in mutations:
+            try:
+                mutation["rows"] = check_insert(mutation["rows"], [ID_COLUMN, *header])
+                assign_ids(mutation["rows"], row_id)
+                for row in mutation["rows"]:
+                    guard.check(row[ID_COLUMN], row)
+                    guard.claim(row[ID_COLUMN], row)
+                row_id += len(mutation["rows"])
+                applied.append(mutation)
+                results.append(None)
+            except HTTPException as e:
+                results.append(e)
+        if not applied or (atomic and len(applied) < len(mutations)):
+            return results
+
+        rows = [row for mutation in applied for row in mutation["rows"]]
+        with self._journaled_group(applied):
+            new = self.storage.append(self.file_path, rows, header)
+            if ID_COLUMN not in header:
+                ids = [row[ID_COLUMN] for row in rows]
+                if self.ids_path.exists():
+                    with open(self.ids_path, 'a') as f:
+                        f.writelines(f"{row_id}\n" for row_id in ids)
+                elif ids != list(range(len(cache.frame) + 1, len(cache.frame) + len(ids) + 1)):
+                    self._write_ids(np.concatenate([cache.frame[ID_COLUMN].to_numpy(), ids]))
+                new.insert(0, ID_COLUMN, ids)
+            self._extend_cache(cache, new)
+        logger.info(f"Successfully appended {len(rows)} row(s)")
+        return results
+
+    def _rewrite_group(self, mutations: list[dict], atomic: bool = False) -> list:
+        """Group commit: apply mutations in order to one frame, write once."""
+        cache = self._cached_table()
+        index = cache.index()
+        df, results = _apply_mutations(
+            cache.frame.copy(), mutations, index=index, guard=UniqueGuard(index)
+        )
+        applied = [mutation for mutation, error in zip(mutations, results) if error is None]
+        if not applied or (atomic and len(applied) < len(mutations)):
+            return results
+
+        stored_ids = ID_COLUMN in self._read_header()
+        with self._journaled_group(applied):
+            if stored_ids:
+                self._write_frame(df)
+            else:
+                # Keeps the layout of a file without ids (see add_ids)
+                self._write_frame(df.drop(columns=ID_COLUMN))
+                self._write_ids(df[ID_COLUMN])
+            self._invalidate_cache()
+            self._publish(apply_schema(df), self._file_signature())
+        logger.info(f"Successfully applied {len(applied)} change(s)")
+        return results
+
+    def apply_mutations(self, mutations: list[dict], atomic: bool = False) -> list:
+        """
+        Apply a group of mutations with a single write and journal record.
+
+        Each mutation is a dict with an `op` of `insert` (`rows`), `update`
+        (`values`) or `delete`, and an optional `user_id`. Updates and
+        deletes target a row by stable `id`, by `key` ([column, value] for
+        a unique column such as `user`) or by current position (`index`).
+        They are applied in order, each one seeing the effect of the ones
+        before it. Inserted rows get new ids and, like updates, must not
+        reuse a `user`, `API key` or `API secret` (409). Inserts marked
+        `moved` hold rows moved from another table that shares this one's
+        ids (table_partitions); they keep their ids and their place in id
+        order.
+
+        Returns one entry per mutation: None if it was applied, or the
+        HTTPException that rejected it. With `atomic`, nothing is written
+        unless every mutation succeeds. The applied mutations are published
+        to `changes`.
+        """
+        if not mutations:
+            return []
         try:
             with self.atomic_write():
-                df = pd.read_csv(self.file_path)
-                if index >= len(df):
-                    raise IndexError("Row index out of bounds")
-                
-                self.backup()  # Create backup before modifying
-                for column, value in row_data.items():
-                    df.loc[index, column] = value
-                    
-                df.to_csv(self.file_path, index=False)
-                logger.info(f"Successfully updated row {index}")
-        except IndexError:
-            raise HTTPException(
-                status_code=404,
-                detail="Row not found"
-            )
+                self._start_ids()
+                for mutation in mutations:
+                    if mutation["op"] == "insert" and not mutation.get("moved"):
+                        # Ids are assigned by the table, never by the caller,
+                        # and in commit order
+                        mutation["rows"] = [
+                            {k: v for k, v in row.items() if k != ID_COLUMN}
+                            for row in mutation["rows"]
+                        ]
+                        if mutation["rows"]:
+                            assign_ids(mutation["rows"], self.allocate_ids(len(mutation["rows"])))
+                before = self.state_token()
+                if self.storage.appendable and all(
+                    mutation["op"] == "insert" and not mutation.get("moved")
+                    for mutation in mutations
+                ):
+                    # Inserts never touch existing lines
+                    results = self._append_group(mutations, atomic=atomic)
+                else:
+                    results = self._rewrite_group(mutations, atomic=atomic)
+                after = self.state_token()
+                if after != before:
+                    failed = any(error is not None for error in results)
+                    applied = [] if atomic and failed else [
+                        mutation for mutation, error in zip(mutations, results) if error is None
+                    ]
+                    self.changes.publish(applied, before, after)
+                return results
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error updating row: {str(e)}")
+            logger.error(f"Error applying changes to CSV: {str(e)}")
             raise HTTPException(
                 status_code=500,
-                detail="Failed to update row"
+                detail="Failed to write to CSV file"
             )
 
-    def delete_row(self, index: int):
+    def dry_run(self, mutations: list[dict]) -> list:
+        """
+        Return what apply_mutations would for `mutations`, without writing
+        or changing them. Only holds while the caller keeps the write lock.
+        """
+        mutations = copy.deepcopy(mutations)
+        for mutation in mutations:
+            if mutation["op"] == "insert" and not mutation.get("moved"):
+                for row in mutation["rows"]:
+                    row.pop(ID_COLUMN, None)
+        cache = self._read_table()
+        index = cache.index()
+        _, results = _apply_mutations(
+            cache.frame.copy(), mutations, index=index, guard=UniqueGuard(index)
+        )
+        return results
+
+    def _apply_one(self, mutation: dict):
+        error = self.apply_mutations([mutation])[0]
+        if error is not None:
+            raise error
+
+    def append_row(self, row_data: dict, user_id: Optional[int] = None):
+        """Append a single row to the end of the CSV file."""
+        self.append_rows([row_data], user_id=user_id)
+
+    def append_rows(self, rows: list[dict], user_id: Optional[int] = None):
+        """
+        Append rows to the end of the CSV file.
+        Only the new lines are encoded and written; existing data is neither
+        re-read nor rewritten.
+        """
+        self._apply_one({"op": "insert", "rows": rows, "user_id": user_id})
+
+    def update_row(self, index: int, row_data: dict, user_id: Optional[int] = None):
+        """Update a specific row in the CSV file."""
+        self._apply_one({"op": "update", "index": index, "values": row_data, "user_id": user_id})
+
+    def delete_row(self, index: int, user_id: Optional[int] = None):
         """Delete a specific row from the CSV file."""
+        self._apply_one({"op": "delete", "index": index, "user_id": user_id})
+
+    def import_csv(self, csv_path: Path, user_id: Optional[int] = None):
+        """Replace the table with the contents of a CSV file."""
         try:
-            with self.atomic_write():
-                df = pd.read_csv(self.file_path)
-                if index >= len(df):
-                    raise IndexError("Row index out of bounds")
-                
-                self.backup()  # Create backup before deleting
-                df = df.drop(index)
-                df = df.reset_index(drop=True)
-                df.to_csv(self.file_path, index=False)
-                logger.info(f"Successfully deleted row {index}")
-        except IndexError:
-            raise HTTPException(
-                status_code=404,
-                detail="Row not found"
-            )
-        except Exception as e:
-            logger.error(f"Error deleting row: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to delete row"
-            )
+            df = with_ids(read_csv(csv_path))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="CSV file not found")
+        self.write(df, user_id=user_id)
 
-    def __del__(self):
-        """Cleanup method to ensure lock file is removed."""
+    def export_csv(self, csv_path: Path):
+        """Write the current table to a CSV file."""
+        snapshot = self.open_snapshot()
         try:
-            if self.lock_path.exists():
-                self.lock_path.unlink()
-        except Exception as e:
-            logger.warning(f"Failed to cleanup lock file: {str(e)}")
+            with open(csv_path, 'wb') as f:
+                for chunk in snapshot.iter_csv(
+                    settings.CSV_STREAM_CHUNK_ROWS, settings.CSV_STREAM_CHUNK_BYTES
+                ):
+                    f.write(chunk)
+        finally:
+            snapshot.close()
+
+    def lock_stats(self) -> dict:
+        """Return read/write lock wait statistics for this process."""
+        return self.lock.stats.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store row ids in a table written without them")
+    parser.add_argument("csv_path", nargs="?", type=Path, default=settings.CSV_FILE_PATH)
+    args = parser.parse_args()
+    manager = CSVManager(file_path=args.csv_path)
+    if manager.add_ids():
+        print(f"Added row ids to {manager.file_path}")
+    else:
+        print(f"{manager.file_path} has row ids already")
+    manager.backups.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# app/services/password_hasher.py
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from ..config import get_settings
+from ..core.security import get_password_hash, verify_password
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+class PasswordHasher:
+    """
+    Asyncio front end for bcrypt. Each hash or check takes hundreds of
+    milliseconds of CPU, so it runs in a small process pool, off the event
+    loop and outside the GIL. At most `queue_size` calls wait or run at a
+    time; beyond that callers get 503 with Retry-After, the same as a full
+    table write queue.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: Optional[int] = None):
+        self.workers = workers or settings.PASSWORD_HASH_WORKERS
+        self.queue_size = queue_size or settings.PASSWORD_HASH_QUEUE_SIZE
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._state_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker pool if it is not running."""
+        with self._state_lock:
+            if self._pool is None:
+                # Spawned rather than forked: the server process runs threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+
+    def stop(self):
+        with self._state_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password, settings.BCRYPT_ROUNDS)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    async def _run(self, func: Callable, *args):
+        self.start()
+        with self._state_lock:
+            if self._pending >= self.queue_size:
+                logger.warning("Password hashing queue is full")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many pending logins. Please try again.",
+                    headers={"Retry-After": str(settings.CSV_RETRY_AFTER_SECONDS)}
+                )
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, func, *args)
+        finally:
+            with self._state_lock:
+                self._pending -= 1
+
+
+password_hasher = PasswordHasher()
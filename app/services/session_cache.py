@@ -0,0 +1,86 @@
+# app/services/session_cache.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from ..config import get_settings
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class CachedSession:
+    """The fields of an active user session that requests rely on."""
+    id: int
+    user_id: int
+    access_token_expires: datetime
+
+
+class SessionCache:
+    """
+    Active sessions by access token, so that most requests authenticate
+    without a database query. Bounded in size (least recently used go
+    first) and in age: a session is looked up again after `ttl` seconds,
+    which bounds how long a logout in another process goes unnoticed.
+
+    Tokens revoked in this process (logout, a new login, a refresh) are
+    remembered so that they are refused at once, and never cached again
+    by a request that read the session just before it was revoked.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._sessions: OrderedDict[str, tuple[CachedSession, float]] = OrderedDict()
+        self._revoked: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[CachedSession]:
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            session, cached_until = entry
+            if cached_until < time.monotonic() or session.access_token_expires < datetime.utcnow():
+                del self._sessions[token]
+                return None
+            self._sessions.move_to_end(token)
+            return session
+
+    def put(self, token: str, session: CachedSession):
+        if self.ttl <= 0 or self.size <= 0:
+            return
+        with self._lock:
+            if token in self._revoked:
+                return
+            self._sessions[token] = (session, time.monotonic() + self.ttl)
+            self._sessions.move_to_end(token)
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+
+    def is_revoked(self, token: str) -> bool:
+        with self._lock:
+            return token in self._revoked
+
+    def revoke(self, tokens: Iterable[str]):
+        """Forget the sessions of `tokens` and refuse them from now on."""
+        with self._lock:
+            for token in tokens:
+                self._sessions.pop(token, None)
+                self._revoked[token] = None
+                self._revoked.move_to_end(token)
+            # The oldest revoked tokens are long out of the cache; the
+            # database still refuses them
+            while len(self._revoked) > self.size:
+                self._revoked.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._revoked.clear()
+
+
+session_cache = SessionCache(settings.SESSION_CACHE_SIZE, settings.SESSION_CACHE_SECONDS)
@@ -0,0 +1,73 @@
+# app/services/session_pruner.py
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+from ..config import get_settings
+from ..database import SessionLocal
+from .auth import AuthService
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+class SessionPruner:
+    """
+    Background task deleting user sessions that are of no further use
+    (see AuthService.prune_sessions), so that the table stays the size of
+    the sessions in use. Each batch is its own short transaction, run in a
+    thread, so neither the event loop nor other writers wait for long.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.interval = settings.SESSION_PRUNE_INTERVAL_SECONDS if interval is None else interval
+        self.batch_size = batch_size or settings.SESSION_PRUNE_BATCH_SIZE
+        self.session_factory = session_factory
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._run())
+            logger.info("Session pruner started")
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+            logger.info("Session pruner stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await self.prune()
+                if deleted:
+                    logger.info(f"Pruned {deleted} user session(s)")
+            except Exception as e:
+                logger.warning(f"Session pruning failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def prune(self) -> int:
+        """Delete all sessions of no further use, a batch at a time."""
+        total = 0
+        while True:
+            deleted = await asyncio.to_thread(self._prune_batch)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+
+    def _prune_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            return AuthService.prune_sessions(db, self.batch_size)
+        finally:
+            db.close()
+
+
+session_pruner = SessionPruner()
@@ -0,0 +1,414 @@
+# app/services/sql_table.py
+import argparse
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+from fastapi import HTTPException
+from sqlalchemy import Engine, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..config import get_settings
+from ..database import configure_sqlite, engine as default_engine
+from ..models.broker_data import BrokerData
+from .table_backups import BackupStore
+from .table_events import RECENT_COMMITS, ChangeFeed, recent_events, row_events
+from .table_query import column_key
+from .table_rows import COLUMNS, ID_COLUMN, check_insert, with_ids
+from .table_schema import apply_schema, read_csv
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Table column names as in the CSV file, and the BrokerData attribute of each
+FIELDS = {column: column_key(column) for column in [ID_COLUMN] + COLUMNS}
+
+
+def _to_record(row) -> dict:
+    return {column: row[field] for column, field in FIELDS.items()}
+
+
+def _to_row(data: dict) -> dict:
+    """BrokerData values for an inserted row; missing columns are NULL."""
+    values = _to_values(data)
+    return {field: values.get(field) for field in FIELDS.values() if field != FIELDS[ID_COLUMN]}
+
+
+def _to_values(data: dict) -> dict:
+    """Map CSV column names to BrokerData columns, dropping the id."""
+    values = {}
+    for column, value in data.items():
+        if column == ID_COLUMN:
+            continue
+        if column not in FIELDS:
+            raise HTTPException(status_code=400, detail=f"Unknown columns: {column}")
+        # NaN from pandas is stored as NULL
+        values[FIELDS[column]] = None if isinstance(value, float) and value != value else value
+    return values
+
+
+class QuerySnapshot:
+    """
+    Streams the broker_data table with a single SELECT, so the rows come
+    from one consistent read while writers carry on.
+    """
+
+    def __init__(self, engine: Engine):
+        self._connection = engine.connect()
+
+    def _rows(self, chunk_rows: int):
+        stmt = select(BrokerData.__table__).order_by(BrokerData.id)
+        result = self._connection.execution_options(yield_per=chunk_rows).execute(stmt)
+        for partition in result.mappings().partitions():
+            yield partition
+
+    def iter_records(self, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """Yield the table as DataFrames of at most `chunk_rows` rows."""
+        for partition in self._rows(chunk_rows):
+            yield pd.DataFrame([_to_record(row) for row in partition], columns=list(FIELDS))
+
+    def iter_csv(self, chunk_rows: int, chunk_bytes: int) -> Iterator[bytes]:
+        """Yield the table in the format of backend_table.csv, header first."""
+        yield pd.DataFrame(columns=list(FIELDS)).to_csv(index=False).encode()
+        for chunk in self.iter_records(chunk_rows):
+            yield chunk.to_csv(index=False, header=False).encode()
+
+    def close(self):
+        self._connection.close()
+
+
+class SQLTableManager:
+    """
+    Broker table kept in the `broker_data` table through SQLAlchemy.
+
+    Offers the same operations as CSVManager, so the /csv endpoints work on
+    either. Rows are addressed by their primary key, and the unique indexes
+    on user, API key and API secret serve lookups and reject duplicates, so
+    single-row changes are indexed statements rather than file rewrites.
+    Backups are CSV exports kept by a BackupStore in the backup directory.
+    """
+
+    def __init__(
+        self,
+        engine: Engine | None = None,
+        file_path: Path | None = None,
+        backup_dir: Path | None = None
+    ):
+        self.engine = engine or default_engine
+        self.session_factory = sessionmaker(bind=self.engine, autoflush=False)
+        self.csv_path = Path(file_path or settings.CSV_FILE_PATH)
+        self.backup_dir = Path(backup_dir or settings.BACKUP_DIR)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.backups = BackupStore(self.backup_dir)
+        # Bumped by every write made through this manager
+        self.version = 0
+        self.changes = ChangeFeed()
+        # (version, change events) of recent commits, None for replacements
+        self._recent: deque = deque(maxlen=RECENT_COMMITS)
+        # Makes a commit, its version and its change event one step for readers
+        self._commit_lock = threading.Lock()
+
+        configure_sqlite(self.engine)
+        BrokerData.__table__.create(self.engine, checkfirst=True)
+        if self.engine.dialect.name == "sqlite":
+            # Let exports read while writes go on. Outside any transaction,
+            # which SQLite requires for this pragma.
+            connection = self.engine.raw_connection()
+            try:
+                connection.cursor().execute("PRAGMA journal_mode=WAL")
+            finally:
+                connection.close()
+
+    def _session(self) -> Session:
+        return self.session_factory()
+
+    def state_token(self) -> int:
+        """Identifies the table contents as far as this process has changed them."""
+        return self.version
+
+    def etag(self) -> Optional[str]:
+        """
+        Other processes commit to the database without this one knowing,
+        so there is no cheap tag of the contents: always None.
+        """
+        return None
+
+    def _committed(self, changes: Optional[list]):
+        """Bump the version and publish. Call holding the commit lock."""
+        before = self.version
+        self.version += 1
+        self._recent.append(
+            (self.version, None if changes is None else row_events(self.version, changes))
+        )
+        self.changes.publish(changes, before, self.version)
+
+    def changes_since(self, version: Optional[int]) -> tuple[Optional[list], int]:
+        """
+        Row change events committed through this manager after `version`,
+        and the current version; see CSVManager.changes_since. Only the last
+        RECENT_COMMITS commits are remembered.
+        """
+        with self._commit_lock:
+            current, recent = self.version, list(self._recent)
+        if version is None:
+            return [], current
+        return recent_events(recent, version, current), current
+
+    def _count(self, session: Session) -> int:
+        return session.scalar(select(func.count()).select_from(BrokerData))
+
+    def migrate_from_csv(self, csv_path: Path | None = None) -> int:
+        """
+        One-shot import of backend_table.csv into an empty broker_data
+        table, keeping row ids where the file has them. Returns the number
+        of rows imported.
+        """
+        csv_path = Path(csv_path or self.csv_path)
+        if not csv_path.exists():
+            raise HTTPException(status_code=404, detail="CSV file not found")
+        df = with_ids(read_csv(csv_path))
+        with self._session() as session:
+            if self._count(session):
+                raise HTTPException(status_code=409, detail="broker_data already has rows")
+            self._insert_frame(session, df)
+            with self._commit_lock:
+                session.commit()
+                self._committed(None)
+        logger.info(f"Migrated {len(df)} row(s) from {csv_path} into broker_data")
+        return len(df)
+
+    def _insert_frame(self, session: Session, df: pd.DataFrame):
+        rows = [
+            {FIELDS[ID_COLUMN]: record[ID_COLUMN], **_to_row(record)}
+            for record in df.to_dict('records')
+        ]
+        if rows:
+            session.execute(insert(BrokerData), rows)
+
+    def read_records(self) -> list:
+        """Return the table as a list of row dicts, ordered by id."""
+        try:
+            with self._session() as session:
+                rows = session.execute(
+                    select(BrokerData.__table__).order_by(BrokerData.id)
+                ).mappings()
+                return [_to_record(row) for row in rows]
+        except OperationalError as e:
+            logger.error(f"Error reading broker_data: {str(e)}")
+            raise HTTPException(
+                status_code=503,
+                detail="Service temporarily unavailable. Please try again."
+            )
+
+    def read(self) -> pd.DataFrame:
+        return apply_schema(pd.DataFrame(self.read_records(), columns=list(FIELDS)))
+
+    read_cached = read
+
+    def read_versioned(self) -> tuple[int, pd.DataFrame]:
+        """Return the state token and the table as of that token."""
+        with self._commit_lock:
+            return self.version, self.read()
+
+    def get_row(self, column: str, value) -> Optional[dict]:
+        """Look up a row by `id` or a unique column through its index."""
+        if column not in FIELDS:
+            return None
+        with self._session() as session:
+            row = session.execute(
+                select(BrokerData.__table__).where(getattr(BrokerData, FIELDS[column]) == value)
+            ).mappings().first()
+            return None if row is None else _to_record(row)
+
+    def open_snapshot(self) -> QuerySnapshot:
+        return QuerySnapshot(self.engine)
+
+    def _target_id(self, session: Session, mutation: dict) -> Optional[int]:
+        """Primary key of the row a mutation targets, or None."""
+        if "id" in mutation:
+            return session.scalar(select(BrokerData.id).where(BrokerData.id == mutation["id"]))
+        if "key" in mutation:
+            column, value = mutation["key"]
+            if column not in FIELDS:
+                return None
+            return session.scalar(
+                select(BrokerData.id).where(getattr(BrokerData, FIELDS[column]) == value)
+            )
+        if mutation["index"] < 0:
+            return None
+        return session.scalar(
+            select(BrokerData.id).order_by(BrokerData.id).offset(mutation["index"]).limit(1)
+        )
+
+    def _apply(self, session: Session, mutation: dict):
+        if mutation["op"] == "insert":
+            mutation["rows"] = check_insert(mutation["rows"], FIELDS)
+            rows = [_to_row(row) for row in mutation["rows"]]
+            ids = session.scalars(
+                insert(BrokerData).returning(BrokerData.id, sort_by_parameter_order=True), rows
+            ).all()
+            for row, row_id in zip(mutation["rows"], ids):
+                row[ID_COLUMN] = row_id
+            return
+        if mutation["op"] not in ("update", "delete"):
+            raise HTTPException(status_code=400, detail=f"Unknown operation: {mutation['op']}")
+
+        row_id = self._target_id(session, mutation)
+        if row_id is None:
+            raise HTTPException(status_code=404, detail="Row not found")
+        mutation.setdefault("id", row_id)
+        if mutation["op"] == "update":
+            values = _to_values(mutation["values"])
+            if values:
+                session.execute(update(BrokerData).where(BrokerData.id == row_id).values(values))
+        else:
+            session.execute(delete(BrokerData).where(BrokerData.id == row_id))
+
+    def apply_mutations(self, mutations: list[dict], atomic: bool = False) -> list:
+        """
+        Apply a group of mutations in one transaction; see
+        CSVManager.apply_mutations for their format. Each mutation runs in
+        its own savepoint so a rejected one leaves the others intact.
+        Returns None or the rejecting HTTPException per mutation.
+        """
+        if not mutations:
+            return []
+        results = []
+        try:
+            with self._session() as session:
+                for mutation in mutations:
+                    savepoint = session.begin_nested()
+                    try:
+                        self._apply(session, mutation)
+                        savepoint.commit()
+                        results.append(None)
+                    except HTTPException as e:
+                        savepoint.rollback()
+                        results.append(e)
+                    except IntegrityError:
+                        savepoint.rollback()
+                        results.append(HTTPException(
+                            status_code=409,
+                            detail="user, API key and API secret must be unique"
+                        ))
+                if atomic and any(error is not None for error in results):
+                    session.rollback()
+                    return results
+                with self._commit_lock:
+                    session.commit()
+                    self._committed([
+                        mutation for mutation, error in zip(mutations, results) if error is None
+                    ])
+        except OperationalError as e:
+            logger.error(f"Error writing broker_data: {str(e)}")
+            raise HTTPException(
+                status_code=503,
+                detail="Service temporarily unavailable. Please try again."
+            )
+        return results
+
+    def _apply_one(self, mutation: dict):
+        error = self.apply_mutations([mutation])[0]
+        if error is not None:
+            raise error
+
+    def append_row(self, row_data: dict, user_id: Optional[int] = None):
+        self._apply_one({"op": "insert", "rows": [row_data], "user_id": user_id})
+
+    def update_row(self, index: int, row_data: dict, user_id: Optional[int] = None):
+        self._apply_one({"op": "update", "index": index, "values": row_data, "user_id": user_id})
+
+    def delete_row(self, index: int, user_id: Optional[int] = None):
+        self._apply_one({"op": "delete", "index": index, "user_id": user_id})
+
+    def write(self, df: pd.DataFrame, user_id: Optional[int] = None):
+        """
+        Replace every row of the table with `df`, backing up the rows it
+        replaces first: there is no journal to rebuild them from.
+        """
+        self.backup(user_id=user_id)
+        try:
+            with self._session() as session:
+                session.execute(delete(BrokerData))
+                self._insert_frame(session, with_ids(df.copy()))
+                with self._commit_lock:
+                    session.commit()
+                    self._committed(None)
+        except IntegrityError:
+            raise HTTPException(
+                status_code=409,
+                detail="user, API key and API secret must be unique"
+            )
+
+    def export_csv(self, csv_path: Path):
+        """Write the table to a CSV file in the format of backend_table.csv."""
+        snapshot = self.open_snapshot()
+        try:
+            with open(csv_path, 'wb') as f:
+                for chunk in snapshot.iter_csv(
+                    settings.CSV_STREAM_CHUNK_ROWS, settings.CSV_STREAM_CHUNK_BYTES
+                ):
+                    f.write(chunk)
+        finally:
+            snapshot.close()
+
+    def import_csv(self, csv_path: Path, user_id: Optional[int] = None):
+        """Replace the table with the contents of a CSV file."""
+        try:
+            df = read_csv(csv_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="CSV file not found")
+        self.write(df, user_id=user_id)
+
+    def backup(self, user_id: Optional[int] = None) -> str:
+        """Export the table into the backup directory. Returns the backup name."""
+        tmp_path = self.backup_dir / f"export_{os.getpid()}_{threading.get_ident()}.csv"
+        try:
+            self.export_csv(tmp_path)
+            return self.backups.create(tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def get_previous_backups(self, count=5) -> list:
+        return self.backups.names(count)
+
+    def read_backup(self, backup_filename: str) -> pd.DataFrame:
+        try:
+            return self.backups.load(backup_filename)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Backup file not found")
+
+    def restore_backup(self, backup_filename: str, user_id: Optional[int] = None):
+        if not self.backups.exists(backup_filename):
+            raise HTTPException(status_code=404, detail="Backup file not found")
+        self.write(self.backups.load(backup_filename), user_id=user_id)
+        logger.info(f"Restored backup from {backup_filename}")
+
+    def restore_to(self, timestamp: datetime, user_id: Optional[int] = None):
+        raise HTTPException(
+            status_code=400,
+            detail="Point in time restore needs the CSV table journal; restore a backup instead"
+        )
+
+    def lock_stats(self) -> dict:
+        """The database does its own locking; there are no file lock waits."""
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate backend_table.csv into broker_data")
+    parser.add_argument("csv_path", nargs="?", type=Path, default=settings.CSV_FILE_PATH)
+    args = parser.parse_args()
+    count = SQLTableManager().migrate_from_csv(args.csv_path)
+    print(f"Imported {count} row(s) from {args.csv_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# app/services/table_aggregates.py
+import heapq
+import math
+import threading
+from collections import Counter
+from typing import Callable, Hashable, Optional
+
+import pandas as pd
+
+from .table_rows import ID_COLUMN
+
+
+def _user_prefix(user) -> Optional[str]:
+    """'user_4' -> 'user'; users without an underscore are their own prefix."""
+    if not isinstance(user, str):
+        return None
+    return user.rsplit("_", 1)[0]
+
+
+# Ways to group the table: the column each needs and how a value maps to a group
+GROUPINGS: dict[str, tuple[str, Callable]] = {
+    "broker": ("broker", lambda value: value),
+    "user_prefix": ("user", _user_prefix),
+}
+
+
+def _number(value) -> Optional[float]:
+    """The value as a float, or None where pd.to_numeric would give NaN."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _key(value):
+    # NaN cannot be looked up in a dict reliably; group missing keys as None
+    return None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+
+
+class GroupStats:
+    """Running totals of one group, maintained under inserts and removals."""
+
+    __slots__ = ("count", "pnl", "margin", "risk_total", "risk_count", "losing",
+                 "_risks", "_risk_heap")
+
+    def __init__(self):
+        self.count = 0
+        self.pnl = 0.0
+        self.margin = 0.0
+        self.risk_total = 0.0
+        self.risk_count = 0
+        self.losing = 0
+        # max_risk values with their multiplicity, and a max-heap over them
+        # whose stale entries are dropped when they reach the top
+        self._risks: Counter = Counter()
+        self._risk_heap: list = []
+
+    def add(self, pnl, margin, risk, sign: int = 1):
+        self.count += sign
+        if pnl is not None:
+            self.pnl += sign * pnl
+            self.losing += sign * (pnl < 0)
+        if margin is not None:
+            self.margin += sign * margin
+        if risk is not None:
+            self.risk_total += sign * risk
+            self.risk_count += sign
+            self._risks[risk] += sign
+            if sign > 0 and self._risks[risk] == 1:
+                heapq.heappush(self._risk_heap, -risk)
+
+    def remove(self, pnl, margin, risk):
+        self.add(pnl, margin, risk, sign=-1)
+
+    def max_risk(self) -> Optional[float]:
+        heap = self._risk_heap
+        while heap and self._risks[-heap[0]] <= 0:
+            self._risks.pop(-heapq.heappop(heap), None)
+        return -heap[0] if heap else None
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_pnl": self.pnl,
+            "total_margin": self.margin,
+            "max_max_risk": self.max_risk(),
+            "avg_max_risk": self.risk_total / self.risk_count if self.risk_count else None,
+            "losing_accounts": self.losing,
+        }
+
+
+class TableAggregates:
+    """
+    Per-group risk totals of the broker table for one grouping.
+
+    Built once from the table with a vectorized groupby, then kept current
+    from the manager's change feed, so a query costs O(number of groups).
+    Every state is tagged with the table state token it reflects. A change
+    that does not start from that token (the table was replaced) marks the
+    aggregates stale, and a query finding that the manager has moved on
+    (another process wrote the file) rebuilds them.
+    """
+
+    def __init__(self, group_by: str = "broker"):
+        if group_by not in GROUPINGS:
+            raise ValueError(f"Unknown grouping: {group_by}")
+        self.group_by = group_by
+        self.column, self._group_of = GROUPINGS[group_by]
+        self._lock = threading.Lock()
+        self._token: Hashable = None
+        self._groups: dict = {}
+        # Row id -> (group, pnl, margin, max_risk) as last counted
+        self._rows: dict = {}
+
+    def _contribution(self, row: dict) -> tuple:
+        return (
+            _key(self._group_of(row.get(self.column))),
+            _number(row.get("pnl")),
+            _number(row.get("margin")),
+            _number(row.get("max_risk")),
+        )
+
+    def _build(self, df: pd.DataFrame) -> tuple[dict, dict]:
+        keys = None
+        if self.column in df.columns:
+            # Plain objects: grouping a categorical would add empty groups
+            keys = df[self.column].astype(object).map(self._group_of)
+        empty = pd.Series(float("nan"), index=df.index)
+        pnl = pd.to_numeric(df.get("pnl", empty), errors="coerce")
+        margin = pd.to_numeric(df.get("margin", empty), errors="coerce")
+        risk = pd.to_numeric(df.get("max_risk", empty), errors="coerce")
+        if keys is None:
+            keys = pd.Series(None, index=df.index, dtype=object)
+
+        frame = pd.DataFrame({"key": keys, "pnl": pnl, "margin": margin, "risk": risk})
+        grouped = frame.groupby("key", dropna=False, sort=False)
+        totals = pd.DataFrame({
+            "count": grouped.size(),
+            "pnl": grouped["pnl"].sum(),
+            "margin": grouped["margin"].sum(),
+            "risk_total": grouped["risk"].sum(),
+            "risk_count": grouped["risk"].count(),
+            "losing": (frame["pnl"] < 0).groupby(frame["key"], dropna=False, sort=False).sum(),
+        })
+        groups = {}
+        for key, row in totals.iterrows():
+            stats = GroupStats()
+            stats.count = int(row["count"])
+            stats.pnl = float(row["pnl"])
+            stats.margin = float(row["margin"])
+            stats.risk_total = float(row["risk_total"])
+            stats.risk_count = int(row["risk_count"])
+            stats.losing = int(row["losing"])
+            groups[_key(key)] = stats
+        for (key, value), count in frame.groupby(["key", "risk"], dropna=False).size().items():
+            if not math.isnan(value):
+                stats = groups[_key(key)]
+                stats._risks[float(value)] = int(count)
+                stats._risk_heap.append(-float(value))
+        for stats in groups.values():
+            heapq.heapify(stats._risk_heap)
+
+        rows = dict(zip(
+            df[ID_COLUMN].tolist(),
+            zip(map(_key, keys.tolist()),
+                *(map(_number, series.tolist()) for series in (pnl, margin, risk)))
+        ))
+        return groups, rows
+
+    def _add(self, row_id, contribution: tuple):
+        key, *values = contribution
+        self._groups.setdefault(key, GroupStats()).add(*values)
+        self._rows[row_id] = contribution
+
+    def _remove(self, row_id):
+        contribution = self._rows.pop(row_id, None)
+        if contribution is None:
+            return
+        key, *values = contribution
+        stats = self._groups[key]
+        stats.remove(*values)
+        if stats.count == 0:
+            del self._groups[key]
+
+    def apply(self, changes: Optional[list], before: Hashable, after: Hashable):
+        """Change feed listener: fold committed mutations into the totals."""
+        with self._lock:
+            if self._token == after:
+                # Already rebuilt from the changed table
+                return
+            if changes is None or self._token is None or self._token != before:
+                self._token = None
+                return
+            for mutation in changes:
+                op = mutation["op"]
+                if op == "insert":
+                    for row in mutation["rows"]:
+                        self._add(row[ID_COLUMN], self._contribution(row))
+                elif op == "update":
+                    old = self._rows.get(mutation["id"])
+                    if old is None:
+                        continue
+                    key, pnl, margin, risk = old
+                    merged = {"pnl": pnl, "margin": margin, "max_risk": risk}
+                    merged.update(mutation["values"])
+                    if self.column not in mutation["values"]:
+                        contribution = (key, *self._contribution(merged)[1:])
+                    else:
+                        contribution = self._contribution(merged)
+                    self._remove(mutation["id"])
+                    self._add(mutation["id"], contribution)
+                elif op == "delete":
+                    self._remove(mutation["id"])
+            self._token = after
+
+    def result(self, manager) -> list[dict]:
+        """
+        Return one summary per group of the manager's table, rebuilding
+        first if the totals are stale.
+        """
+        with self._lock:
+            if self._token is not None and self._token == manager.state_token():
+                return self._summaries()
+        # Build without holding our lock: the writer publishes while holding
+        # the table lock, which reading the table may have to wait for.
+        token, df = manager.read_versioned()
+        groups, rows = self._build(df)
+        with self._lock:
+            # Unless a change was folded in while we built, which is newer
+            if self._token != manager.state_token():
+                self._groups, self._rows, self._token = groups, rows, token
+            return self._summaries()
+
+    def _summaries(self) -> list[dict]:
+        return [
+            {self.group_by: key, **stats.to_dict()}
+            for key, stats in sorted(self._groups.items(), key=lambda item: str(item[0]))
+        ]
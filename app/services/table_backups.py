@@ -0,0 +1,257 @@
+# app/services/table_backups.py
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+from filelock import FileLock
+
+from ..config import get_settings
+from .table_storage import storage_for_path
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# backend_table_<date>_<time>_<micros>_<seq>.<format>, optionally .gz. Older
+# backend_table_<date>_<time>.csv backups have no seq.
+_NAME_SEQ = re.compile(r"_\d{8}_\d{6}_\d{6}_(\d+)\.[a-z]+(\.gz)?$")
+_COPY_CHUNK = 1 << 20
+
+
+class BackupStore:
+    """
+    Table snapshots in the backup directory, indexed by a manifest.
+
+    A snapshot is taken as a hard link to the live table file (a copy where
+    links are not supported) plus the file size at that moment, which is
+    cheap enough to do inside the table's write lock. The CSV table only
+    ever grows by appends or is replaced by a new file, so the first `size`
+    bytes of the link stay the snapshot. A background worker then gzips CSV
+    snapshots and applies the retention policy (count, age, total size),
+    so the write path never waits on backup I/O.
+
+    `manifest.json` lists every snapshot with its unique, monotonic name,
+    sequence number, creation time, size and the file currently holding it,
+    so listing and pruning never scan the directory. Backups from before
+    snapshots had a sequence number are listed, but neither compressed nor
+    pruned.
+    """
+
+    def __init__(self, backup_dir: Path, on_prune: Optional[Callable[[list], None]] = None):
+        self.backup_dir = Path(backup_dir)
+        self.manifest_path = self.backup_dir / "manifest.json"
+        # Called with the names of the remaining snapshots after pruning
+        self.on_prune = on_prune
+        self._manifest_lock = FileLock(str(self.backup_dir / "manifest.lock"))
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+        # Finish compressing snapshots left over from a previous run
+        for entry in self._entries():
+            if self._needs_compression(entry):
+                self._enqueue(("compress", entry["name"]))
+
+    def _index_directory(self) -> list[dict]:
+        """Build the manifest for snapshots taken before there was one."""
+        entries = []
+        for path in self.backup_dir.glob("backend_table_*"):
+            if path.suffix == ".tmp":
+                continue
+            compressed = path.suffix == ".gz"
+            name = path.name[:-len(".gz")] if compressed else path.name
+            try:
+                storage_for_path(Path(name))
+            except ValueError:
+                continue
+            match = _NAME_SEQ.search(path.name)
+            stat = path.stat()
+            entries.append({
+                "name": name,
+                "file": path.name,
+                "seq": int(match.group(1)) if match else None,
+                "created": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                "size": None if compressed else stat.st_size,
+                "stored": stat.st_size,
+                "compressed": compressed,
+            })
+        return sorted(entries, key=self._order)
+
+    @staticmethod
+    def _order(entry: dict):
+        return (entry["seq"] is not None, entry["seq"] or 0, entry["created"])
+
+    def _load(self) -> list[dict]:
+        if not self.manifest_path.exists():
+            return self._index_directory()
+        with open(self.manifest_path) as f:
+            return json.load(f)["backups"]
+
+    def _save(self, entries: list[dict]):
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"backups": entries}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _entries(self) -> list[dict]:
+        with self._manifest_lock:
+            return self._load()
+
+    def _entry(self, name: str) -> Optional[dict]:
+        return next((entry for entry in self._entries() if entry["name"] == name), None)
+
+    def _needs_compression(self, entry: dict) -> bool:
+        return (
+            settings.BACKUP_COMPRESS
+            and entry["seq"] is not None
+            and not entry["compressed"]
+            and storage_for_path(Path(entry["name"])).name == "csv"
+        )
+
+    def create(self, source: Path, seq: Optional[int] = None) -> str:
+        """
+        Snapshot `source` and return the snapshot's name. The caller must
+        keep `source` from changing until this returns.
+        """
+        with self._manifest_lock:
+            entries = self._load()
+            if seq is None:
+                seq = max((entry["seq"] or 0 for entry in entries), default=0) + 1
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            name = f"backend_table_{timestamp}_{seq}{Path(source).suffix}"
+            path = self.backup_dir / name
+            try:
+                os.link(source, path)
+            except OSError:
+                shutil.copyfile(source, path)
+            size = path.stat().st_size
+            entry = {
+                "name": name,
+                "file": name,
+                "seq": seq,
+                "created": datetime.now().isoformat(),
+                "size": size,
+                "stored": size,
+                "compressed": False,
+            }
+            entries.append(entry)
+            self._save(entries)
+        logger.info(f"Created backup at {path}")
+        if self._needs_compression(entry):
+            self._enqueue(("compress", name))
+        self._enqueue(("prune",))
+        return name
+
+    def names(self, count: Optional[int] = None) -> list[str]:
+        """Snapshot names, most recent first."""
+        names = [entry["name"] for entry in reversed(self._entries())]
+        return names if count is None else names[:count]
+
+    def exists(self, name: str) -> bool:
+        return self._entry(name) is not None
+
+    def load(self, name: str) -> pd.DataFrame:
+        """Read a snapshot. Raises FileNotFoundError for unknown names."""
+        entry = self._entry(name)
+        if entry is None:
+            raise FileNotFoundError(name)
+        storage = storage_for_path(Path(name))
+        path = self.backup_dir / entry["file"]
+        if entry["compressed"]:
+            with gzip.open(path, "rb") as f:
+                return storage.read(f)
+        if entry["size"] is None or path.stat().st_size == entry["size"]:
+            return storage.read(path)
+        # A link to a table file that has since been appended to
+        with open(path, "rb") as f:
+            return storage.read(io.BytesIO(f.read(entry["size"])))
+
+    def flush(self):
+        """Wait until queued compression and pruning are done."""
+        self._queue.join()
+
+    def _enqueue(self, job: tuple):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_worker, name="table-backups", daemon=True
+                )
+                self._worker.start()
+        self._queue.put(job)
+
+    def _run_worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job[0] == "compress":
+                    self._compress(job[1])
+                else:
+                    self._prune()
+            except Exception as e:
+                logger.warning(f"Backup {job[0]} failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _compress(self, name: str):
+        entry = self._entry(name)
+        if entry is None or entry["compressed"]:
+            return
+        source = self.backup_dir / entry["file"]
+        target = self.backup_dir / f"{name}.gz"
+        tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        with open(source, "rb") as f, gzip.open(tmp_path, "wb") as out:
+            remaining = entry["size"]
+            while remaining > 0:
+                chunk = f.read(min(_COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                out.write(chunk)
+                remaining -= len(chunk)
+
+        with self._manifest_lock:
+            entries = self._load()
+            entry = next((entry for entry in entries if entry["name"] == name), None)
+            if entry is None or entry["compressed"]:
+                # Pruned, or compressed by another process meanwhile
+                tmp_path.unlink()
+                return
+            os.replace(tmp_path, target)
+            entry.update(file=target.name, compressed=True, stored=target.stat().st_size)
+            self._save(entries)
+        source.unlink(missing_ok=True)
+
+    def _prune(self):
+        """Apply the retention policy, always keeping the latest snapshot."""
+        with self._manifest_lock:
+            entries = self._load()
+            legacy = [entry for entry in entries if entry["seq"] is None]
+            entries = entries[len(legacy):]
+            keep_last = settings.CSV_SNAPSHOT_RETENTION
+            removed = entries[:-keep_last] if keep_last else []
+            kept = entries[len(removed):]
+            if settings.BACKUP_RETENTION_DAYS:
+                cutoff = datetime.now() - timedelta(days=settings.BACKUP_RETENTION_DAYS)
+                while len(kept) > 1 and datetime.fromisoformat(kept[0]["created"]) < cutoff:
+                    removed.append(kept.pop(0))
+            if settings.BACKUP_RETENTION_MB:
+                limit = settings.BACKUP_RETENTION_MB * 2**20
+                while len(kept) > 1 and sum(entry["stored"] for entry in kept) > limit:
+                    removed.append(kept.pop(0))
+            if not removed:
+                return
+            self._save(legacy + kept)
+        for entry in removed:
+            (self.backup_dir / entry["file"]).unlink(missing_ok=True)
+            logger.info(f"Deleted old backup: {entry['name']}")
+        if self.on_prune is not None:
+            self.on_prune([entry["name"] for entry in legacy + kept])
@@ -0,0 +1,114 @@
+# app/services/table_diff.py
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+from .table_schema import ID_COLUMN, STRING_DTYPE
+
+
+def _diff_key(old: pd.DataFrame, new: pd.DataFrame) -> str:
+    """Rows are matched by id, or by user for tables from before ids."""
+    for key in (ID_COLUMN, "user"):
+        if key in old.columns and key in new.columns:
+            return key
+    raise HTTPException(status_code=400, detail="Tables share no key column to compare on")
+
+
+def _keyed(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    keyed = df[df[key].notna()].set_index(key)
+    if not keyed.index.is_unique:
+        raise HTTPException(status_code=400, detail=f"Cannot diff on {key}: values are not unique")
+    return keyed
+
+
+def _comparable(series: pd.Series) -> pd.Series:
+    # Categoricals only compare when their categories match
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(STRING_DTYPE)
+    return series
+
+
+def _changed_mask(old: pd.Series, new: pd.Series) -> np.ndarray:
+    """True where the values differ; two missing values are equal."""
+    old, new = _comparable(old), _comparable(new)
+    equal = (old == new).fillna(False).to_numpy(dtype=bool)
+    both_missing = old.isna().to_numpy() & new.isna().to_numpy()
+    return ~(equal | both_missing)
+
+
+def _values(series: pd.Series, positions: np.ndarray) -> list:
+    # Missing strings come out as None, as in to_dict('records')
+    return [None if value is pd.NA else value for value in series.iloc[positions].tolist()]
+
+
+def _records(df: pd.DataFrame, key: str, limit: Optional[int]) -> list:
+    if limit is not None:
+        df = df.iloc[:limit]
+    return df.reset_index(names=key).to_dict('records')
+
+
+def diff_tables(
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    summary: bool = False,
+    limit: Optional[int] = None
+) -> dict:
+    """
+    Compare two versions of the table. Rows are matched on their key with
+    index joins and compared column by column on whole arrays, so the cost
+    in Python is proportional to the changes listed, not to the table size.
+
+    Returns counts under `summary` and, unless `summary` is set, the added
+    and removed rows and the changed rows with old and new values of each
+    changed column. `limit` caps the rows listed in each of those.
+    """
+    key = _diff_key(old, new)
+    old, new = _keyed(old, key), _keyed(new, key)
+    columns = [column for column in new.columns if column in old.columns]
+
+    added = new.index.difference(old.index, sort=False)
+    removed = old.index.difference(new.index, sort=False)
+    common = old.index.intersection(new.index, sort=False)
+    before, after = old.loc[common, columns], new.loc[common, columns]
+
+    masks = {column: _changed_mask(before[column], after[column]) for column in columns}
+    changed = np.zeros(len(common), dtype=bool)
+    for mask in masks.values():
+        changed |= mask
+
+    result = {
+        "key": key,
+        "summary": {
+            "added": len(added),
+            "removed": len(removed),
+            "changed": int(changed.sum()),
+            "unchanged": int(len(common) - changed.sum()),
+            "changed_columns": {
+                column: int(mask.sum()) for column, mask in masks.items() if mask.any()
+            },
+        },
+    }
+    if summary:
+        return result
+
+    positions = np.flatnonzero(changed)
+    if limit is not None:
+        positions = positions[:limit]
+    rows = {value: {} for value in common[positions].tolist()}
+    for column, mask in masks.items():
+        hits = positions[mask[positions]]
+        if not len(hits):
+            continue
+        for value, old_value, new_value in zip(
+            common[hits].tolist(),
+            _values(before[column], hits),
+            _values(after[column], hits)
+        ):
+            rows[value][column] = {"old": old_value, "new": new_value}
+
+    result["added"] = _records(new.loc[added], key, limit)
+    result["removed"] = _records(old.loc[removed], key, limit)
+    result["changed"] = [{key: value, "changes": changes} for value, changes in rows.items()]
+    return result
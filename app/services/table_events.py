@@ -0,0 +1,99 @@
+# app/services/table_events.py
+import logging
+import threading
+from typing import Callable, Hashable, Iterable, Optional
+
+from .table_schema import ID_COLUMN
+
+logger = logging.getLogger(__name__)
+
+# listener(changes, before, after): `changes` is the list of applied
+# mutations, annotated with the ids they touched, or None when the whole
+# table was replaced. `before` and `after` are the table's state tokens
+# around the change.
+Listener = Callable[[Optional[list], Hashable, Hashable], None]
+
+# Commits whose change events are kept for clients catching up, by managers
+# without a journal to read them back from
+RECENT_COMMITS = 1000
+
+
+class ChangeFeed:
+    """
+    Tells listeners about committed table changes. Listeners are called on
+    the writing thread while it still holds the table's write lock, so they
+    see changes one at a time and in commit order, and must return quickly.
+    """
+
+    def __init__(self):
+        self._listeners: list[Listener] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: Listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def publish(self, changes: Optional[list], before: Hashable, after: Hashable):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(changes, before, after)
+            except Exception as e:
+                # The change is already committed; a listener cannot undo it
+                logger.error(f"Table change listener failed: {str(e)}")
+
+
+def row_events(version: int, mutations: list[dict]) -> list[dict]:
+    """
+    Row-level change events for applied mutations, in journal record form:
+    one event per inserted, updated or deleted row, with the row id, the
+    columns written and their values, tagged with the table version the
+    change produced.
+    """
+    events = []
+    for mutation in mutations:
+        op = mutation["op"]
+        if op == "batch":
+            events.extend(row_events(version, mutation["changes"]))
+        elif op == "insert":
+            for row in mutation["rows"]:
+                values = {column: value for column, value in row.items() if column != ID_COLUMN}
+                events.append({
+                    "op": op, "version": version, "id": row[ID_COLUMN],
+                    "columns": list(values), "values": values,
+                })
+        elif op == "update":
+            events.append({
+                "op": op, "version": version, "id": mutation["id"],
+                "columns": list(mutation["values"]), "values": mutation["values"],
+            })
+        elif op == "delete":
+            events.append({"op": op, "version": version, "id": mutation["id"]})
+    return events
+
+
+def recent_events(recent: Iterable[tuple], version: int, current: int) -> Optional[list]:
+    """
+    Change events after `version` from (version, events) pairs of recent
+    commits, oldest first, where events are None for a replacement of the
+    whole table. None if they cannot be told: `version` is older than the
+    commits kept, newer than `current`, or the table was replaced since.
+    """
+    recent = list(recent)
+    oldest = recent[0][0] - 1 if recent else current
+    if version < oldest or version > current:
+        return None
+    events = []
+    for commit_version, commit_events in recent:
+        if commit_version <= version:
+            continue
+        if commit_events is None:
+            return None
+        events.extend(commit_events)
+    return events
@@ -0,0 +1,68 @@
+# app/services/table_ids.py
+import os
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException
+from filelock import Timeout
+
+from ..config import get_settings
+from ..core.rwlock import ReadWriteFileLock
+
+settings = get_settings()
+
+
+class IdAllocator:
+    """
+    Row ids of a table, or of the partitions of one: a file holding the
+    next free id, advanced under a cross-process lock. The next id only
+    ever grows, so the id of a deleted row is never handed out again.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = ReadWriteFileLock(
+            self.path.with_name(self.path.name + ".lock"), timeout=settings.CSV_LOCK_TIMEOUT
+        )
+
+    def _read(self) -> Optional[int]:
+        try:
+            return int(self.path.read_text())
+        except FileNotFoundError:
+            return None
+
+    def _write(self, next_id: int):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(str(next_id))
+        os.replace(tmp_path, self.path)
+
+    def current(self) -> Optional[int]:
+        """The next free id, or None if no id was ever handed out."""
+        return self._read()
+
+    def advance(self, next_id: int):
+        """Never hand out ids below `next_id` from now on."""
+        try:
+            with self.lock.write():
+                current = self._read()
+                if current is None or current < next_id:
+                    self._write(next_id)
+        except Timeout:
+            raise _busy()
+
+    def allocate(self, count: int) -> int:
+        """Reserve `count` consecutive ids and return the first."""
+        try:
+            with self.lock.write():
+                first = self._read() or 1
+                self._write(first + count)
+                return first
+        except Timeout:
+            raise _busy()
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Service temporarily unavailable. Please try again."
+    )
@@ -0,0 +1,128 @@
+# app/services/table_journal.py
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TableJournal:
+    """
+    Append-only change journal for the broker table.
+
+    Each line is a JSON record with a monotonically increasing `seq`, a UTC
+    timestamp `ts`, the `user_id` that made the change and an `op`:
+
+    - `insert` (`rows`), `update` (`index`, `values`), `delete` (`index`):
+      row level changes, written before they are applied to the table.
+    - `batch` (`changes`): a group commit, a list of the row level changes
+      above (each with its own `user_id`) applied in order.
+    - `snapshot` (`file`): the table state at this point is the snapshot
+      file of that name in the backup directory. `replaced` is set when
+      the whole table was replaced just before, e.g. by a restore.
+    - `abort` (`target`): the change with seq `target` was never applied.
+
+    Callers must hold the table's write lock while appending or compacting.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.last_seq = 0
+        self.last_snapshot_seq: Optional[int] = None
+        self._size: Optional[int] = None
+
+    def _current_size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self):
+        """Re-scan the journal if it was changed by another process."""
+        size = self._current_size()
+        if size == self._size:
+            return
+        self.last_seq = 0
+        self.last_snapshot_seq = None
+        for entry in self.entries():
+            self.last_seq = entry["seq"]
+            if entry["op"] == "snapshot":
+                self.last_snapshot_seq = entry["seq"]
+        self._size = size
+
+    def entries(self) -> Iterator[dict]:
+        """Yield journal records in order."""
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-append
+                    logger.warning(f"Skipping unreadable journal line in {self.path}")
+
+    def read_from(self, offset: int = 0) -> tuple[list, int]:
+        """
+        Return the complete records after byte `offset` and the offset just
+        past them, for readers that follow the journal as it grows.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        # A last line without its newline is still being written
+        end = data.rfind(b"\n") + 1
+        entries = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable journal line in {self.path}")
+        return entries, offset + end
+
+    @property
+    def changes_since_snapshot(self) -> int:
+        self.refresh()
+        return self.last_seq - (self.last_snapshot_seq or 0)
+
+    def append(self, op: str, user_id: Optional[int] = None, **fields) -> int:
+        """Append a record and return its sequence number."""
+        self.refresh()
+        seq = self.last_seq + 1
+        entry = {
+            "seq": seq,
+            "ts": datetime.utcnow().isoformat(),
+            "user_id": user_id,
+            "op": op,
+            **fields,
+        }
+        line = json.dumps(entry, default=str) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+        self.last_seq = seq
+        if op == "snapshot":
+            self.last_snapshot_seq = seq
+        self._size = self._current_size()
+        return seq
+
+    def compact(self, keep_from_seq: int):
+        """Drop records older than `keep_from_seq`."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            for entry in self.entries():
+                if entry["seq"] >= keep_from_seq:
+                    f.write(json.dumps(entry, default=str) + "\n")
+        os.replace(tmp_path, self.path)
+        self._size = None
+        self.refresh()
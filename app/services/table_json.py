@@ -0,0 +1,58 @@
+# app/services/table_json.py
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _plain(value):
+    """Turn arrays into lists and NaN into None, for the stdlib encoder."""
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def dumps(content) -> bytes:
+    """
+    Encode table data as JSON. Floats are written as Python writes them and
+    NaN as null, the way missing strings already are. With orjson, numpy
+    arrays are encoded from their buffers without a Python object per value.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_plain(content), separators=(",", ":"), allow_nan=False).encode()
+
+
+def ndjson(df: pd.DataFrame) -> bytes:
+    """The frame as one JSON object per line, encoded as dumps encodes rows."""
+    return b"".join(dumps(record) + b"\n" for record in df.to_dict('records'))
+
+
+def columns(df: pd.DataFrame) -> dict:
+    """The frame as {column: [values]}; numeric columns stay numpy arrays."""
+    result = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "iuf":
+            result[column] = series.to_numpy()
+        else:
+            result[column] = series.astype(object).where(series.notna(), None).tolist()
+    return result
+
+
+def json_response(body: bytes, headers: dict | None = None) -> Response:
+    """Send already encoded JSON, bypassing FastAPI's encoder."""
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,789 @@
+# app/services/table_partitions.py
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import deque
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+from fastapi import HTTPException
+from filelock import Timeout
+
+from ..config import get_settings
+from ..core.rwlock import ReadWriteFileLock
+from .csv_manager import CSVManager
+from .table_events import RECENT_COMMITS, ChangeFeed, recent_events, row_events
+from .table_ids import IdAllocator
+from .table_rows import COLUMNS, ID_COLUMN, with_ids
+from .table_schema import UNIQUE_COLUMNS, _is_missing, apply_schema, coerce_value, read_csv
+from .table_storage import STORAGES, get_storage
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Partition of the rows that have no broker
+UNASSIGNED = "_"
+# Broker values that can name a partition file
+PARTITION_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+# Lock files that unique values are spread over: a change locks only those
+# of the values it writes
+KEY_LOCK_STRIPES = 64
+
+
+def _unique_values(mutation: dict) -> list[tuple]:
+    """(column, value) of each unique column value a mutation writes."""
+    if mutation["op"] == "insert":
+        rows = mutation["rows"]
+    elif mutation["op"] == "update":
+        rows = [mutation["values"]]
+    else:
+        return []
+    return [
+        (column, coerce_value(column, row[column]))
+        for row in rows for column in UNIQUE_COLUMNS
+        if column in row and not _is_missing(row[column])
+    ]
+
+
+def _key_stripe(column: str, value) -> int:
+    """Keys lock stripe of a unique value, the same in every process."""
+    digest = hashlib.blake2b(f"{column}\0{value}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % KEY_LOCK_STRIPES
+
+
+def _created_after(partition: CSVManager, utc: datetime) -> bool:
+    """Whether the partition's journal, never compacted, starts after `utc`."""
+    first = next(iter(partition.journal.entries()), None)
+    return (
+        first is not None and first["seq"] == 1
+        and datetime.fromisoformat(first["ts"]) > utc
+    )
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Service temporarily unavailable. Please try again."
+    )
+
+
+class MergedSnapshot:
+    """
+    Streams the snapshots of all partitions as one table in id order,
+    merging their chunks as they are read.
+    """
+
+    def __init__(self, snapshots: list):
+        self.snapshots = snapshots
+
+    def iter_records(self, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """Yield the table as DataFrames of at most `chunk_rows` rows per partition."""
+        streams = [iter(snapshot.iter_records(chunk_rows)) for snapshot in self.snapshots]
+        heads: list = [None] * len(streams)
+        while True:
+            for position, stream in enumerate(streams):
+                while stream is not None and (heads[position] is None or heads[position].empty):
+                    heads[position] = next(stream, None)
+                    if heads[position] is None:
+                        streams[position] = stream = None
+            active = [head for head in heads if head is not None and not head.empty]
+            if not active:
+                return
+            # Partitions are in id order, so no later row has an id below
+            # the last one read from any of them
+            bound = min(head[ID_COLUMN].iat[-1] for head in active)
+            parts = []
+            for position, head in enumerate(heads):
+                if head is None or head.empty:
+                    continue
+                done = (head[ID_COLUMN] <= bound).to_numpy()
+                parts.append(head[done])
+                heads[position] = head[~done]
+            yield pd.concat(parts, ignore_index=True).sort_values(
+                ID_COLUMN, kind="stable", ignore_index=True
+            )
+
+    def iter_csv(self, chunk_rows: int, chunk_bytes: int) -> Iterator[bytes]:
+        """Yield the table in the format of backend_table.csv, header first."""
+        columns = [ID_COLUMN] + COLUMNS
+        yield pd.DataFrame(columns=columns).to_csv(index=False).encode()
+        for chunk in self.iter_records(chunk_rows):
+            yield chunk.reindex(columns=columns).to_csv(index=False, header=False).encode()
+
+    def close(self):
+        for snapshot in self.snapshots:
+            snapshot.close()
+
+
+@dataclass
+class _MergedTable:
+    """The partitions merged in id order, and their state tokens."""
+    token: tuple
+    frame: pd.DataFrame
+    records: Optional[list] = None
+
+
+class _Router:
+    """
+    Sends the mutations of one group to their partitions, in order. A
+    mutation that depends on the effect of earlier ones (a row they
+    inserted, a unique value they freed, positions they shifted) gets the
+    earlier ones written first, unless the group is atomic.
+    """
+
+    def __init__(self, manager: "PartitionedTableManager", mutations: list, results: list,
+                 atomic: bool):
+        self.manager = manager
+        self.mutations = mutations
+        self.results = results
+        self.atomic = atomic
+        # (position, mutation) of the mutations routed to each partition, not
+        # yet written. A move is routed as a delete and an insert.
+        self.pending: dict[str, list[tuple[int, dict]]] = {}
+        # Unique values written by routed mutations, and their partition
+        self.claimed: dict[tuple, str] = {}
+        # Ids in table order and ids deleted by routed mutations, for
+        # mutations that target a row by position
+        self.ids: Optional[list] = None
+        self.deleted: set = set()
+
+    def route_all(self):
+        for position, mutation in enumerate(self.mutations):
+            try:
+                parts = self.route(mutation)
+            except HTTPException as e:
+                self.results[position] = e
+                continue
+            for name, part in parts:
+                self.pending.setdefault(name, []).append((position, part))
+            if len(parts) > 1 and not self.atomic:
+                # Both halves of a move are written together or not at all
+                self.manager._apply_atomic(self)
+                self._written()
+
+    def flush(self) -> bool:
+        """Write the routed mutations; False if there are none or the group is atomic."""
+        if self.atomic or not self.pending:
+            return False
+        for name, parts in self.pending.items():
+            errors = self.manager.partition(name, create=True).apply_mutations(
+                [part for _, part in parts]
+            )
+            for (position, _), error in zip(parts, errors):
+                self.results[position] = error
+        self._written()
+        return True
+
+    def _written(self):
+        self.pending.clear()
+        self.claimed.clear()
+        self.ids = None
+        self.deleted.clear()
+
+    def route(self, mutation: dict) -> list[tuple[str, dict]]:
+        """The partitions a mutation is written to, and what is written there."""
+        op = mutation["op"]
+        if op == "insert":
+            name = self._insert_partition(mutation["rows"])
+        elif op in ("update", "delete"):
+            name, row_id = self._target(mutation)
+            if op == "update" and "broker" in mutation["values"]:
+                target = self.manager.partition_name(mutation["values"]["broker"])
+                if target != name:
+                    return self._move(mutation, target)
+            if op == "delete" and row_id is not None and row_id not in self.deleted:
+                # Later positions are relative to the rows it leaves
+                self.deleted.add(row_id)
+                if self.ids is not None and row_id in self.ids:
+                    self.ids.remove(row_id)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown operation: {op}")
+        self._claim(name, mutation)
+        return [(name, mutation)]
+
+    def _move(self, mutation: dict, target: str) -> list[tuple[str, dict]]:
+        """
+        Route an update that gives a row a broker of another partition as
+        a delete from its partition and an insert, with the same id, into
+        the other one.
+        """
+        # The row as the mutations before left it
+        self.flush()
+        name, row_id = self._target(mutation)
+        if row_id is None or row_id in self.deleted:
+            # Not written yet, or deleted by a mutation of the atomic group
+            raise HTTPException(status_code=404, detail="Row not found")
+        row = self.manager.partition(name).get_row(ID_COLUMN, row_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Row not found")
+        self._claim(target, mutation, moving=row_id)
+        mutation["id"] = row_id
+        user_id = mutation.get("user_id")
+        return [
+            (name, {"op": "delete", "id": row_id, "user_id": user_id}),
+            (target, {
+                "op": "insert", "rows": [{**row, **mutation["values"]}],
+                "user_id": user_id, "moved": True
+            }),
+        ]
+
+    def _insert_partition(self, rows: list[dict]) -> str:
+        if not rows:
+            raise HTTPException(status_code=400, detail="No rows to append")
+        names = {self.manager.partition_name(row.get("broker")) for row in rows}
+        if len(names) > 1:
+            raise HTTPException(
+                status_code=400,
+                detail="Rows inserted together must have the same broker"
+            )
+        return names.pop()
+
+    def _target(self, mutation: dict) -> tuple[str, Optional[int]]:
+        """Partition and, if known yet, id of the row a mutation targets."""
+        if "id" in mutation:
+            column, value = ID_COLUMN, mutation["id"]
+        elif "key" in mutation:
+            column, value = mutation["key"]
+        else:
+            return self._at_position(mutation)
+        while True:
+            owner = self.manager.owner(column, value)
+            if owner is not None:
+                return owner
+            if (column, value) in self.claimed:
+                # Written by a mutation routed before; its partition finds it
+                return self.claimed[(column, value)], None
+            if not self.flush():
+                raise HTTPException(status_code=404, detail="Row not found")
+
+    def _at_position(self, mutation: dict) -> tuple[str, int]:
+        index = mutation["index"]
+        if self.ids is None:
+            ids = self.manager.read_cached()[ID_COLUMN].tolist()
+            self.ids = [row_id for row_id in ids if row_id not in self.deleted]
+        if not 0 <= index < len(self.ids):
+            # Rows inserted by routed mutations come last
+            if self.flush():
+                return self._at_position(mutation)
+            raise HTTPException(status_code=404, detail="Row not found")
+        row_id = self.ids[index]
+        owner = self.manager.owner(ID_COLUMN, row_id)
+        if owner is None:
+            raise HTTPException(status_code=404, detail="Row not found")
+        mutation["id"] = row_id
+        return owner
+
+    def _claim(self, name: str, mutation: dict, moving: Optional[int] = None):
+        """
+        Reject unique values held in another partition (409), other than by
+        the row `moving` into partition `name`.
+        """
+        values = _unique_values(mutation)
+        for column, value in values:
+            claimant = self.claimed.get((column, value))
+            if claimant is not None and claimant != name:
+                raise HTTPException(status_code=409, detail=f"{column} '{value}' already exists")
+            while True:
+                owner = self.manager.owner(column, value, exclude=name)
+                if owner is None or owner[1] == moving:
+                    break
+                # A routed mutation there may still release the value
+                if owner[0] not in self.pending or not self.flush():
+                    raise HTTPException(
+                        status_code=409, detail=f"{column} '{value}' already exists"
+                    )
+        for column, value in values:
+            self.claimed[(column, value)] = name
+
+
+class PartitionedTableManager:
+    """
+    Broker table split into one partition per broker, for
+    CSV_PARTITION_BY_BROKER. Each partition is a CSVManager of its own
+    (backend_table.partitions/BrokerA.csv, with its lock, journal and
+    backups under BrokerA/ in the backup directory), so writes for one
+    broker neither wait for nor rewrite the rows of the others.
+
+    Offers the same operations as CSVManager. Whole-table reads merge the
+    partitions in id order; reads of one broker and row changes touch
+    only their partition. Row ids come from one counter and stay unique
+    across partitions, and so do user, API key and API secret: changes
+    that write them are checked against the other partitions holding the
+    keys locks of the values written, which no other change takes. A row
+    given another broker is moved to that broker's partition, keeping its
+    id. On first use, an existing backend_table.csv is split up.
+    """
+
+    def __init__(
+        self,
+        file_path: Path | None = None,
+        backup_dir: Path | None = None,
+        storage: str | None = None
+    ):
+        if storage is None:
+            storage = settings.TABLE_STORAGE if settings.TABLE_STORAGE in STORAGES else "csv"
+        self.storage = storage
+        self.suffix = get_storage(storage).suffix
+        self.csv_path = Path(file_path or settings.CSV_FILE_PATH)
+        self.partition_dir = self.csv_path.with_name(self.csv_path.stem + ".partitions")
+        self.backup_dir = Path(backup_dir or settings.BACKUP_DIR)
+        self.partition_dir.mkdir(parents=True, exist_ok=True)
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+
+        # Broker names have no dots, so these never clash with partition files.
+        # The keys lock is held to set the partitions up, and shared by
+        # changes that hold the stripes of the unique values they write.
+        self.keys_lock = ReadWriteFileLock(
+            self.partition_dir / "table.keys.lock", timeout=settings.CSV_LOCK_TIMEOUT
+        )
+        self.key_locks = [
+            ReadWriteFileLock(
+                self.partition_dir / f"table.keys.{stripe}.lock",
+                timeout=settings.CSV_LOCK_TIMEOUT
+            )
+            for stripe in range(KEY_LOCK_STRIPES)
+        ]
+        self.ids = IdAllocator(self.partition_dir / "table.next_id")
+        # Names of the partitions, a line added as each one is created, so
+        # that listing them takes a stat rather than a scan of the directory
+        self.registry_path = self.partition_dir / "table.partitions"
+        self._registry_size: Optional[int] = None
+        self._partitions: dict[str, CSVManager] = {}
+        self._sorted: Optional[list] = None
+        self._partitions_lock = threading.Lock()
+        self._merged: Optional[_MergedTable] = None
+
+        # Bumped by every write made through this manager
+        self.version = 0
+        self.changes = ChangeFeed()
+        # (version, change events) of recent commits, None for replacements
+        self._recent: deque = deque(maxlen=RECENT_COMMITS)
+        self._commit_lock = threading.Lock()
+
+        with self._holding_keys():
+            if not self.registry_path.exists():
+                # Partitions created before there was a registry
+                self._register([
+                    path.stem for path in self.partition_dir.glob(f"*{self.suffix}")
+                    if PARTITION_NAME.match(path.stem)
+                ])
+            if not self._all():
+                self._split_table()
+            self.ids.advance(max(
+                (partition.row_index().next_id for _, partition in self._all()), default=1
+            ))
+
+    @contextmanager
+    def _holding_keys(self, values: Optional[list[tuple]] = None):
+        """
+        Hold the keys locks of the unique (column, value) pairs `values`,
+        in stripe order so that changes cannot deadlock; without `values`,
+        all of them.
+        """
+        try:
+            with ExitStack() as stack:
+                if values is None:
+                    stack.enter_context(self.keys_lock.write())
+                else:
+                    stack.enter_context(self.keys_lock.read())
+                    for stripe in sorted({_key_stripe(*value) for value in values}):
+                        stack.enter_context(self.key_locks[stripe].write())
+                yield
+        except Timeout:
+            logger.error("Keys lock acquisition timed out")
+            raise _busy()
+
+    def _open(self, name: str) -> CSVManager:
+        return CSVManager(
+            file_path=self.partition_dir / f"{name}.csv",
+            backup_dir=self.backup_dir / name,
+            storage=self.storage,
+            allocate_ids=self.ids.allocate
+        )
+
+    def _register(self, names: list[str]):
+        with open(self.registry_path, "a") as f:
+            f.writelines(f"{name}\n" for name in names)
+
+    def _all(self) -> list[tuple[str, CSVManager]]:
+        """
+        Every partition, including ones other processes created, by name.
+        The list is re-read only when the registry has grown.
+        """
+        with self._partitions_lock:
+            try:
+                size = os.path.getsize(self.registry_path)
+            except FileNotFoundError:
+                size = 0
+            if size != self._registry_size:
+                names = self.registry_path.read_text().split() if size else []
+                for name in names:
+                    if name not in self._partitions and PARTITION_NAME.match(name):
+                        self._partitions[name] = self._open(name)
+                        self._sorted = None
+                self._registry_size = size
+            if self._sorted is None:
+                self._sorted = sorted(self._partitions.items())
+            return list(self._sorted)
+
+    def partition(self, name: str, create: bool = False) -> Optional[CSVManager]:
+        """The partition called `name`, created empty with `create`."""
+        with self._partitions_lock:
+            if name not in self._partitions:
+                exists = (self.partition_dir / f"{name}{self.suffix}").exists()
+                if exists or create:
+                    self._partitions[name] = self._open(name)
+                    self._sorted = None
+                if create and not exists:
+                    self._register([name])
+            return self._partitions.get(name)
+
+    def partition_name(self, broker) -> str:
+        """Name of the partition holding rows of `broker`; 400 if it cannot name a file."""
+        if _is_missing(broker):
+            return UNASSIGNED
+        name = str(broker)
+        if name == UNASSIGNED or not PARTITION_NAME.match(name):
+            raise HTTPException(
+                status_code=400,
+                detail=f"broker '{name}' may only contain letters, digits, - and _"
+            )
+        return name
+
+    def _partition_names(self, df: pd.DataFrame) -> pd.Series:
+        if "broker" not in df.columns:
+            return pd.Series(UNASSIGNED, index=df.index)
+        brokers = df["broker"].astype(object)
+        names = {broker: self.partition_name(broker) for broker in brokers.dropna().unique()}
+        return brokers.map(names).fillna(UNASSIGNED)
+
+    def _split_table(self):
+        """Split an unpartitioned table at the configured path, if there is one."""
+        if not (self.csv_path.with_suffix(self.suffix).exists() or self.csv_path.exists()):
+            return
+        df = CSVManager(self.csv_path, self.backup_dir, self.storage).read()
+        groups = df.groupby(self._partition_names(df), sort=True)
+        for name, rows in groups:
+            self.partition(name, create=True).write(rows.reset_index(drop=True))
+        logger.info(f"Split {self.csv_path} into {groups.ngroups} partition(s)")
+
+    def owner(self, column: str, value, exclude: Optional[str] = None) -> Optional[tuple]:
+        """(partition, id) of the row with `value` in `column` (id or a unique column)."""
+        for name, partition in self._all():
+            if name == exclude:
+                continue
+            index = partition.row_index()
+            if column == ID_COLUMN:
+                if value in index.positions:
+                    return name, value
+                continue
+            row_id = index.unique.get(column, {}).get(value)
+            if row_id is not None:
+                return name, row_id
+        return None
+
+    def state_token(self) -> tuple:
+        """Identifies the contents of every partition; see CSVManager.state_token."""
+        return tuple((name, partition.state_token()) for name, partition in self._all())
+
+    def etag(self) -> Optional[str]:
+        """Entity tag of the whole table, from the tags of the partitions."""
+        tags = [(name, partition.etag()) for name, partition in self._all()]
+        return hashlib.blake2b(repr(tags).encode(), digest_size=8).hexdigest()
+
+    def _committed(self, changes: Optional[list], before: tuple, after: tuple):
+        with self._commit_lock:
+            self.version += 1
+            self._recent.append(
+                (self.version, None if changes is None else row_events(self.version, changes))
+            )
+            self.changes.publish(changes, before, after)
+
+    def changes_since(self, version: Optional[int]) -> tuple[Optional[list], int]:
+        """
+        Row change events committed through this manager after `version`,
+        and the current version; see CSVManager.changes_since. Partitions
+        keep separate journals, so like SQLTableManager only the last
+        RECENT_COMMITS commits of this process are told.
+        """
+        with self._commit_lock:
+            current, recent = self.version, list(self._recent)
+        if version is None:
+            return [], current
+        return recent_events(recent, version, current), current
+
+    def _merged_table(self) -> _MergedTable:
+        """The partitions merged in id order, merged again only when one changed."""
+        versions = [(name, *partition.read_versioned()) for name, partition in self._all()]
+        token = tuple((name, partition_token) for name, partition_token, _ in versions)
+        merged = self._merged
+        if merged is not None and merged.token == token:
+            return merged
+        frames = [frame for _, _, frame in versions if len(frame)]
+        if frames:
+            frame = pd.concat(frames, ignore_index=True)
+            frame = frame.sort_values(ID_COLUMN, kind="stable", ignore_index=True)
+        else:
+            frame = pd.DataFrame(columns=[ID_COLUMN] + COLUMNS)
+        merged = _MergedTable(token=token, frame=apply_schema(frame))
+        self._merged = merged
+        return merged
+
+    def read(self) -> pd.DataFrame:
+        return self._merged_table().frame.copy()
+
+    def read_cached(self, broker: Optional[str] = None) -> pd.DataFrame:
+        """
+        Return the cached frame without copying; it must not be modified.
+        With `broker`, only that broker's partition is read.
+        """
+        if broker is None:
+            return self._merged_table().frame
+        try:
+            partition = self.partition(self.partition_name(broker))
+        except HTTPException:
+            partition = None
+        if partition is None:
+            return self._merged_table().frame.iloc[0:0]
+        return partition.read_cached()
+
+    def read_versioned(self) -> tuple[tuple, pd.DataFrame]:
+        """Return the state token and the merged frame it belongs to."""
+        merged = self._merged_table()
+        return merged.token, merged.frame
+
+    def read_records(self) -> list:
+        """Return the table as a list of row dicts, cached with the merged frame."""
+        merged = self._merged_table()
+        if merged.records is None:
+            merged.records = merged.frame.to_dict('records')
+        return merged.records
+
+    def get_row(self, column: str, value) -> Optional[dict]:
+        """Look up a row by `id` or a unique column in each partition's hash indexes."""
+        for _, partition in self._all():
+            row = partition.get_row(column, value)
+            if row is not None:
+                return row
+        return None
+
+    def open_snapshot(self) -> MergedSnapshot:
+        snapshots = []
+        try:
+            for _, partition in self._all():
+                snapshots.append(partition.open_snapshot())
+        except BaseException:
+            MergedSnapshot(snapshots).close()
+            raise
+        return MergedSnapshot(snapshots)
+
+    def apply_mutations(self, mutations: list[dict], atomic: bool = False) -> list:
+        """
+        Apply a group of mutations (see CSVManager.apply_mutations) in the
+        partitions of the rows they insert or target, with one write and
+        journal record per partition. Returns None or the rejecting
+        HTTPException per mutation.
+
+        With `atomic`, rows are found as they were before the group, and a
+        group that spans partitions holds all of their write locks, checks
+        every part and writes nothing unless all of them succeed.
+        """
+        if not mutations:
+            return []
+        results: list = [None] * len(mutations)
+        # Only writes of unique values need other changes of those values
+        # to hold still; a moved row's own values stay with it
+        claims = [value for mutation in mutations for value in _unique_values(mutation)]
+        with self._holding_keys(claims) if claims else nullcontext():
+            before = self.state_token()
+            router = _Router(self, mutations, results, atomic)
+            router.route_all()
+            if not atomic:
+                router.flush()
+            elif not any(error is not None for error in results):
+                self._apply_atomic(router)
+            after = self.state_token()
+        if after != before:
+            failed = any(error is not None for error in results)
+            applied = [] if atomic and failed else [
+                mutation for mutation, error in zip(mutations, results) if error is None
+            ]
+            self._committed(applied, before, after)
+        return results
+
+    def writer_lane(self, mutation: dict) -> Optional[str]:
+        """
+        Partition a mutation is written to, for TableService to give each
+        partition its own writer; None if that takes a read of the whole
+        table (rows targeted by position). Only a hint: apply_mutations
+        finds the partitions again.
+        """
+        try:
+            if mutation["op"] == "insert":
+                names = {self.partition_name(row.get("broker")) for row in mutation["rows"]}
+                return names.pop() if len(names) == 1 else None
+            if "id" in mutation:
+                owner = self.owner(ID_COLUMN, mutation["id"])
+            elif "key" in mutation:
+                owner = self.owner(*mutation["key"])
+            else:
+                return None
+        except HTTPException:
+            return None
+        return None if owner is None else owner[0]
+
+    def _apply_atomic(self, router: _Router):
+        groups = {
+            name: ([position for position, _ in parts], [part for _, part in parts])
+            for name, parts in sorted(router.pending.items())
+        }
+        with ExitStack() as stack:
+            if len(groups) > 1:
+                # In name order, so that atomic groups cannot deadlock
+                for name in groups:
+                    stack.enter_context(self.partition(name, create=True).atomic_write())
+                for name, (positions, group) in groups.items():
+                    for position, error in zip(positions, self.partition(name).dry_run(group)):
+                        router.results[position] = router.results[position] or error
+                if any(
+                    router.results[position] is not None
+                    for positions, _ in groups.values() for position in positions
+                ):
+                    return
+            for name, (positions, group) in groups.items():
+                errors = self.partition(name, create=True).apply_mutations(group, atomic=True)
+                for position, error in zip(positions, errors):
+                    router.results[position] = router.results[position] or error
+
+    def _apply_one(self, mutation: dict):
+        error = self.apply_mutations([mutation])[0]
+        if error is not None:
+            raise error
+
+    def append_row(self, row_data: dict, user_id: Optional[int] = None):
+        self._apply_one({"op": "insert", "rows": [row_data], "user_id": user_id})
+
+    def append_rows(self, rows: list[dict], user_id: Optional[int] = None):
+        """Append rows of one broker to its partition."""
+        self._apply_one({"op": "insert", "rows": rows, "user_id": user_id})
+
+    def update_row(self, index: int, row_data: dict, user_id: Optional[int] = None):
+        self._apply_one({"op": "update", "index": index, "values": row_data, "user_id": user_id})
+
+    def delete_row(self, index: int, user_id: Optional[int] = None):
+        self._apply_one({"op": "delete", "index": index, "user_id": user_id})
+
+    def write(self, df: pd.DataFrame, user_id: Optional[int] = None):
+        """
+        Replace the table with `df`, one partition after the other; each
+        partition records the replacement as a new snapshot.
+        """
+        df = with_ids(df.copy())
+        names = self._partition_names(df)
+        before = self.state_token()
+        existing = {name for name, _ in self._all()}
+        for name in sorted(existing | set(names.unique())):
+            rows = df[(names == name).to_numpy()].reset_index(drop=True)
+            self.partition(name, create=True).write(rows, user_id=user_id)
+        if len(df):
+            self.ids.advance(int(df[ID_COLUMN].max()) + 1)
+        self._committed(None, before, self.state_token())
+
+    def import_csv(self, csv_path: Path, user_id: Optional[int] = None):
+        """Replace the table with the contents of a CSV file."""
+        try:
+            df = read_csv(csv_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="CSV file not found")
+        self.write(df, user_id=user_id)
+
+    def export_csv(self, csv_path: Path):
+        """Write the table to a CSV file in the format of backend_table.csv."""
+        snapshot = self.open_snapshot()
+        try:
+            with open(csv_path, 'wb') as f:
+                for chunk in snapshot.iter_csv(
+                    settings.CSV_STREAM_CHUNK_ROWS, settings.CSV_STREAM_CHUNK_BYTES
+                ):
+                    f.write(chunk)
+        finally:
+            snapshot.close()
+
+    def backup(self, user_id: Optional[int] = None) -> list:
+        """Snapshot every partition. Returns the backup names."""
+        return [
+            f"{name}/{partition.backup(user_id=user_id)}" for name, partition in self._all()
+        ]
+
+    def get_previous_backups(self, count=5) -> list:
+        """
+        The most recent backups of all partitions, most recent first, named
+        <partition>/<snapshot>.
+        """
+        names = [
+            f"{name}/{backup}"
+            for name, partition in self._all()
+            for backup in partition.get_previous_backups(count)
+        ]
+        # Snapshot names start with their time
+        return sorted(names, key=lambda name: name.split("/", 1)[1], reverse=True)[:count]
+
+    def _backup_partition(self, backup_name: str) -> tuple[CSVManager, str]:
+        name, _, backup = backup_name.partition("/")
+        partition = self.partition(name) if backup and PARTITION_NAME.match(name) else None
+        if partition is None:
+            raise HTTPException(status_code=404, detail="Backup file not found")
+        return partition, backup
+
+    def read_backup(self, backup_filename: str) -> pd.DataFrame:
+        """Return a partition as it was in the specified backup."""
+        partition, backup = self._backup_partition(backup_filename)
+        return partition.read_backup(backup)
+
+    def restore_backup(self, backup_filename: str, user_id: Optional[int] = None):
+        """Restore the partition the backup was taken of; the others are left as they are."""
+        partition, backup = self._backup_partition(backup_filename)
+        before = self.state_token()
+        partition.restore_backup(backup, user_id=user_id)
+        self._committed(None, before, self.state_token())
+
+    def restore_to(self, timestamp: datetime, user_id: Optional[int] = None):
+        """
+        Restore every partition to its state at `timestamp`, holding all of
+        their write locks. Partitions created since are emptied; 404 if
+        there were none yet.
+        """
+        utc = timestamp
+        if utc.tzinfo is not None:
+            utc = utc.astimezone(timezone.utc).replace(tzinfo=None)
+        partitions = self._all()
+        with ExitStack() as stack:
+            for _, partition in partitions:
+                stack.enter_context(partition.atomic_write())
+            before = self.state_token()
+            frames, created = {}, []
+            for name, partition in partitions:
+                try:
+                    frames[name] = partition.state_at(timestamp)
+                except HTTPException as e:
+                    if e.status_code != 404 or not _created_after(partition, utc):
+                        raise
+                    created.append(name)
+                    frames[name] = partition.read_cached().iloc[0:0]
+            if len(created) == len(partitions):
+                raise HTTPException(status_code=404, detail="No snapshot covers the requested time")
+            for name, partition in partitions:
+                partition.write(frames[name], user_id=user_id)
+            after = self.state_token()
+        self._committed(None, before, after)
+
+    def lock_stats(self) -> dict:
+        """Read/write lock wait statistics of each partition, in this process."""
+        return {name: partition.lock_stats() for name, partition in self._all()}
@@ -0,0 +1,106 @@
+# app/services/table_query.py
+from typing import Optional
+
+import pandas as pd
+from fastapi import HTTPException
+
+# Comparison suffixes accepted on filter parameters, e.g. pnl_lt=0
+OPERATORS = {
+    "eq": lambda column, value: column == value,
+    "ne": lambda column, value: column != value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(value),
+}
+
+
+def column_key(column: str) -> str:
+    """Query parameter name for a column, e.g. 'API key' -> 'api_key'."""
+    return column.lower().replace(" ", "_")
+
+
+def _resolve_column(df: pd.DataFrame, name: str) -> Optional[str]:
+    if name in df.columns:
+        return name
+    return {column_key(column): column for column in df.columns}.get(name)
+
+
+def _coerce(series: pd.Series, raw: str, name: str):
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            return float(raw)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Filter {name} expects a number")
+    return raw
+
+
+def parse_filters(df: pd.DataFrame, params: dict) -> list[tuple[str, str, object]]:
+    """
+    Turn query parameters into (column, operator, value) filters.
+    `broker=BrokerA` is an equality filter, `pnl_lt=0` a comparison and
+    `broker_in=BrokerA,BrokerB` a membership test.
+    """
+    filters = []
+    for name, raw in params.items():
+        column, op = _resolve_column(df, name), "eq"
+        if column is None and "_" in name:
+            base, suffix = name.rsplit("_", 1)
+            if suffix in OPERATORS:
+                column, op = _resolve_column(df, base), suffix
+        if column is None:
+            raise HTTPException(status_code=400, detail=f"Unknown filter: {name}")
+        if op == "in":
+            value = [_coerce(df[column], item, name) for item in raw.split(",")]
+        else:
+            value = _coerce(df[column], raw, name)
+        filters.append((column, op, value))
+    return filters
+
+
+def query_table(
+    df: pd.DataFrame,
+    filters: Optional[dict] = None,
+    fields: Optional[str] = None,
+    sort: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None
+) -> tuple[pd.DataFrame, int]:
+    """
+    Filter, sort, paginate and project the table with vectorized masks.
+    `df` is not modified. Returns the page and the number of matching rows.
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in parse_filters(df, filters or {}):
+        try:
+            # Nullable columns compare missing values as NA: not a match
+            mask &= OPERATORS[op](df[column], value).fillna(False).astype(bool)
+        except TypeError:
+            raise HTTPException(status_code=400, detail=f"Cannot compare {column} with {value!r}")
+    result = df[mask] if not mask.all() else df
+    total = len(result)
+
+    if sort:
+        columns, ascending = [], []
+        for item in sort.split(","):
+            name = item.strip().lstrip("-")
+            column = _resolve_column(df, name)
+            if column is None:
+                raise HTTPException(status_code=400, detail=f"Unknown sort column: {name}")
+            columns.append(column)
+            ascending.append(not item.strip().startswith("-"))
+        result = result.sort_values(columns, ascending=ascending, kind="stable")
+
+    end = None if limit is None else offset + limit
+    result = result.iloc[offset:end]
+
+    if fields:
+        columns = []
+        for name in fields.split(","):
+            column = _resolve_column(df, name.strip())
+            if column is None:
+                raise HTTPException(status_code=400, detail=f"Unknown field: {name.strip()}")
+            columns.append(column)
+        result = result[columns]
+    return result, total
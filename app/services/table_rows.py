@@ -0,0 +1,283 @@
+# app/services/table_rows.py
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+from .table_schema import (
+    COLUMNS, ID_COLUMN, UNIQUE_COLUMNS, apply_schema, assign, coerce_row
+)
+
+
+def with_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """Give a table written before rows had ids the ids 1..n, in file order."""
+    if ID_COLUMN not in df.columns:
+        df.insert(0, ID_COLUMN, np.arange(1, len(df) + 1))
+    return df
+
+
+def next_id(df: pd.DataFrame) -> int:
+    return int(df[ID_COLUMN].max()) + 1 if len(df) else 1
+
+
+def _is_missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+class RowIndex:
+    """
+    Hash indexes over one version of the table: row id to position, and
+    each unique column's value to the id of the row holding it.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        ids = df[ID_COLUMN].tolist()
+        self.positions = dict(zip(ids, range(len(ids))))
+        self.unique = {}
+        for column in UNIQUE_COLUMNS:
+            if column not in df.columns:
+                continue
+            values = df[column].tolist()
+            # Reversed so that the first row wins if the file has duplicates
+            self.unique[column] = dict(zip(reversed(values), reversed(ids)))
+        self.next_id = max(ids) + 1 if ids else 1
+
+    def position(self, column: str, value) -> Optional[int]:
+        """Position of the row with `value` in `column` (id or a unique column)."""
+        if column == ID_COLUMN:
+            return self.positions.get(value)
+        row_id = self.unique.get(column, {}).get(value)
+        return None if row_id is None else self.positions.get(row_id)
+
+
+class UniqueGuard:
+    """
+    Enforces UNIQUE_COLUMNS while a group of mutations is applied, using a
+    RowIndex of the table before the group plus the changes made so far.
+    """
+
+    def __init__(self, index: RowIndex):
+        self.index = index
+        self.claimed = {column: {} for column in UNIQUE_COLUMNS}
+        self.released = {column: set() for column in UNIQUE_COLUMNS}
+
+    def owner(self, column: str, value) -> Optional[int]:
+        if value in self.claimed[column]:
+            return self.claimed[column][value]
+        if value in self.released[column]:
+            return None
+        return self.index.unique.get(column, {}).get(value)
+
+    def check(self, row_id: int, values: dict):
+        for column in UNIQUE_COLUMNS:
+            value = values.get(column)
+            if _is_missing(value):
+                continue
+            owner = self.owner(column, value)
+            if owner is not None and owner != row_id:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"{column} '{value}' already exists"
+                )
+
+    def release(self, row: dict):
+        for column in UNIQUE_COLUMNS:
+            value = row.get(column)
+            if _is_missing(value):
+                continue
+            self.claimed[column].pop(value, None)
+            self.released[column].add(value)
+
+    def claim(self, row_id: int, values: dict):
+        for column in UNIQUE_COLUMNS:
+            value = values.get(column)
+            if not _is_missing(value):
+                self.claimed[column][value] = row_id
+
+
+def check_columns(rows: list[dict], columns):
+    """Reject rows with columns the table does not have."""
+    unknown = sorted({column for row in rows for column in row} - set(columns))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown columns: {', '.join(unknown)}"
+        )
+
+
+def check_insert(rows: list[dict], columns) -> list[dict]:
+    """Reject empty inserts and unknown columns; return the rows in column types."""
+    if not rows:
+        raise HTTPException(status_code=400, detail="No rows to append")
+    check_columns(rows, columns)
+    return [coerce_row(row) for row in rows]
+
+
+def _locate(df: pd.DataFrame, mutation: dict, lookup: "_Lookup") -> Optional[int]:
+    """Current position of the row a mutation targets, or None."""
+    if "id" in mutation:
+        return lookup.get().position(ID_COLUMN, mutation["id"])
+    if "key" in mutation:
+        column, value = mutation["key"]
+        return lookup.get().position(column, value)
+    index = mutation["index"]
+    return index if 0 <= index < len(df) else None
+
+
+class _Lookup:
+    """RowIndex of a working frame, built only if a run needs it."""
+
+    def __init__(self, df: pd.DataFrame, index: Optional[RowIndex] = None):
+        self.df = df
+        self.index = index
+
+    def get(self) -> RowIndex:
+        if self.index is None:
+            self.index = RowIndex(self.df)
+        return self.index
+
+
+def _apply_updates(df, run, results, lookup, guard) -> pd.DataFrame:
+    """Apply consecutive updates with one assignment per column."""
+    columns: dict = {}
+    for mutation in run:
+        position = _locate(df, mutation, lookup)
+        if position is None:
+            results.append(HTTPException(status_code=404, detail="Row not found"))
+            continue
+        try:
+            check_columns([mutation["values"]], df.columns)
+            values = coerce_row({k: v for k, v in mutation["values"].items() if k != ID_COLUMN})
+        except HTTPException as e:
+            results.append(e)
+            continue
+        mutation["values"] = values
+        row_id = df[ID_COLUMN].iat[position]
+        if guard is not None:
+            try:
+                guard.check(row_id, values)
+            except HTTPException as e:
+                results.append(e)
+                continue
+            guard.release({c: df[c].iat[position] for c in UNIQUE_COLUMNS
+                           if c in values and c in df.columns})
+            guard.claim(row_id, values)
+        # Record the id so that the journal does not depend on lookup keys
+        mutation.setdefault("id", int(row_id))
+        for column, value in values.items():
+            columns.setdefault(column, ([], []))
+            columns[column][0].append(position)
+            columns[column][1].append(value)
+        results.append(None)
+    for column, (positions, values) in columns.items():
+        series = pd.Series(values, index=positions, dtype=object)
+        # Later updates to the same cell win
+        series = series[~series.index.duplicated(keep='last')]
+        assign(df, list(series.index), column, list(series.values))
+    return df
+
+
+def _apply_deletes(df, run, results, lookup, guard) -> pd.DataFrame:
+    """Apply consecutive deletes with a single take."""
+    alive = np.ones(len(df), dtype=bool)
+    for mutation in run:
+        if "index" in mutation and "id" not in mutation and "key" not in mutation:
+            # Positions are relative to the rows left by earlier deletes
+            remaining = np.flatnonzero(alive)
+            index = mutation["index"]
+            position = remaining[index] if 0 <= index < len(remaining) else None
+        else:
+            position = _locate(df, mutation, lookup)
+            if position is not None and not alive[position]:
+                position = None
+        if position is None:
+            results.append(HTTPException(status_code=404, detail="Row not found"))
+            continue
+        if guard is not None:
+            guard.release({c: df[c].iat[position] for c in UNIQUE_COLUMNS if c in df.columns})
+        mutation.setdefault("id", int(df[ID_COLUMN].iat[position]))
+        alive[position] = False
+        results.append(None)
+    if alive.all():
+        return df
+    return df[alive].reset_index(drop=True)
+
+
+def _apply_inserts(df, run, results, lookup, guard) -> pd.DataFrame:
+    """Apply consecutive inserts with a single concat."""
+    rows = []
+    row_id = next_id(df)
+    for mutation in run:
+        try:
+            mutation["rows"] = check_insert(mutation["rows"], df.columns)
+            assign_ids(mutation["rows"], row_id)
+            if guard is not None:
+                for row in mutation["rows"]:
+                    guard.check(row[ID_COLUMN], row)
+                    guard.claim(row[ID_COLUMN], row)
+        except HTTPException as e:
+            results.append(e)
+            continue
+        rows.extend(mutation["rows"])
+        row_id = max(row_id, max(row[ID_COLUMN] for row in mutation["rows"]) + 1)
+        results.append(None)
+    if not rows:
+        return df
+    new = apply_schema(pd.DataFrame(rows, columns=df.columns))
+    df = apply_schema(pd.concat([df, new], ignore_index=True))
+    if any(mutation.get("moved") for mutation in run):
+        # Rows moved from another table keep their ids, and the table its id order
+        df = df.sort_values(ID_COLUMN, kind="stable", ignore_index=True)
+    return df
+
+
+def assign_ids(rows: list[dict], first_id: int):
+    """Give rows without an id consecutive ids starting at `first_id`."""
+    for row in rows:
+        if _is_missing(row.get(ID_COLUMN)):
+            row[ID_COLUMN] = first_id
+            first_id += 1
+
+
+_RUN_APPLIERS = {
+    "insert": _apply_inserts,
+    "update": _apply_updates,
+    "delete": _apply_deletes,
+}
+
+
+def apply_mutations(
+    df: pd.DataFrame,
+    mutations: list[dict],
+    index: Optional[RowIndex] = None,
+    guard: Optional[UniqueGuard] = None
+) -> tuple[pd.DataFrame, list]:
+    """
+    Apply mutations in order to `df`, with the same result as applying them
+    one by one. Runs of the same operation are applied vectorized.
+
+    Rows are targeted by `id`, by `key` ([unique column, value]) or by
+    position (`index`). `index` may be a RowIndex that matches `df`, and
+    `guard` enforces unique columns. Mutations are annotated with the ids
+    they touched. Returns the new frame and, per mutation, None or the
+    HTTPException rejecting it.
+    """
+    results: list = []
+    start = 0
+    while start < len(mutations):
+        op = mutations[start]["op"]
+        end = start
+        while end < len(mutations) and mutations[end]["op"] == op:
+            end += 1
+        apply_run = _RUN_APPLIERS.get(op)
+        if apply_run is None:
+            results.extend(
+                HTTPException(status_code=400, detail=f"Unknown operation: {op}")
+                for _ in range(start, end)
+            )
+        else:
+            lookup = _Lookup(df, index if start == 0 else None)
+            df = apply_run(df, mutations[start:end], results, lookup, guard)
+        start = end
+    return df, results
@@ -0,0 +1,88 @@
+# app/services/table_schema.py
+import math
+
+import pandas as pd
+from fastapi import HTTPException
+
+try:
+    import pyarrow  # noqa: F401
+    # Multi-threaded parser, and strings kept in Arrow buffers rather than
+    # one Python object per cell
+    PARSER_ENGINE = "pyarrow"
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:  # pragma: no cover - pyarrow is in requirements.txt
+    PARSER_ENGINE = "c"
+    STRING_DTYPE = "object"
+
+ID_COLUMN = 'id'
+COLUMNS = ['user', 'broker', 'API key', 'API secret', 'pnl', 'margin', 'max_risk']
+# Columns the BrokerData model declares unique
+UNIQUE_COLUMNS = ['user', 'API key', 'API secret']
+
+# Declared dtypes of the broker table. float64 rather than float32 keeps the
+# numbers exactly as written in the file.
+SCHEMA = {
+    ID_COLUMN: "int64",
+    "user": STRING_DTYPE,
+    "broker": "category",
+    "API key": STRING_DTYPE,
+    "API secret": STRING_DTYPE,
+    "pnl": "float64",
+    "margin": "float64",
+    "max_risk": "float64",
+}
+FLOAT_COLUMNS = [column for column, dtype in SCHEMA.items() if dtype == "float64"]
+
+
+def read_csv(source, **kwargs) -> pd.DataFrame:
+    """Parse CSV with the declared dtypes, using the pyarrow parser unless chunked."""
+    engine = "c" if "chunksize" in kwargs else PARSER_ENGINE
+    return pd.read_csv(source, dtype=SCHEMA, engine=engine, **kwargs)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast the columns of `df` that drifted from the declared dtypes."""
+    casts = {
+        column: dtype for column, dtype in SCHEMA.items()
+        if column in df.columns and df[column].dtype != dtype
+        and not (dtype == "category" and isinstance(df[column].dtype, pd.CategoricalDtype))
+    }
+    return df.astype(casts) if casts else df
+
+
+def _is_missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value))
+
+
+def coerce_value(column: str, value):
+    """
+    Convert a value written to `column` to the column's type, so that
+    writes never change a column's dtype. Raises 400 if it does not fit.
+    """
+    if column in FLOAT_COLUMNS:
+        if _is_missing(value):
+            return float("nan")
+        if isinstance(value, bool):
+            raise HTTPException(status_code=400, detail=f"{column} must be a number")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"{column} must be a number")
+    if column in SCHEMA and column != ID_COLUMN:
+        return None if _is_missing(value) else str(value)
+    return value
+
+
+def coerce_row(row: dict) -> dict:
+    return {column: coerce_value(column, value) for column, value in row.items()}
+
+
+def assign(df: pd.DataFrame, positions: list, column: str, values: list):
+    """Set `column` at `positions`, keeping the column's dtype."""
+    if isinstance(df[column].dtype, pd.CategoricalDtype):
+        existing = set(df[column].cat.categories)
+        new = {value for value in values if not _is_missing(value)} - existing
+        if new:
+            # In sorted order, like a parsed column: sorts follow category order
+            df[column] = df[column].cat.set_categories(sorted(existing | new))
+    df.loc[positions, column] = values
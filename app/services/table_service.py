@@ -0,0 +1,263 @@
+# app/services/table_service.py
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+from ..config import get_settings
+from .csv_manager import CSVManager
+from .table_aggregates import TableAggregates
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Queued by stop() to shut the writer down
+_STOP = ("stop",)
+
+
+class TableService:
+    """
+    Asyncio front end for CSVManager.
+
+    Blocking reads run in a bounded thread pool. Mutations are queued to a
+    writer thread that owns the table file, so request handlers never
+    block the event loop on pandas I/O or the file lock. The writer is a
+    thread rather than an asyncio task so that it keeps working no matter
+    which event loop the request came in on. A partitioned table
+    (PartitionedTableManager) gets a writer per partition, so that writes
+    of one broker do not wait for those of another; mutations it cannot
+    place, such as those that target a row by position, go to the main
+    writer.
+
+    Row mutations queued within a short window are group committed: the
+    writer hands up to CSV_GROUP_COMMIT_MAX_OPS of them to
+    CSVManager.apply_mutations in one go, and each caller still gets its
+    own result.
+
+    The service also keeps per-group risk aggregates, updated from the
+    manager's change feed as mutations commit, and wakes up change streams
+    (watch) when they do.
+    """
+
+    def __init__(
+        self,
+        manager: CSVManager,
+        read_workers: Optional[int] = None,
+        queue_size: Optional[int] = None
+    ):
+        self.manager = manager
+        self.read_workers = read_workers or settings.CSV_READ_WORKERS
+        self.queue_size = queue_size or settings.CSV_WRITE_QUEUE_SIZE
+        # Queue and thread of each writer: the main one under None, and
+        # one per partition for managers that name the writer of a mutation
+        self._queues: dict[Optional[str], queue.Queue] = {}
+        self._writers: dict[Optional[str], threading.Thread] = {}
+        self._writer_lane: Optional[Callable[[dict], Optional[str]]] = getattr(
+            manager, "writer_lane", None
+        )
+        self._read_pool: Optional[ThreadPoolExecutor] = None
+        self._state_lock = threading.Lock()
+        self._aggregates: dict[str, TableAggregates] = {}
+        # (event loop, event) of each running watch()
+        self._watchers: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        manager.changes.subscribe(self._on_changes)
+
+    def start(self):
+        """Start the read pool and the main writer thread if they are not running."""
+        with self._state_lock:
+            if self._read_pool is None:
+                self._read_pool = ThreadPoolExecutor(
+                    max_workers=self.read_workers,
+                    thread_name_prefix="table-read"
+                )
+        self._writer_queue(None)
+
+    def _writer_queue(self, lane: Optional[str]) -> queue.Queue:
+        """Queue of the writer of `lane`, started if it is not running."""
+        with self._state_lock:
+            writer = self._writers.get(lane)
+            if writer is None or not writer.is_alive():
+                jobs = self._queues.setdefault(lane, queue.Queue(maxsize=self.queue_size))
+                writer = threading.Thread(
+                    target=self._run_writer,
+                    args=(jobs,),
+                    name="table-writer" if lane is None else f"table-writer-{lane}",
+                    daemon=True
+                )
+                self._writers[lane] = writer
+                writer.start()
+                logger.info(f"Table writer started: {writer.name}")
+            return self._queues[lane]
+
+    def stop(self):
+        """Let the writers drain queued mutations, then stop them."""
+        with self._state_lock:
+            writers, self._writers = self._writers, {}
+            read_pool, self._read_pool = self._read_pool, None
+        for lane, writer in writers.items():
+            if writer.is_alive():
+                self._queues[lane].put(_STOP)
+        for writer in writers.values():
+            writer.join()
+            logger.info(f"Table writer stopped: {writer.name}")
+        if read_pool is not None:
+            read_pool.shutdown(wait=False)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(jobs.qsize() for jobs in list(self._queues.values()))
+
+    def _run_writer(self, jobs: queue.Queue):
+        job = None
+        while True:
+            if job is None:
+                job = jobs.get()
+            if job is _STOP:
+                break
+            if job[0] == "mutation":
+                group, job = self._collect_group(job, jobs)
+                self._commit_group(group)
+                continue
+
+            _, future, func, args, kwargs = job
+            job = None
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _collect_group(self, first: tuple, jobs: queue.Queue) -> tuple[list, Optional[tuple]]:
+        """
+        Gather mutations arriving within the group commit window.
+        Returns the group and the first job that did not fit into it.
+        """
+        group = [first]
+        deadline = time.monotonic() + settings.CSV_GROUP_COMMIT_WINDOW_MS / 1000
+        while len(group) < settings.CSV_GROUP_COMMIT_MAX_OPS:
+            try:
+                job = jobs.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return group, None
+            if job[0] != "mutation":
+                return group, job
+            group.append(job)
+        return group, None
+
+    def _commit_group(self, group: list):
+        group = [job for job in group if job[1].set_running_or_notify_cancel()]
+        if not group:
+            return
+        try:
+            results = self.manager.apply_mutations([mutation for _, _, mutation in group])
+        except BaseException as e:
+            for _, future, _ in group:
+                future.set_exception(e)
+            return
+        for (_, future, _), error in zip(group, results):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def _on_changes(self, changes: Optional[list], before, after):
+        for aggregates in list(self._aggregates.values()):
+            aggregates.apply(changes, before, after)
+        with self._state_lock:
+            watchers = list(self._watchers)
+        for loop, wakeup in watchers:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # The watcher's event loop is closed
+                pass
+
+    async def watch(self, since: Optional[int] = None) -> AsyncIterator[dict]:
+        """
+        Yield the row change events committed after version `since` (see
+        CSVManager.changes_since), then new ones as they commit. Without
+        `since` it starts with a {"op": "version"} message carrying the
+        current version. When the changes cannot be told it yields
+        {"op": "reset"} with the current version; the client should then
+        read the table again and carry on from there.
+        """
+        wakeup = asyncio.Event()
+        watcher = (asyncio.get_running_loop(), wakeup)
+        with self._state_lock:
+            self._watchers.add(watcher)
+        try:
+            events, version = await self.read(self.manager.changes_since, since)
+            if since is None:
+                yield {"op": "version", "version": version}
+            while True:
+                if events is None:
+                    yield {"op": "reset", "version": version}
+                else:
+                    for event in events:
+                        yield event
+                try:
+                    # Commits in other processes are only seen by polling
+                    await asyncio.wait_for(wakeup.wait(), settings.CSV_CHANGES_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+                events, version = await self.read(self.manager.changes_since, version)
+        finally:
+            with self._state_lock:
+                self._watchers.discard(watcher)
+
+    def aggregates(self, group_by: str = "broker") -> list[dict]:
+        """
+        Per-group totals of pnl and margin, max and average max_risk and
+        the number of losing accounts. Blocking; call through read().
+        """
+        with self._state_lock:
+            if group_by not in self._aggregates:
+                self._aggregates[group_by] = TableAggregates(group_by)
+            aggregates = self._aggregates[group_by]
+        return aggregates.result(self.manager)
+
+    async def read(self, func: Callable, *args, **kwargs):
+        """Run a blocking read in the read pool."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_pool, lambda: func(*args, **kwargs))
+
+    async def submit(self, func: Callable, *args, **kwargs):
+        """
+        Run a blocking call on the writer thread and wait for its result.
+        Raises 503 with Retry-After when the queue is full.
+        """
+        return await self._enqueue(("call", Future(), func, args, kwargs))
+
+    async def mutate(self, op: str, user_id: Optional[int] = None, **fields):
+        """
+        Queue a row mutation (see CSVManager.apply_mutations) for group
+        commit and wait until it is written.
+        """
+        mutation = {"op": op, **fields, "user_id": user_id}
+        lane = None
+        if self._writer_lane is not None:
+            # Finding the row's partition may read it: not on the event loop
+            lane = await self.read(self._writer_lane, mutation)
+        return await self._enqueue(("mutation", Future(), mutation), lane)
+
+    async def _enqueue(self, job: tuple, lane: Optional[str] = None):
+        self.start()
+        future = job[1]
+        try:
+            self._writer_queue(lane).put_nowait(job)
+        except queue.Full:
+            logger.warning("Table write queue is full")
+            raise HTTPException(
+                status_code=503,
+                detail="Too many pending writes. Please try again.",
+                headers={"Retry-After": str(settings.CSV_RETRY_AFTER_SECONDS)}
+            )
+        return await asyncio.wrap_future(future)
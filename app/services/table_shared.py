@@ -0,0 +1,155 @@
+# app/services/table_shared.py
+import hashlib
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from .table_schema import apply_schema
+
+logger = logging.getLogger(__name__)
+
+# Shared memory, where there is one, so that mapping a snapshot never reads a disk
+SHM_DIR = Path("/dev/shm")
+
+
+def snapshot_path(table_path: Path, snapshot_dir: Optional[Path] = None) -> Path:
+    """
+    Where the shared snapshot of the table at `table_path` lives: in
+    `snapshot_dir`, else shared memory, else next to the table. Named
+    after the table's absolute path, so tables never share a snapshot.
+    """
+    table_path = Path(table_path).absolute()
+    if snapshot_dir is None:
+        snapshot_dir = SHM_DIR / "broker-api" if SHM_DIR.is_dir() else table_path.parent
+    digest = hashlib.blake2b(str(table_path).encode(), digest_size=8).hexdigest()
+    return Path(snapshot_dir) / f"{table_path.stem}-{digest}.arrow"
+
+
+class SharedSnapshot:
+    """
+    The parsed table as an immutable Arrow IPC file, for the processes
+    serving one table to map instead of each parsing the table file.
+
+    The snapshot records the signature (mtime, size, inode) of the table
+    file it was taken from and a version counter bumped by every publish.
+    Readers only use it while the table file still has that signature, so
+    a stale or half-published snapshot is never read, only ignored.
+    """
+
+    def __init__(self, path: Path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Shared table snapshots require pyarrow")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Latest (frame, signature) waiting to be written; older ones are dropped
+        self._pending: Optional[tuple] = None
+        self._pending_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def _metadata(self) -> dict:
+        """Schema metadata of the current snapshot, empty if there is none."""
+        import pyarrow as pa
+        try:
+            with pa.memory_map(str(self.path)) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return {}
+        return {key.decode(): value.decode() for key, value in metadata.items()}
+
+    def version(self) -> int:
+        """How many times the snapshot was published; 0 if it never was."""
+        return int(self._metadata().get("version", 0))
+
+    def load(self, signature: tuple) -> Optional[pd.DataFrame]:
+        """
+        The table as of the file `signature`, mapped rather than copied, or
+        None if the snapshot is missing or of another state of the file.
+        Numeric columns are read-only views of the mapping: copy the frame
+        before changing it in place.
+        """
+        import pyarrow as pa
+        try:
+            # The mapping stays open for as long as the frame uses it. A
+            # publish replaces the file, leaving mapped snapshots intact.
+            reader = pa.ipc.open_file(pa.memory_map(str(self.path)))
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        metadata = reader.schema.metadata or {}
+        if metadata.get(b"table_signature") != repr(signature).encode():
+            return None
+        # Strings stay in the mapped Arrow buffers instead of becoming objects
+        string = pd.StringDtype("pyarrow")
+        strings = {pa.string(): string, pa.large_string(): string}
+        frame = reader.read_all().to_pandas(split_blocks=True, types_mapper=strings.get)
+        return apply_schema(frame)
+
+    def publish(self, frame: pd.DataFrame, signature: tuple):
+        """
+        Write `frame`, the table as of the file `signature`, as the snapshot
+        in the background. The frame must not be changed afterwards. Of
+        several publishes waiting, only the latest is written.
+        """
+        with self._pending_lock:
+            waiting = self._pending is not None
+            self._pending = (frame, signature)
+        if not waiting:
+            self._enqueue()
+
+    def flush(self):
+        """Wait until the pending publish is written."""
+        self._queue.join()
+
+    def _enqueue(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_worker, name="table-snapshot", daemon=True
+                )
+                self._worker.start()
+        self._queue.put(None)
+
+    def _run_worker(self):
+        while True:
+            self._queue.get()
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+            try:
+                if pending is not None:
+                    self._write(*pending)
+            except Exception as e:
+                logger.warning(f"Shared snapshot publish failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, frame: pd.DataFrame, signature: tuple):
+        import pyarrow as pa
+        metadata = self._metadata()
+        if metadata.get("table_signature") == repr(signature):
+            # Another process published this state already
+            return
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            b"table_signature": repr(signature).encode(),
+            b"version": str(int(metadata.get("version", 0)) + 1).encode(),
+        })
+        tmp_path = self.path.with_name(
+            f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with pa.OSFile(str(tmp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, self.path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
@@ -0,0 +1,187 @@
+# app/services/table_storage.py
+import csv
+import io
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+import pandas as pd
+
+from .table_schema import apply_schema, read_csv
+
+
+class TableStorage:
+    """
+    File format the broker table is kept in.
+
+    CSVManager owns locking, caching, journaling and backups; a storage
+    backend only turns a DataFrame into a file and back. Frames it reads
+    have the dtypes of table_schema.SCHEMA. `source` arguments accept a
+    path or a binary file object.
+    """
+
+    name = ""
+    suffix = ""
+    # Whether new rows can be added to the end of the file in place
+    appendable = False
+
+    def read(self, source) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def write(self, df: pd.DataFrame, path: Path):
+        raise NotImplementedError
+
+    def read_header(self, path: Path) -> list:
+        """Return the column names without reading the rows."""
+        raise NotImplementedError
+
+    def iter_chunks(self, source: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """Yield the table as DataFrames of at most `chunk_rows` rows."""
+        raise NotImplementedError
+
+    def iter_csv(self, source: BinaryIO, chunk_rows: int, chunk_bytes: int) -> Iterator[bytes]:
+        """Yield the table encoded as CSV, header first."""
+        header = True
+        for chunk in self.iter_chunks(source, chunk_rows):
+            yield chunk.to_csv(index=False, header=header).encode()
+            header = False
+
+    def append(self, path: Path, rows: list[dict], header: list) -> pd.DataFrame:
+        """
+        Add `rows` to the end of the file and return them parsed the way a
+        full read would parse them. Only for appendable backends.
+        """
+        raise NotImplementedError
+
+
+class CSVStorage(TableStorage):
+    """Plain text CSV, the format of backend_table.csv."""
+
+    name = "csv"
+    suffix = ".csv"
+    appendable = True
+
+    def read(self, source) -> pd.DataFrame:
+        return read_csv(source)
+
+    def write(self, df: pd.DataFrame, path: Path):
+        df.to_csv(path, index=False)
+
+    def read_header(self, path: Path) -> list:
+        with open(path, newline='') as f:
+            return next(csv.reader(f), [])
+
+    def iter_chunks(self, source: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        with read_csv(io.BufferedReader(source), chunksize=chunk_rows) as chunks:
+            yield from chunks
+
+    def iter_csv(self, source: BinaryIO, chunk_rows: int, chunk_bytes: int) -> Iterator[bytes]:
+        # Already CSV: pass the bytes through
+        while chunk := source.read(chunk_bytes):
+            yield chunk
+
+    def append(self, path: Path, rows: list[dict], header: list) -> pd.DataFrame:
+        buffer = io.StringIO()
+        pd.DataFrame(rows, columns=header).to_csv(buffer, header=False, index=False)
+        encoded = buffer.getvalue().encode()
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(encoded)
+        return read_csv(io.BytesIO(encoded), header=None, names=header)
+
+
+class _ArrowStorage(TableStorage):
+    """Columnar formats read and written through pyarrow."""
+
+    # Rows per record batch / row group, the unit chunked reads work in
+    batch_rows = 65536
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError(f"The {self.name} table storage requires pyarrow")
+
+    def iter_chunks(self, source: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        for batch in self._iter_batches(source):
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield apply_schema(batch.slice(start, chunk_rows).to_pandas())
+
+    def _iter_batches(self, source: BinaryIO):
+        raise NotImplementedError
+
+
+class FeatherStorage(_ArrowStorage):
+    """Arrow IPC (Feather v2) file."""
+
+    name = "feather"
+    suffix = ".feather"
+
+    def read(self, source) -> pd.DataFrame:
+        return apply_schema(pd.read_feather(source))
+
+    def write(self, df: pd.DataFrame, path: Path):
+        from pyarrow import feather
+        feather.write_feather(
+            df.reset_index(drop=True), str(path), chunksize=self.batch_rows
+        )
+
+    def read_header(self, path: Path) -> list:
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+
+    def _iter_batches(self, source: BinaryIO):
+        import pyarrow as pa
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i)
+
+
+class ParquetStorage(_ArrowStorage):
+    """Parquet file."""
+
+    name = "parquet"
+    suffix = ".parquet"
+
+    def read(self, source) -> pd.DataFrame:
+        return apply_schema(pd.read_parquet(source))
+
+    def write(self, df: pd.DataFrame, path: Path):
+        df.reset_index(drop=True).to_parquet(
+            path, index=False, row_group_size=self.batch_rows
+        )
+
+    def read_header(self, path: Path) -> list:
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+
+    def _iter_batches(self, source: BinaryIO):
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(source).iter_batches(batch_size=self.batch_rows)
+
+
+STORAGES = {
+    storage.name: storage
+    for storage in (CSVStorage, FeatherStorage, ParquetStorage)
+}
+
+
+def get_storage(name: str) -> TableStorage:
+    """Return the storage backend called `name` (csv, feather or parquet)."""
+    try:
+        return STORAGES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown table storage: {name}")
+
+
+def storage_for_path(path: Path) -> TableStorage:
+    """Return the storage backend for a file, judging by its suffix."""
+    for storage in STORAGES.values():
+        if storage.suffix == Path(path).suffix:
+            return storage()
+    raise ValueError(f"Unknown table file type: {path}")
@@ -0,0 +1,114 @@
+# app/services/table_validation.py
+import math
+import re
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+from ..schemas.broker_data import MAX_RISK_MAX, MAX_RISK_MIN, PATTERNS
+from .table_query import column_key
+from .table_rows import check_columns
+from .table_schema import COLUMNS, FLOAT_COLUMNS, ID_COLUMN, STRING_DTYPE
+
+# Format of each string column, e.g. 'API key' -> ^APIKEY_\d+$
+COLUMN_PATTERNS = {
+    column: PATTERNS[column_key(column)] for column in COLUMNS if column_key(column) in PATTERNS
+}
+COMPILED_PATTERNS = {column: re.compile(pattern) for column, pattern in COLUMN_PATTERNS.items()}
+RANGES = {"max_risk": (MAX_RISK_MIN, MAX_RISK_MAX)}
+# Below this many rows, building columns costs more than checking row by row
+VECTORIZE_MIN_ROWS = 32
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _row_problems(row: dict, partial: bool) -> list[str]:
+    """The checks of _column_problems, for a single row."""
+    problems = []
+    for column in COLUMNS:
+        value = row.get(column)
+        if _is_missing(value):
+            if not partial:
+                problems.append(f"{column} is required")
+            continue
+        if column in COMPILED_PATTERNS:
+            if not COMPILED_PATTERNS[column].fullmatch(str(value)):
+                problems.append(f"{column} must match {COLUMN_PATTERNS[column]}")
+        elif column in FLOAT_COLUMNS:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = math.nan
+            if math.isnan(number):
+                problems.append(f"{column} must be a number")
+            elif column in RANGES and not RANGES[column][0] <= number <= RANGES[column][1]:
+                low, high = RANGES[column]
+                problems.append(f"{column} must be between {low} and {high}")
+    return problems
+
+
+def _column_problems(rows: list[dict], partial: bool) -> list[list[str]]:
+    """Check every row at once, a column at a time."""
+    problems = [[] for _ in rows]
+
+    def report(mask: np.ndarray, message: str):
+        for position in np.flatnonzero(mask):
+            problems[position].append(message)
+
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    for column in COLUMNS:
+        values = df[column]
+        present = values.notna().to_numpy()
+        if not partial:
+            report(~present, f"{column} is required")
+        if not present.any():
+            continue
+        if column in COLUMN_PATTERNS:
+            pattern = COLUMN_PATTERNS[column]
+            matched = values[present].astype(STRING_DTYPE).str.fullmatch(pattern)
+            mismatched = present.copy()
+            mismatched[present] = ~matched.fillna(False).to_numpy(dtype=bool)
+            report(mismatched, f"{column} must match {pattern}")
+        elif column in FLOAT_COLUMNS:
+            numbers = pd.to_numeric(values, errors="coerce")
+            report(present & numbers.isna().to_numpy(), f"{column} must be a number")
+            if column in RANGES:
+                low, high = RANGES[column]
+                out_of_range = ((numbers < low) | (numbers > high)).to_numpy()
+                report(out_of_range, f"{column} must be between {low} and {high}")
+    return problems
+
+
+def validate_rows(rows: list[dict], partial: bool = False) -> list[Optional[str]]:
+    """
+    Check rows written to the table against the broker data schema
+    (schemas.broker_data). Batches are checked a column at a time, with
+    vectorized regex matching and range checks rather than a model object
+    per row; a few rows are checked one by one with the same rules.
+    Without `partial` every column is required; with it (updates) columns
+    may be left out or null.
+
+    Returns one entry per row: None if it is valid, otherwise a message
+    naming every problem. Columns outside the schema are not checked here;
+    check_row and the table reject them with 400.
+    """
+    if len(rows) < VECTORIZE_MIN_ROWS:
+        problems = [_row_problems(row, partial) for row in rows]
+    else:
+        problems = _column_problems(rows, partial)
+    return ["; ".join(messages) if messages else None for messages in problems]
+
+
+def check_row(row: dict, partial: bool = False):
+    """
+    Raise 400 if a single row has columns outside the schema, 422 if it
+    does not fit the schema; see validate_rows.
+    """
+    check_columns([row], [ID_COLUMN, *COLUMNS])
+    error = validate_rows([row], partial=partial)[0]
+    if error is not None:
+        raise HTTPException(status_code=422, detail=error)
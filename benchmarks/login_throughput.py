@@ -0,0 +1,109 @@
+# benchmarks/login_throughput.py
+"""
+Measure POST /token throughput under concurrent logins, and how long a
+cheap request made meanwhile waits for the event loop, with bcrypt in the
+password hasher's process pool or run inline on the event loop as before.
+
+    python -m benchmarks.login_throughput --logins 32 --concurrency 8 --rounds 10 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+async def _login(client, username: str) -> float:
+    began = time.perf_counter()
+    response = await client.post(
+        "/api/v1/token", json={"username": username, "password": "secret"}
+    )
+    response.raise_for_status()
+    return time.perf_counter() - began
+
+
+async def _probe(client, stop: asyncio.Event) -> list:
+    """Latencies of a request that needs no password check, meanwhile."""
+    timings = []
+    while not stop.is_set():
+        began = time.perf_counter()
+        # Wakes up late, too, while the event loop is blocked
+        await asyncio.sleep(0.01)
+        # Refused for want of a token, before any table read
+        await client.get("/api/v1/csv")
+        timings.append(time.perf_counter() - began - 0.01)
+    return timings
+
+
+async def run(mode: str, logins: int, concurrency: int, round_: int) -> tuple:
+    """Logins per second for new and returning users, and probe latencies."""
+    import httpx
+    from app.main import app
+    from app.services.password_hasher import password_hasher
+
+    run_in_pool = password_hasher._run
+    if mode == "inline":
+        async def run_inline(func, *args):
+            return func(*args)
+        password_hasher._run = run_inline
+
+    transport = httpx.ASGITransport(app=app)
+    rates = []
+    stop = asyncio.Event()
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # Pool processes start on first use; not part of the measurement
+        await password_hasher.verify("secret", await password_hasher.hash("secret"))
+        probe = asyncio.create_task(_probe(client, stop))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login(username: str):
+            async with semaphore:
+                return await _login(client, username)
+
+        # First logins register (one hash), second ones verify (one check)
+        for _ in range(2):
+            began = time.perf_counter()
+            await asyncio.gather(*(login(f"{mode}_{round_}_{n}") for n in range(logins)))
+            rates.append(logins / (time.perf_counter() - began))
+        stop.set()
+        timings = await probe
+    password_hasher._run = run_in_pool
+    return rates, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--mode", nargs="+", default=["inline", "pool"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            DATABASE_URL=f"sqlite:///{tmp}/app.db",
+            CSV_FILE_PATH=f"{tmp}/backend_table.csv",
+            BACKUP_DIR=f"{tmp}/backups",
+        )
+        from app.config import get_settings
+        from app.services.password_hasher import password_hasher
+        settings = get_settings()
+
+        print(
+            f"{'mode':<8}{'rounds':>7}{'register/s':>12}{'login/s':>10}"
+            f"{'probe p50 ms':>14}{'probe max ms':>14}"
+        )
+        for round_ in args.rounds:
+            settings.BCRYPT_ROUNDS = round_
+            for mode in args.mode:
+                rates, timings = asyncio.run(run(mode, args.logins, args.concurrency, round_))
+                print(
+                    f"{mode:<8}{round_:>7}{rates[0]:>12.1f}{rates[1]:>10.1f}"
+                    f"{statistics.median(timings) * 1000:>14.1f}{max(timings) * 1000:>14.1f}"
+                )
+        password_hasher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# benchmarks/table_diff.py
+"""
+Time GET /csv/diff's comparison of two table versions, in summary and
+full mode, with 1% of rows changed, added and removed.
+
+    python -m benchmarks.table_diff --rows 100000 1000000
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from app.services.table_diff import diff_tables
+from app.services.table_schema import apply_schema
+from benchmarks.table_storage import best_of, make_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10}{'summary ms':>12}{'full ms':>12}")
+    for rows in args.rows:
+        old = apply_schema(make_table(rows))
+        # Remove 1% of rows, change pnl in another 1% and add 1% new ids
+        new = old.drop(index=old.index[::100])
+        new.loc[new.index[1::100], "pnl"] += 1
+        added = old.iloc[:rows // 100].assign(id=np.arange(rows + 1, rows + 1 + rows // 100))
+        new = apply_schema(pd.concat([new, added], ignore_index=True))
+
+        summary = best_of(lambda: diff_tables(old, new, summary=True), args.repeat)
+        full = best_of(lambda: diff_tables(old, new), args.repeat)
+        print(f"{rows:>10}{summary * 1000:>12.1f}{full * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# benchmarks/table_json.py
+"""
+Compare ways of encoding the table as a GET /csv response body.
+
+    python -m benchmarks.table_json --rows 10000 100000 1000000
+"""
+import argparse
+import json
+
+from fastapi.encoders import jsonable_encoder
+
+from app.services.table_json import columns, dumps
+from app.services.table_schema import apply_schema
+from benchmarks.table_storage import best_of, make_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'encoder':<26}{'rows':>10}{'ms':>10}")
+    for rows in args.rows:
+        df = apply_schema(make_table(rows))
+        records = df.to_dict('records')
+        encoders = {
+            # What FastAPI does with a returned list of dicts
+            "jsonable_encoder + json": lambda: json.dumps(
+                jsonable_encoder(df.to_dict('records')), separators=(",", ":")
+            ).encode(),
+            "dumps(cached records)": lambda: dumps(records),
+            "dumps(columns)": lambda: dumps(columns(df)),
+        }
+        for name, encode in encoders.items():
+            print(f"{name:<26}{rows:>10}{best_of(encode, args.repeat) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
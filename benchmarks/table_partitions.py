@@ -0,0 +1,84 @@
+# benchmarks/table_partitions.py
+"""
+Compare concurrent writers on different brokers with one table file and
+with CSV_PARTITION_BY_BROKER: one process per broker, each updating its
+own broker's rows one write at a time.
+
+    python -m benchmarks.table_partitions --rows 10000 100000 --writes 50
+"""
+import argparse
+import multiprocessing
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.csv_manager import CSVManager
+from app.services.table_partitions import PartitionedTableManager
+from benchmarks.table_storage import make_table
+
+LAYOUTS = {"single": CSVManager, "partitioned": PartitionedTableManager}
+
+
+def _writer(layout: str, csv_path: Path, backup_dir: Path, ids: list, writes: int,
+            start, latencies):
+    manager = LAYOUTS[layout](file_path=csv_path, backup_dir=backup_dir)
+    start.wait()
+    timings = []
+    for n in range(writes):
+        began = time.perf_counter()
+        manager.apply_mutations([
+            {"op": "update", "id": ids[n % len(ids)], "values": {"pnl": float(n)}}
+        ])
+        timings.append(time.perf_counter() - began)
+    latencies.put(timings)
+
+
+def run(layout: str, rows: int, writes: int) -> tuple[float, list]:
+    """Wall time of all writers and every write's latency."""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, backup_dir = Path(tmp) / "backend_table.csv", Path(tmp) / "backups"
+        df = make_table(rows)
+        df.to_csv(csv_path, index=False)
+        # Creates (and for partitioned, splits) the table before writers start
+        LAYOUTS[layout](file_path=csv_path, backup_dir=backup_dir)
+
+        start, latencies = multiprocessing.Event(), multiprocessing.Queue()
+        writers = [
+            multiprocessing.Process(target=_writer, args=(
+                layout, csv_path, backup_dir, group["id"].tolist()[:writes], writes,
+                start, latencies
+            ))
+            for _, group in df.groupby("broker")
+        ]
+        for writer in writers:
+            writer.start()
+        time.sleep(1)
+        began = time.perf_counter()
+        start.set()
+        timings = [timing for _ in writers for timing in latencies.get()]
+        elapsed = time.perf_counter() - began
+        for writer in writers:
+            writer.join()
+        return elapsed, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--writes", type=int, default=50, help="writes per broker")
+    parser.add_argument("--layout", nargs="+", default=list(LAYOUTS))
+    args = parser.parse_args()
+
+    print(f"{'layout':<13}{'rows':>10}{'writes/s':>10}{'p50 ms':>10}{'max ms':>10}")
+    for rows in args.rows:
+        for layout in args.layout:
+            elapsed, timings = run(layout, rows, args.writes)
+            print(
+                f"{layout:<13}{rows:>10}{len(timings) / elapsed:>10.1f}"
+                f"{statistics.median(timings) * 1000:>10.1f}{max(timings) * 1000:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
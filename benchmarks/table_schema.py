@@ -0,0 +1,47 @@
+# benchmarks/table_schema.py
+"""
+Compare CSV parse time and memory per row with and without the declared
+table schema.
+
+    python -m benchmarks.table_schema --rows 10000 100000 1000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from app.services.table_schema import SCHEMA, read_csv
+from benchmarks.table_storage import make_table
+
+PARSERS = {
+    "inferred": lambda path: pd.read_csv(path),
+    "schema (c)": lambda path: pd.read_csv(path, dtype=SCHEMA, engine="c"),
+    "schema": read_csv,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'parser':<12}{'rows':>10}{'parse ms':>12}{'bytes/row':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = Path(tmp) / "table.csv"
+            make_table(rows).to_csv(path, index=False)
+            for name, parse in PARSERS.items():
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    df = parse(path)
+                    timings.append(time.perf_counter() - start)
+                memory = df.memory_usage(deep=True).sum() / rows
+                print(f"{name:<12}{rows:>10}{min(timings) * 1000:>12.1f}{memory:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
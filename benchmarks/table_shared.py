@@ -0,0 +1,54 @@
+# benchmarks/table_shared.py
+"""
+Compare how long a worker takes to see the table after another process
+wrote it: parsing the table file, or mapping the shared Arrow snapshot
+the writer published (CSV_SHARED_SNAPSHOT).
+
+    python -m benchmarks.table_shared --rows 10000 100000 1000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from app.services.table_shared import SharedSnapshot
+from app.services.table_storage import STORAGES, get_storage
+from benchmarks.table_storage import best_of, make_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--storage", nargs="+", default=list(STORAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'storage':<10}{'rows':>10}{'parse ms':>12}{'publish ms':>12}{'map ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            for name in args.storage:
+                storage = get_storage(name)
+                path = Path(tmp) / f"table{storage.suffix}"
+                storage.write(make_table(rows), path)
+                df = storage.read(path)
+                shared = SharedSnapshot(Path(tmp) / "table.arrow")
+
+                def publish():
+                    # A new signature each time, so every publish writes
+                    shared.publish(df, (time.perf_counter_ns(),))
+                    shared.flush()
+
+                parse = best_of(lambda: storage.read(path), args.repeat)
+                written = best_of(publish, args.repeat)
+                signature = (time.perf_counter_ns(),)
+                shared.publish(df, signature)
+                shared.flush()
+                mapped = best_of(lambda: shared.load(signature), args.repeat)
+                print(
+                    f"{name:<10}{rows:>10}{parse * 1000:>12.1f}"
+                    f"{written * 1000:>12.1f}{mapped * 1000:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
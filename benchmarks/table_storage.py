@@ -0,0 +1,64 @@
+# benchmarks/table_storage.py
+"""
+Compare parse (read) and write latency of the table storage backends.
+
+    python -m benchmarks.table_storage --rows 10000 100000 1000000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.services.table_storage import STORAGES, get_storage
+
+
+def make_table(rows: int) -> pd.DataFrame:
+    """A broker table of `rows` rows shaped like backend_table.csv."""
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, rows + 1)
+    return pd.DataFrame({
+        "id": ids,
+        "user": [f"user_{i}" for i in ids],
+        "broker": rng.choice(["BrokerA", "BrokerB", "BrokerC"], rows),
+        "API key": [f"APIKEY_{i}" for i in ids],
+        "API secret": [f"APISECRET_{i}" for i in ids],
+        "pnl": rng.normal(0, 1000, rows).round(2),
+        "margin": rng.uniform(0, 50000, rows).round(2),
+        "max_risk": rng.uniform(0, 10, rows).round(2),
+    })
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--storage", nargs="+", default=list(STORAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'storage':<10}{'rows':>10}{'write ms':>12}{'read ms':>12}{'size MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = make_table(rows)
+            for name in args.storage:
+                storage = get_storage(name)
+                path = Path(tmp) / f"table{storage.suffix}"
+                write = best_of(lambda: storage.write(df, path), args.repeat)
+                read = best_of(lambda: storage.read(path), args.repeat)
+                size = path.stat().st_size / 2**20
+                print(f"{name:<10}{rows:>10}{write * 1000:>12.1f}{read * 1000:>12.1f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,63 @@
 # tests/conftest.py
 import sys
 import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
 # Add the project root directory (one level up) to the sys.path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, ROOT)
+
+
+def pytest_configure(config):
+    """
+    Point the app at a scratch copy of the table, backups and database.
+    This runs before test modules are imported, and so before app.main
+    reads the settings. Tests must never change the files of the checkout.
+    Paths already set in the environment are used as they are.
+    """
+    scratch = tempfile.mkdtemp(prefix="broker-api-tests-")
+    csv_path = os.path.join(scratch, "backend_table.csv")
+    checkout_csv = os.path.join(ROOT, "backend_table.csv")
+    if "CSV_FILE_PATH" not in os.environ and os.path.exists(checkout_csv):
+        shutil.copy(checkout_csv, csv_path)
+    os.environ.setdefault("CSV_FILE_PATH", csv_path)
+    os.environ.setdefault("BACKUP_DIR", os.path.join(scratch, "backups"))
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(scratch, 'app.db')}")
+    config.add_cleanup(lambda: shutil.rmtree(scratch, ignore_errors=True))
+
+
+def broker_row(n: int, broker: str = "BrokerA", **values) -> dict:
+    """Row `n` of the sample table: id n, user_n, APIKEY_n, and so on."""
+    return {"id": n, "user": f"user_{n}", "broker": broker, "API key": f"APIKEY_{n}",
+            "API secret": f"APISECRET_{n}", "pnl": 10.0 * n, "margin": 100.0 * n,
+            "max_risk": 5.0 * n, **values}
+
+
+# The sample table: rows of two brokers
+ROWS = [broker_row(1), broker_row(2, "BrokerB"), broker_row(3)]
+
+
+@pytest.fixture
+def rows() -> list:
+    """Rows the table of `csv_path` starts with; modules override it to vary them."""
+    return ROWS[:2]
+
+
+@pytest.fixture
+def csv_path(tmp_path, rows):
+    path = tmp_path / "backend_table.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def manager(csv_path, tmp_path):
+    # Not imported at the top: the app reads its settings on import, and
+    # pytest_configure has yet to point them at the scratch directory
+    from app.services.csv_manager import CSVManager
+    return CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
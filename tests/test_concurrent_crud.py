@@ -3,6 +3,7 @@ import pytest
 from fastapi.testclient import TestClient
 from concurrent.futures import ThreadPoolExecutor
 import time
+import uuid
 
 from app.main import app  # Ensure PYTHONPATH is set correctly
 
@@ -34,11 +35,13 @@ def create_initial_entry(user_tokens):
     # Use one of the users to create an initial CSV entry.
     token1, _ = user_tokens
     headers = {"Authorization": f"Bearer {token1}"}
+    # user, API key and API secret are unique, so make them unique per run
+    suffix = uuid.uuid4().int % 10**12
     new_entry = {
-        "user": "user1",
-        "broker": "broker1",
-        "API key": "key1",
-        "API secret": "secret1",
+        "user": f"user_{suffix}",
+        "broker": "BrokerA",
+        "API key": f"APIKEY_{suffix}",
+        "API secret": f"APISECRET_{suffix}",
         "pnl": 100,
         "margin": 50,
         "max_risk": 10
@@ -104,11 +107,12 @@ def test_simultaneous_creates_and_deletes(user_tokens):
 
     # Function to create a new CSV entry.
     def create_entry(user_label, pnl_value):
+        suffix = uuid.uuid4().int % 10**12
         new_entry = {
-            "user": user_label,
-            "broker": f"{user_label}_broker",
-            "API key": f"{user_label}_key",
-            "API secret": f"{user_label}_secret",
+            "user": f"user_{suffix}",
+            "broker": "BrokerC",
+            "API key": f"APIKEY_{suffix}",
+            "API secret": f"APISECRET_{suffix}",
             "pnl": pnl_value,
             "margin": 50,
             "max_risk": 10
@@ -0,0 +1,328 @@
+# tests/test_csv_api.py
+import json
+import uuid
+
+import pandas as pd
+import pytest
+from fastapi import WebSocketDisconnect, status
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+client = TestClient(app)
+
+
+def new_number() -> int:
+    """A 12 digit number for unique user, API key and API secret values."""
+    return 10**11 + uuid.uuid4().int % (8 * 10**11)
+
+
+def make_row(number: int, pnl: float) -> dict:
+    return {"user": f"user_{number}", "broker": "BrokerA", "API key": f"APIKEY_{number}",
+            "API secret": f"APISECRET_{number}", "pnl": pnl, "margin": 10, "max_risk": 1}
+
+
+# Inserted by the best effort batch test, queried by the filter test
+BATCH_NUMBER = new_number()
+BATCH_USERS = [f"user_{BATCH_NUMBER}", f"user_{BATCH_NUMBER + 1}"]
+
+
+@pytest.fixture(scope="module")
+def headers():
+    user_data = {"username": "batchuser", "password": "batchpass"}
+    token = client.post("/api/v1/token", json=user_data).json().get("access_token")
+    assert token is not None
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_batch_atomic_rolls_back_on_error(headers):
+    before = client.get("/api/v1/csv", headers=headers).json()
+    response = client.post("/api/v1/csv/batch", headers=headers, json={
+        "operations": [
+            {"op": "update", "row_id": 0, "data": {"pnl": 1.5}},
+            {"op": "delete", "row_id": len(before) + 10},
+        ],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body["applied"] is False
+    assert [r["status"] for r in body["results"]] == ["rolled_back", "error"]
+    assert body["results"][1]["status_code"] == 404
+    assert client.get("/api/v1/csv", headers=headers).json() == before
+
+
+def test_batch_best_effort_applies_valid_operations(headers):
+    before = client.get("/api/v1/csv", headers=headers).json()
+    response = client.post("/api/v1/csv/batch", headers=headers, json={
+        "mode": "best_effort",
+        "operations": [
+            {"op": "insert", "data": make_row(BATCH_NUMBER, 1)},
+            {"op": "insert", "data": make_row(BATCH_NUMBER + 1, 2)},
+            {"op": "delete", "row_id": len(before) + 10},
+            {"op": "update", "row_id": len(before), "data": {"pnl": 10}},
+        ],
+    })
+    body = response.json()
+    assert body["applied"] is True
+    assert [r["status"] for r in body["results"]] == ["ok", "ok", "error", "ok"]
+
+    after = client.get("/api/v1/csv", headers=headers).json()
+    assert [row["user"] for row in after[-2:]] == BATCH_USERS
+    assert after[-2]["pnl"] == 10
+
+
+def test_batch_requires_row_id_for_updates(headers):
+    response = client.post("/api/v1/csv/batch", headers=headers, json={
+        "operations": [{"op": "update", "data": {"pnl": 1}}],
+    })
+    assert response.status_code == 400
+
+
+def test_read_csv_with_filters_and_pagination(headers):
+    response = client.get("/api/v1/csv", headers=headers, params={
+        "user_in": ",".join(BATCH_USERS), "fields": "user,pnl", "sort": "-user", "limit": 1,
+    })
+    assert response.status_code == 200
+    assert response.json() == [{"user": BATCH_USERS[1], "pnl": 2}]
+    assert response.headers["X-Total-Count"] == "2"
+    assert response.headers["X-Next-Offset"] == "1"
+
+
+def test_stream_csv_as_ndjson_and_csv(headers):
+    rows = client.get("/api/v1/csv", headers=headers).json()
+
+    response = client.get("/api/v1/csv/stream", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # Encoded as GET /csv encodes them
+    assert lines == rows
+
+    response = client.get("/api/v1/csv/stream", headers=headers, params={"format": "csv"})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines()[0].startswith("id,user,broker,API key")
+    assert len(response.text.splitlines()) == len(rows) + 1
+
+
+def test_rows_by_id_and_by_user(headers):
+    number = new_number()
+    user = f"user_{number}"
+    assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 5)).status_code == 200
+
+    row = client.get(f"/api/v1/csv/by-user/{user}", headers=headers).json()
+    assert row["pnl"] == 5
+    assert client.get(f"/api/v1/csv/by-api-key/APIKEY_{number}", headers=headers).json() == row
+    assert client.get(f"/api/v1/csv/rows/{row['id']}", headers=headers).json() == row
+
+    # Deleting an earlier row does not move the id
+    client.delete("/api/v1/csv/0", headers=headers)
+    response = client.put(f"/api/v1/csv/rows/{row['id']}", headers=headers, json={"pnl": 6})
+    assert response.status_code == 200
+    response = client.put(f"/api/v1/csv/by-user/{user}", headers=headers, json={"margin": 7})
+    assert response.status_code == 200
+    row = client.get(f"/api/v1/csv/rows/{row['id']}", headers=headers).json()
+    assert (row["pnl"], row["margin"]) == (6, 7)
+
+    assert client.delete(f"/api/v1/csv/by-user/{user}", headers=headers).status_code == 200
+    assert client.get(f"/api/v1/csv/by-user/{user}", headers=headers).status_code == 404
+    assert client.delete(f"/api/v1/csv/rows/{row['id']}", headers=headers).status_code == 404
+
+
+def test_insert_rejects_duplicate_unique_values(headers):
+    number = new_number()
+    user = f"user_{number}"
+    assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 1)).status_code == 200
+    response = client.post("/api/v1/csv", headers=headers, json=make_row(number, 2))
+    assert response.status_code == 409
+
+
+def test_export_csv(headers):
+    rows = client.get("/api/v1/csv", headers=headers).json()
+    response = client.get("/api/v1/csv/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="backend_table.csv"' in response.headers["content-disposition"]
+    lines = response.text.splitlines()
+    assert lines[0] == "id,user,broker,API key,API secret,pnl,margin,max_risk"
+    assert len(lines) == len(rows) + 1
+
+
+def test_aggregates_follow_writes(headers):
+    number = new_number()
+    user = f"user_{number}"
+    before = {group["broker"]: group for group in
+              client.get("/api/v1/csv/aggregates", headers=headers).json()}
+    row = {**make_row(number, -5), "broker": "BrokerC"}
+    assert client.post("/api/v1/csv", headers=headers, json=row).status_code == 200
+
+    after = {group["broker"]: group for group in
+             client.get("/api/v1/csv/aggregates", headers=headers).json()}
+    previous = before.get("BrokerC", {"count": 0, "losing_accounts": 0})
+    assert after["BrokerC"]["count"] == previous["count"] + 1
+    assert after["BrokerC"]["losing_accounts"] == previous["losing_accounts"] + 1
+
+    response = client.get("/api/v1/csv/aggregates", headers=headers, params={"group_by": "user_prefix"})
+    assert "user" in [group["user_prefix"] for group in response.json()]
+
+
+def test_diff(headers):
+    rows = client.get("/api/v1/csv", headers=headers).json()
+    response = client.get(
+        "/api/v1/csv/diff", headers=headers, params={"from": "current", "summary": True}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"key": "id", "summary": {
+        "added": 0, "removed": 0, "changed": 0, "unchanged": len(rows), "changed_columns": {}
+    }}
+    response = client.get("/api/v1/csv/diff", headers=headers, params={"from": "missing.csv"})
+    assert response.status_code == 404
+
+
+def test_diff_of_backups_from_before_ids(headers, tmp_path):
+    from app.controllers.csv_operations import csv_manager
+    if getattr(csv_manager, "backups", None) is None:
+        pytest.skip("backups are named by partition")
+
+    old = [make_row(new_number(), pnl) for pnl in (1, 2)]
+    names = []
+    for number, rows in enumerate((old, old[1:])):
+        path = tmp_path / f"backend_table_{number}.csv"
+        pd.DataFrame(rows).to_csv(path, index=False)
+        names.append(csv_manager.backups.create(path))
+    response = client.get(
+        "/api/v1/csv/diff", headers=headers, params={"from": names[0], "to": names[1]}
+    )
+    assert response.status_code == 200
+    diff = response.json()
+    assert diff["key"] == "user"
+    assert [row["user"] for row in diff["removed"]] == [old[0]["user"]]
+    assert diff["summary"]["unchanged"] == 1 and diff["added"] == []
+
+
+def test_table_change_stream_refuses_bad_tokens():
+    with client.websocket_connect("/api/v1/ws/table-changes?token=bad") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == status.WS_1008_POLICY_VIOLATION
+
+
+def test_table_change_stream(headers):
+    token = headers["Authorization"].split()[1]
+    number = new_number()
+    user = f"user_{number}"
+    with client.websocket_connect(f"/api/v1/ws/table-changes?token={token}") as websocket:
+        version = websocket.receive_json()
+        assert version["op"] == "version"
+        assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 3)).status_code == 200
+        event = websocket.receive_json()
+    assert event["op"] == "insert" and event["version"] > version["version"]
+    assert event["values"]["user"] == user and "pnl" in event["columns"]
+
+    row = client.get(f"/api/v1/csv/by-user/{user}", headers=headers).json()
+    assert event["id"] == row["id"]
+    client.put(f"/api/v1/csv/rows/{row['id']}", headers=headers, json={"pnl": 4})
+
+    # Resuming replays what was missed while disconnected
+    url = f"/api/v1/ws/table-changes?token={token}&since={version['version']}"
+    with client.websocket_connect(url) as websocket:
+        assert websocket.receive_json() == event
+        update = websocket.receive_json()
+    assert update["op"] == "update" and update["id"] == row["id"]
+    assert update["columns"] == ["pnl"] and update["values"] == {"pnl": 4}
+
+
+def test_table_change_stream_sends_missing_values_as_null(headers):
+    token = headers["Authorization"].split()[1]
+    number = new_number()
+    with client.websocket_connect(f"/api/v1/ws/table-changes?token={token}") as websocket:
+        websocket.receive_json()
+        assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 3)).status_code == 200
+        row_id = websocket.receive_json()["id"]
+        response = client.put(f"/api/v1/csv/rows/{row_id}", headers=headers, json={"pnl": None})
+        assert response.status_code == 200
+        message = websocket.receive_text()
+
+    def reject(constant):
+        pytest.fail(f"{constant} is not JSON")
+
+    event = json.loads(message, parse_constant=reject)
+    assert event["id"] == row_id and event["values"] == {"pnl": None}
+
+
+def test_unchanged_table_is_not_modified(headers, monkeypatch):
+    from app.controllers.csv_operations import csv_manager
+    if csv_manager.etag() is None:
+        pytest.skip("table storage offers no ETag")
+
+    response = client.get("/api/v1/csv", headers=headers)
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    filtered = client.get("/api/v1/csv", headers=headers, params={"broker": "BrokerA"})
+    assert filtered.headers["etag"] != etag
+
+    monkeypatch.setattr(csv_manager, "read_records", lambda: pytest.fail("table was read"))
+    response = client.get("/api/v1/csv", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+    assert response.headers["etag"] == etag
+    monkeypatch.undo()
+
+    number = new_number()
+    user = f"user_{number}"
+    assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 1)).status_code == 200
+    response = client.get("/api/v1/csv", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_columns_orient_and_missing_values(headers):
+    number = new_number()
+    user = f"user_{number}"
+    assert client.post("/api/v1/csv", headers=headers, json=make_row(number, 1)).status_code == 200
+    response = client.put(f"/api/v1/csv/by-user/{user}", headers=headers, json={"pnl": None})
+    assert response.status_code == 200
+    assert client.get(f"/api/v1/csv/by-user/{user}", headers=headers).json()["pnl"] is None
+
+    rows = client.get("/api/v1/csv", headers=headers).json()
+    table = client.get("/api/v1/csv", headers=headers, params={"orient": "columns"}).json()
+    assert list(table) == list(rows[0])
+    assert table["user"] == [r["user"] for r in rows]
+    assert table["pnl"] == [r["pnl"] for r in rows]
+
+    response = client.get(
+        "/api/v1/csv", headers=headers, params={"user": user, "fields": "user,pnl", "orient": "columns"}
+    )
+    assert response.json() == {"user": [user], "pnl": [None]}
+    assert response.headers["x-total-count"] == "1"
+
+
+def test_writes_are_validated_against_the_schema(headers):
+    number = new_number()
+    response = client.post("/api/v1/csv", headers=headers, json={**make_row(number, 1), "max_risk": 101})
+    assert response.status_code == 422
+    assert response.json()["detail"] == "max_risk must be between 0 and 100"
+    response = client.post("/api/v1/csv", headers=headers, json={"user": f"user_{number}"})
+    assert response.status_code == 422 and "broker is required" in response.json()["detail"]
+    response = client.put("/api/v1/csv/rows/1", headers=headers, json={"broker": "BrokerZ"})
+    assert response.status_code == 422
+    response = client.put("/api/v1/csv/rows/1", headers=headers, json={"foo": 1})
+    assert response.status_code == 400 and response.json()["detail"] == "Unknown columns: foo"
+    assert "foo" not in client.get("/api/v1/csv", headers=headers).json()[0]
+
+    operations = [
+        {"op": "insert", "data": make_row(number, 1)},
+        {"op": "insert", "data": {**make_row(number + 1, 1), "user": "bob"}},
+        {"op": "update", "row_id": 0, "data": {"pnl": "lots"}},
+    ]
+    body = client.post("/api/v1/csv/batch", headers=headers, json={"operations": operations}).json()
+    assert body["applied"] is False
+    assert [r["status"] for r in body["results"]] == ["rolled_back", "error", "error"]
+    assert body["results"][1] == {
+        "index": 1, "status": "error", "status_code": 422,
+        "detail": "user must match ^user_\\d+$",
+    }
+    assert client.get(f"/api/v1/csv/by-user/user_{number}", headers=headers).status_code == 404
+
+    body = client.post("/api/v1/csv/batch", headers=headers, json={
+        "operations": operations, "mode": "best_effort"
+    }).json()
+    assert [r["status"] for r in body["results"]] == ["ok", "error", "error"]
+    assert client.get(f"/api/v1/csv/by-user/user_{number}", headers=headers).status_code == 200
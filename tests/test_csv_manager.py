@@ -0,0 +1,372 @@
+# tests/test_csv_manager.py
+import copy
+import time
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app.services.csv_manager import CSVManager, settings
+from app.services.table_schema import SCHEMA
+
+
+def test_read_is_served_from_cache(manager, monkeypatch):
+    first = manager.read_records()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("table should not be re-parsed")
+
+    monkeypatch.setattr(pd, "read_csv", fail)
+    assert manager.read_records() is first
+    assert len(manager.read()) == 2
+
+
+def test_writes_invalidate_cache(manager):
+    manager.read_records()
+    version = manager.version
+
+    manager.update_row(0, {"pnl": 99.0})
+    assert manager.version > version
+    assert manager.read_records()[0]["pnl"] == 99.0
+
+    manager.delete_row(1)
+    assert len(manager.read_records()) == 1
+
+
+def test_external_edit_is_detected(manager):
+    manager.read_records()
+    df = pd.read_csv(manager.file_path)
+    df.loc[0, "pnl"] = 12345.0
+    df.loc[len(df)] = df.iloc[0]
+    df.to_csv(manager.file_path, index=False)
+
+    records = manager.read_records()
+    assert len(records) == 3
+    assert records[0]["pnl"] == 12345.0
+
+
+def test_append_rows_only_writes_new_lines(manager):
+    original = manager.file_path.read_bytes()
+    manager.append_row({"user": "user_3", "broker": "BrokerC", "API key": "APIKEY_3",
+                        "API secret": "APISECRET_3", "pnl": 1.0, "margin": 2.0, "max_risk": 3.0})
+    manager.append_rows([{"user": "user_4", "pnl": 4.0}, {"user": "user_5", "broker": "Broker, Inc"}])
+
+    content = manager.file_path.read_bytes()
+    assert content.startswith(original)
+    records = manager.read_records()
+    assert [r["user"] for r in records] == ["user_1", "user_2", "user_3", "user_4", "user_5"]
+    assert records[4]["broker"] == "Broker, Inc"
+    # Only the journal's base snapshot, no copy per append
+    assert len(manager.get_previous_backups()) == 1
+
+
+def test_append_rejects_unknown_columns(manager):
+    with pytest.raises(HTTPException) as exc:
+        manager.append_row({"user": "user_3", "nickname": "x"})
+    assert exc.value.status_code == 400
+    assert len(manager.read_records()) == 2
+
+    before = manager.file_path.read_bytes()
+    results = manager.apply_mutations([{"op": "update", "id": 1, "values": {"nickname": "x"}}])
+    assert results[0].status_code == 400
+    assert manager.file_path.read_bytes() == before
+
+
+def test_changes_are_journaled_without_copying_the_table(manager):
+    manager.update_row(0, {"pnl": 1.0}, user_id=7)
+    manager.delete_row(1, user_id=7)
+    manager.append_row({"user": "user_3"}, user_id=8)
+
+    entries = list(manager.journal.entries())
+    assert [e["op"] for e in entries] == ["snapshot", "update", "delete", "insert"]
+    assert entries[1]["user_id"] == 7 and entries[1]["values"] == {"pnl": 1.0}
+    # Only the base snapshot was copied
+    assert len(manager.get_previous_backups()) == 1
+
+
+def test_periodic_snapshots_and_journal_compaction(manager, monkeypatch):
+    monkeypatch.setattr(settings, "CSV_SNAPSHOT_INTERVAL", 2)
+    monkeypatch.setattr(settings, "CSV_SNAPSHOT_RETENTION", 2)
+    for value in range(6):
+        manager.update_row(0, {"pnl": float(value)})
+    # Old snapshots are pruned in the background
+    manager.backups.flush()
+
+    assert len(manager.get_previous_backups()) == 2
+    entries = list(manager.journal.entries())
+    assert entries[0]["op"] == "snapshot"
+    assert entries[0]["file"] in manager.get_previous_backups()
+
+
+def test_restore_to_point_in_time(manager):
+    manager.update_row(0, {"pnl": 1.0})
+    manager.append_row({"user": "user_3", "pnl": 3.0})
+    checkpoint = datetime.utcnow()
+    time.sleep(0.01)
+    manager.delete_row(0)
+    manager.update_row(0, {"pnl": 42.0})
+
+    manager.restore_to(checkpoint)
+    records = manager.read_records()
+    assert [r["user"] for r in records] == ["user_1", "user_2", "user_3"]
+    assert [r["pnl"] for r in records] == [1.0, 20.0, 3.0]
+    assert manager.journal.entries().__next__()["op"] == "snapshot"
+
+
+def test_restore_before_first_snapshot_is_not_found(manager):
+    manager.update_row(0, {"pnl": 1.0})
+    with pytest.raises(HTTPException) as exc:
+        manager.restore_to(datetime(2000, 1, 1))
+    assert exc.value.status_code == 404
+
+
+def test_apply_mutations_writes_once_and_replays(manager):
+    results = manager.apply_mutations([
+        {"op": "update", "index": 0, "values": {"pnl": 2.0}, "user_id": 1},
+        {"op": "delete", "index": 5, "user_id": 1},
+        {"op": "insert", "rows": [{"user": "user_3"}], "user_id": 2},
+        {"op": "delete", "index": 1, "user_id": 2},
+    ])
+    assert results[0] is None and results[2] is None and results[3] is None
+    assert results[1].status_code == 404
+    assert [r["user"] for r in manager.read_records()] == ["user_1", "user_3"]
+
+    checkpoint = datetime.utcnow()
+    manager.update_row(0, {"pnl": 9.0})
+    manager.restore_to(checkpoint)
+    assert [(r["user"], r["pnl"]) for r in manager.read_records()][0] == ("user_1", 2.0)
+    assert len(manager.read_records()) == 2
+
+
+def test_atomic_mutations_write_nothing_on_failure(manager):
+    before = manager.file_path.read_bytes()
+    results = manager.apply_mutations([
+        {"op": "update", "index": 0, "values": {"pnl": 2.0}},
+        {"op": "delete", "index": 9},
+    ], atomic=True)
+    assert results[0] is None and results[1].status_code == 404
+    assert manager.file_path.read_bytes() == before
+
+
+def test_vectorized_mutations_match_sequential_application(manager):
+    mutations = [
+        {"op": "update", "index": 0, "values": {"pnl": 1.0, "margin": 1.0}},
+        {"op": "update", "index": 1, "values": {"pnl": 2.0}},
+        {"op": "update", "index": 0, "values": {"pnl": 3.0}},
+        {"op": "insert", "rows": [{"user": "user_3", "pnl": 4.0}]},
+        {"op": "insert", "rows": [{"user": "user_4", "pnl": 5.0}]},
+        {"op": "delete", "index": 0},
+        {"op": "delete", "index": 1},
+        {"op": "update", "index": 1, "values": {"max_risk": 9.0}},
+    ]
+    expected = manager.read()
+    for mutation in copy.deepcopy(mutations):
+        manager.apply_mutations([mutation])
+    expected = manager.read().drop(columns="id")
+
+    manager.restore_backup(manager.get_previous_backups()[-1])
+    manager.apply_mutations(mutations)
+    # Inserted rows get new ids
+    pd.testing.assert_frame_equal(manager.read().drop(columns="id"), expected)
+
+
+def test_snapshot_is_not_affected_by_later_writes(manager):
+    snapshot = manager.open_snapshot()
+    manager.append_row({"user": "user_3"})
+    manager.delete_row(0)
+
+    chunks = list(snapshot.iter_records(chunk_rows=1))
+    snapshot.close()
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert pd.concat(chunks)["user"].tolist() == ["user_1", "user_2"]
+
+
+def test_table_without_ids_keeps_its_layout(tmp_path):
+    csv_path = tmp_path / "backend_table.csv"
+    pd.DataFrame([{"user": f"user_{n}", "pnl": float(n)} for n in (1, 2, 3)]).to_csv(
+        csv_path, index=False)
+    original = csv_path.read_bytes()
+    manager = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    assert [r["id"] for r in manager.read_records()] == [1, 2, 3]
+    assert csv_path.read_bytes() == original
+    assert manager.get_previous_backups() == []
+
+    # Ids stay put across deletes, kept beside the file
+    manager.delete_row(1)
+    manager.append_row({"user": "user_4", "pnl": 4.0})
+    manager.update_row(1, {"pnl": 30.0})
+    assert "id" not in pd.read_csv(csv_path).columns
+    expected = [(1, "user_1", 1.0), (3, "user_3", 30.0), (4, "user_4", 4.0)]
+    assert [(r["id"], r["user"], r["pnl"]) for r in manager.read_records()] == expected
+    reopened = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    assert [(r["id"], r["user"], r["pnl"]) for r in reopened.read_records()] == expected
+
+    # Streams and snapshots carry the ids
+    export_path = tmp_path / "export.csv"
+    manager.export_csv(export_path)
+    assert pd.read_csv(export_path)["id"].tolist() == [1, 3, 4]
+    manager.backup()
+    assert manager.read_backup(manager.get_previous_backups()[0])["id"].tolist() == [1, 3, 4]
+
+
+def test_add_ids_stores_the_ids(tmp_path):
+    csv_path = tmp_path / "backend_table.csv"
+    pd.DataFrame([{"user": f"user_{n}", "pnl": float(n)} for n in (1, 2, 3)]).to_csv(
+        csv_path, index=False)
+    manager = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    manager.delete_row(1)
+    backups = manager.get_previous_backups()
+
+    assert manager.add_ids()
+    assert not manager.add_ids()
+    assert pd.read_csv(csv_path)["id"].tolist() == [1, 3]
+    assert not manager.ids_path.exists()
+    assert manager.get_previous_backups() == backups
+    manager.append_row({"user": "user_4", "pnl": 4.0})
+    assert [r["id"] for r in manager.read_records()] == [1, 3, 4]
+
+
+def test_rows_keep_their_ids_across_deletes(manager):
+    manager.append_row({"user": "user_3", "API key": "APIKEY_3"})
+    manager.delete_row(0)
+    assert manager.get_row("id", 3)["user"] == "user_3"
+    assert manager.get_row("API key", "APIKEY_3")["id"] == 3
+
+    manager.apply_mutations([{"op": "update", "key": ["user", "user_3"], "values": {"pnl": 7.0}}])
+    manager.apply_mutations([{"op": "delete", "id": 2}])
+    assert [(r["id"], r["pnl"]) for r in manager.read_records()] == [(3, 7.0)]
+    assert manager.get_row("user", "user_2") is None
+
+
+def test_ids_of_deleted_rows_are_not_reused(manager):
+    manager.apply_mutations([{"op": "delete", "id": 2}])
+    manager.append_row({"user": "user_3"})
+    assert [r["id"] for r in manager.read_records()] == [1, 3]
+
+    reopened = CSVManager(file_path=manager.file_path, backup_dir=manager.backup_dir)
+    reopened.apply_mutations([{"op": "delete", "id": 3}])
+    reopened.append_row({"user": "user_4"})
+    assert [r["id"] for r in reopened.read_records()] == [1, 4]
+
+
+def test_ids_of_deleted_rows_are_not_reused_without_an_id_column(tmp_path):
+    csv_path = tmp_path / "backend_table.csv"
+    pd.DataFrame([{"user": f"user_{n}", "pnl": float(n)} for n in (1, 2, 3)]).to_csv(
+        csv_path, index=False)
+    manager = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    manager.delete_row(2)
+    manager.append_row({"user": "user_4", "pnl": 4.0})
+    assert "id" not in pd.read_csv(csv_path).columns
+    reopened = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    assert [r["id"] for r in reopened.read_records()] == [1, 2, 4]
+
+
+def test_unique_columns_are_enforced(manager):
+    with pytest.raises(HTTPException) as exc:
+        manager.append_row({"user": "user_1"})
+    assert exc.value.status_code == 409
+    with pytest.raises(HTTPException) as exc:
+        manager.append_rows([{"user": "user_9"}, {"user": "user_9"}])
+    assert exc.value.status_code == 409
+    with pytest.raises(HTTPException) as exc:
+        manager.update_row(1, {"API key": "APIKEY_1"})
+    assert exc.value.status_code == 409
+
+    # A value freed by a delete can be reused in the same group
+    results = manager.apply_mutations([
+        {"op": "delete", "key": ["user", "user_2"]},
+        {"op": "update", "id": 1, "values": {"user": "user_2"}},
+    ])
+    assert results == [None, None]
+
+
+def test_append_extends_cached_indexes(manager):
+    manager.get_row("user", "user_1")
+    cache = manager._cache
+    manager.append_row({"user": "user_3"})
+    assert manager._cache.row_index is cache.row_index
+    assert manager.get_row("user", "user_3")["id"] == 3
+
+
+def test_table_keeps_its_declared_dtypes(manager):
+    assert manager.read_cached().dtypes.to_dict() == SCHEMA
+
+    manager.append_row({"user": "user_3", "broker": "BrokerC", "pnl": "4.5"})
+    manager.update_row(0, {"pnl": "7", "margin": None, "broker": "BrokerZ", "API key": 123})
+    df = manager.read_cached()
+    assert df.dtypes.to_dict() == SCHEMA
+    assert df.loc[0, "pnl"] == 7.0
+    assert df.loc[0, "API key"] == "123"
+    assert df["broker"].tolist() == ["BrokerZ", "BrokerB", "BrokerC"]
+
+    with pytest.raises(HTTPException) as exc:
+        manager.update_row(1, {"pnl": "lots"})
+    assert exc.value.status_code == 400
+    assert manager.read_cached().loc[1, "pnl"] == 20.0
+
+
+def test_changes_since_a_version(manager):
+    _, start = manager.changes_since(None)
+    manager.update_row(0, {"pnl": 1.0})
+    manager.apply_mutations([
+        {"op": "insert", "rows": [{"user": "user_3"}]},
+        {"op": "delete", "id": 2},
+    ])
+    assert manager.apply_mutations([{"op": "delete", "id": 99}], atomic=True)[0] is not None
+
+    events, version = manager.changes_since(start)
+    assert [(e["op"], e["id"]) for e in events] == [("update", 1), ("insert", 3), ("delete", 2)]
+    assert events[0]["columns"] == ["pnl"] and events[0]["values"] == {"pnl": 1.0}
+    assert events[1]["values"]["user"] == "user_3"
+    assert events[1]["version"] == events[2]["version"] == version
+    assert manager.changes_since(version) == ([], version)
+    assert manager.changes_since(events[0]["version"])[0] == events[1:]
+
+    # Replacing the whole table cannot be told row by row
+    manager.restore_backup(manager.get_previous_backups()[-1])
+    events, latest = manager.changes_since(version)
+    assert events is None and latest > version
+    assert manager.changes_since(latest) == ([], latest)
+
+
+def test_changes_are_parsed_as_the_journal_grows(manager, monkeypatch):
+    _, start = manager.changes_since(None)
+    manager.update_row(0, {"pnl": 1.0})
+    assert len(manager.changes_since(start)[0]) == 1
+    parsed_to = manager.journal.path.stat().st_size
+
+    offsets = []
+    read_from = manager.journal.read_from
+    monkeypatch.setattr(
+        manager.journal, "read_from", lambda offset=0: offsets.append(offset) or read_from(offset)
+    )
+    manager.update_row(1, {"pnl": 2.0})
+
+    def fail(df):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(manager, "_write_frame", fail)
+    with pytest.raises(HTTPException):
+        manager.update_row(0, {"pnl": 3.0})
+    assert list(manager.journal.entries())[-1]["op"] == "abort"
+
+    events, _ = manager.changes_since(start)
+    assert offsets == [parsed_to]
+    assert [(e["id"], e["values"]) for e in events] == [(1, {"pnl": 1.0}), (2, {"pnl": 2.0})]
+
+
+def test_etag_follows_the_file(manager):
+    etag = manager.etag()
+    other = CSVManager(file_path=manager.file_path, backup_dir=manager.backup_dir)
+    assert other.etag() == etag
+    manager.append_row({"user": "user_3"})
+    assert other.etag() == manager.etag() != etag
+
+
+def test_etag_changes_when_the_file_stat_comes_back(manager, monkeypatch):
+    # A reused inode with the same size and mtime
+    monkeypatch.setattr(manager, "_file_signature", lambda: (1, 2, 3))
+    etag = manager.etag()
+    manager.update_row(0, {"pnl": 1.0})
+    assert manager.etag() != etag
@@ -3,6 +3,7 @@ import pytest
 from fastapi.testclient import TestClient
 from datetime import datetime
 import time
+import uuid
 
 from app.main import app  # Ensure PYTHONPATH is set so that "app" is found
 
@@ -39,11 +40,13 @@ def test_csv_crud_operations(test_user_token):
     initial_entries = get_response.json()
     
     # POST /api/v1/csv to create a new CSV entry.
+    # user, API key and API secret are unique, so make them unique per run
+    suffix = uuid.uuid4().int % 10**12
     new_entry = {
-        "user": "testuser",
-        "broker": "testbroker",
-        "API key": "key123",
-        "API secret": "secret123",
+        "user": f"user_{suffix}",
+        "broker": "BrokerA",
+        "API key": f"APIKEY_{suffix}",
+        "API secret": f"APISECRET_{suffix}",
         "pnl": 100,
         "margin": 50,
         "max_risk": 10
@@ -68,11 +71,12 @@ def test_csv_backup_and_restore(test_user_token):
     headers = {"Authorization": f"Bearer {test_user_token}"}
     
     # Trigger a backup by creating a new CSV entry.
+    suffix = uuid.uuid4().int % 10**12
     new_entry = {
-        "user": "backupuser",
-        "broker": "backupbroker",
-        "API key": "keybackup",
-        "API secret": "secretbackup",
+        "user": f"user_{suffix}",
+        "broker": "BrokerB",
+        "API key": f"APIKEY_{suffix}",
+        "API secret": f"APISECRET_{suffix}",
         "pnl": 200,
         "margin": 100,
         "max_risk": 20
@@ -0,0 +1,86 @@
+# tests/test_password_hasher.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import get_settings
+from app.database import Base
+from app.models.user import User
+from app.schemas.user import UserCreate
+from app.services.auth import AuthService
+from app.services.password_hasher import PasswordHasher, password_hasher
+
+settings = get_settings()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    password_hasher.stop()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Names of the bcrypt operations run by the shared password hasher."""
+    calls = []
+    run = password_hasher._run
+
+    async def counted(func, *args):
+        calls.append(func.__name__)
+        return await run(func, *args)
+
+    monkeypatch.setattr(password_hasher, "_run", counted)
+    return calls
+
+
+def test_login_hashes_or_verifies_once(db, calls):
+    user = asyncio.run(AuthService.login_or_register(db, "alice", "secret"))
+    assert calls == ["get_password_hash"]
+    assert user.hashed_password.startswith("$2b$04$")
+
+    calls.clear()
+    assert asyncio.run(AuthService.login_or_register(db, "alice", "secret")).id == user.id
+    assert calls == ["verify_password"]
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(AuthService.login_or_register(db, "alice", "wrong"))
+    assert exc.value.status_code == 400
+
+
+def test_taken_names_and_inactive_users_cost_no_hash(db, calls):
+    db.add(User(username="bob", hashed_password="-", is_active=False))
+    db.commit()
+    for login in (
+        AuthService.register(db, UserCreate(username="bob", password="secret")),
+        AuthService.login_or_register(db, "bob", "secret"),
+    ):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(login)
+        assert exc.value.status_code == 400
+    assert calls == []
+
+
+def test_full_queue_answers_503(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    hasher = PasswordHasher(workers=1, queue_size=2)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(hasher.hash("secret") for _ in range(3)), return_exceptions=True
+        )
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        hasher.stop()
+    assert [isinstance(result, str) for result in results] == [True, True, False]
+    assert results[2].status_code == 503
+    assert results[2].headers["Retry-After"] == str(settings.CSV_RETRY_AFTER_SECONDS)
@@ -0,0 +1,82 @@
+# tests/test_rwlock.py
+import threading
+import time
+
+import pytest
+from filelock import Timeout
+
+from app.core.rwlock import ReadWriteFileLock
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return tmp_path / "table.lock"
+
+
+def test_readers_share_the_lock(lock_path):
+    first = ReadWriteFileLock(lock_path, timeout=1)
+    second = ReadWriteFileLock(lock_path, timeout=1)
+    with first.read():
+        with second.read():
+            pass
+
+
+def test_writer_excludes_readers(lock_path):
+    writer = ReadWriteFileLock(lock_path, timeout=1)
+    reader = ReadWriteFileLock(lock_path, timeout=0.1)
+    with writer.write():
+        with pytest.raises(Timeout):
+            with reader.read():
+                pass
+    assert reader.stats.snapshot()["read"]["timeouts"] == 1
+
+
+def test_waiting_writer_blocks_new_readers(lock_path):
+    lock = ReadWriteFileLock(lock_path, timeout=2)
+    order = []
+    reader_holding = threading.Event()
+    release_reader = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            reader_holding.set()
+            release_reader.wait()
+        order.append("first reader done")
+
+    def writer():
+        with lock.write():
+            order.append("writer")
+
+    def late_reader():
+        with lock.read():
+            order.append("late reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    reader_holding.wait()
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    time.sleep(0.1)  # let the writer queue up
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    time.sleep(0.1)
+    release_reader.set()
+    for thread in threads:
+        thread.join()
+
+    assert order.index("writer") < order.index("late reader")
+
+
+def test_lock_is_reentrant_for_the_holding_thread(lock_path):
+    lock = ReadWriteFileLock(lock_path, timeout=0.5)
+    with lock.write():
+        with lock.read():
+            with lock.write():
+                pass
+    with lock.read():
+        with pytest.raises(RuntimeError):
+            with lock.write():
+                pass
+    stats = lock.stats.snapshot()
+    assert stats["write"]["acquired"] == 1
+    assert stats["read"]["acquired"] == 1
@@ -0,0 +1,83 @@
+# tests/test_session_cache.py
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.security import create_token
+from app.database import Base
+from app.models.user import User
+from app.services.auth import AuthService
+from app.services.session_cache import session_cache
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.queries = []
+    event.listen(
+        engine, "before_cursor_execute",
+        lambda conn, cursor, statement, *args: session.queries.append(statement)
+    )
+    session_cache.clear()
+    yield session
+    session.close()
+    session_cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    # Hashing is beside the point here, and slow
+    user = User(username="alice", hashed_password="-")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def authenticate(db, token: str) -> int:
+    """Status of authenticating with `token`, 200 if it is accepted."""
+    try:
+        AuthService.get_session(db, token)
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+def test_active_sessions_are_verified_without_a_query(db, user):
+    token = AuthService.create_session(db, user)["access_token"]
+    assert AuthService.get_session(db, token).user_id == user.id
+
+    db.queries.clear()
+    session = AuthService.get_session(db, token)
+    assert session.user_id == user.id and session.access_token == token
+    assert db.queries == []
+
+
+def test_invalid_tokens_are_refused_without_a_query(db, user):
+    refresh = AuthService.create_session(db, user)["refresh_token"]
+    forged, _ = create_token(user.username)
+    db.queries.clear()
+    assert authenticate(db, "not-a-token") == 401
+    assert authenticate(db, refresh) == 401
+    assert db.queries == []
+    # Signed, but not issued for a session
+    assert authenticate(db, forged) == 401
+
+
+def test_logout_login_and_refresh_revoke_cached_tokens(db, user):
+    first = AuthService.create_session(db, user)
+    assert authenticate(db, first["access_token"]) == 200
+    second = AuthService.create_session(db, user)
+    assert authenticate(db, first["access_token"]) == 401
+    assert authenticate(db, second["access_token"]) == 200
+
+    refreshed = AuthService.refresh_session(db, second["refresh_token"])
+    assert authenticate(db, second["access_token"]) == 401
+    assert authenticate(db, refreshed["access_token"]) == 200
+
+    assert AuthService.logout(db, refreshed["access_token"])
+    db.queries.clear()
+    assert authenticate(db, refreshed["access_token"]) == 401
+    assert db.queries == []
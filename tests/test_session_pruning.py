@@ -0,0 +1,87 @@
+# tests/test_session_pruning.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, create_indexes
+from app.models.user import User, UserSession
+from app.services.auth import AuthService
+from app.services.session_cache import session_cache
+from app.services.session_pruner import SessionPruner
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    session_cache.clear()
+    yield session
+    session.close()
+    session_cache.clear()
+
+
+def add_session(db, user: User, n: int, is_active: bool = True, expired: bool = False):
+    expires = datetime.utcnow() + timedelta(days=-1 if expired else 1)
+    db.add(UserSession(
+        user_id=user.id, access_token=f"access_{n}", refresh_token=f"refresh_{n}",
+        access_token_expires=expires, refresh_token_expires=expires, is_active=is_active
+    ))
+
+
+def test_dead_sessions_are_pruned_in_batches(db):
+    user = User(username="alice", hashed_password="-")
+    db.add(user)
+    db.commit()
+    for n in range(5):
+        add_session(db, user, n, is_active=False)
+    for n in range(5, 8):
+        add_session(db, user, n, expired=True)
+    add_session(db, user, 8)
+    db.commit()
+
+    assert AuthService.prune_sessions(db, batch_size=3) == 3
+    pruner = SessionPruner(batch_size=3, session_factory=sessionmaker(bind=db.get_bind()))
+    assert asyncio.run(pruner.prune()) == 5
+    assert [s.access_token for s in db.query(UserSession)] == ["access_8"]
+
+
+def test_refresh_reads_session_and_user_in_one_query(db):
+    user = User(username="alice", hashed_password="-")
+    db.add(user)
+    db.commit()
+    tokens = AuthService.create_session(db, user)
+
+    statements = []
+    engine = db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    refreshed = AuthService.refresh_session(db, tokens["refresh_token"])
+    event.remove(engine, "before_cursor_execute", listener)
+
+    assert [s.split()[0] for s in statements] == ["SELECT", "UPDATE"]
+    assert AuthService.get_session(db, refreshed["access_token"]).user_id == user.id
+
+
+def test_indexes_are_added_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_user_sessions_user_id_is_active")
+
+    create_indexes(engine)
+    create_indexes(engine)
+    indexes = {
+        index["name"]: index["column_names"]
+        for index in inspect(engine).get_indexes("user_sessions")
+    }
+    assert indexes["ix_user_sessions_user_id_is_active"] == ["user_id", "is_active"]
+    assert indexes["ix_user_sessions_refresh_token_is_active"] == ["refresh_token", "is_active"]
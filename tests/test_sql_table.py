@@ -0,0 +1,83 @@
+# tests/test_sql_table.py
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+
+from app.services.csv_manager import CSVManager
+from app.services.sql_table import SQLTableManager
+
+
+@pytest.fixture
+def manager(csv_path, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'broker.db'}")
+    manager = SQLTableManager(engine=engine, file_path=csv_path, backup_dir=tmp_path / "backups")
+    manager.migrate_from_csv()
+    return manager
+
+
+def test_migration_imports_the_csv_once(manager):
+    assert [(r["id"], r["user"], r["API key"]) for r in manager.read_records()] == [
+        (1, "user_1", "APIKEY_1"), (2, "user_2", "APIKEY_2")
+    ]
+    with pytest.raises(HTTPException) as exc:
+        manager.migrate_from_csv()
+    assert exc.value.status_code == 409
+
+
+def test_row_changes_use_ids_and_unique_keys(manager):
+    manager.append_row({"user": "user_3", "API key": "APIKEY_3"})
+    assert manager.get_row("user", "user_3")["id"] == 3
+
+    results = manager.apply_mutations([
+        {"op": "update", "key": ["API key", "APIKEY_3"], "values": {"pnl": 7.0}},
+        {"op": "delete", "index": 0},
+        {"op": "insert", "rows": [{"user": "user_2"}]},
+        {"op": "update", "id": 99, "values": {"pnl": 1.0}},
+    ])
+    assert [None if error is None else error.status_code for error in results] == [
+        None, None, 409, 404
+    ]
+    assert [(r["id"], r["pnl"]) for r in manager.read_records()] == [(2, 20.0), (3, 7.0)]
+
+
+def test_atomic_mutations_roll_back(manager):
+    results = manager.apply_mutations([
+        {"op": "delete", "id": 1},
+        {"op": "delete", "id": 99},
+    ], atomic=True)
+    assert results[1].status_code == 404
+    assert len(manager.read_records()) == 2
+
+
+def test_export_matches_the_csv_table_format(manager, tmp_path):
+    manager.export_csv(tmp_path / "sql.csv")
+    csv_manager = CSVManager(file_path=tmp_path / "backend_table.csv", backup_dir=tmp_path / "b")
+    csv_manager.export_csv(tmp_path / "file.csv")
+    assert (tmp_path / "sql.csv").read_text() == (tmp_path / "file.csv").read_text()
+
+
+def test_backup_and_restore(manager):
+    name = manager.backup()
+    manager.delete_row(0)
+    assert manager.get_previous_backups() == [name]
+    manager.restore_backup(name)
+    assert [r["user"] for r in manager.read_records()] == ["user_1", "user_2"]
+
+    # Every full replacement backs up what it replaces
+    backups = manager.get_previous_backups()
+    assert len(backups) == 2
+    assert manager.read_backup(backups[0])["user"].tolist() == ["user_2"]
+    manager.import_csv(manager.csv_path)
+    assert len(manager.get_previous_backups()) == 3
+
+
+def test_changes_since_a_version(manager):
+    _, start = manager.changes_since(None)
+    manager.append_row({"user": "user_3"})
+    manager.delete_row(0)
+    events, version = manager.changes_since(start)
+    assert [(e["op"], e["id"], e["version"]) for e in events] == [
+        ("insert", 3, start + 1), ("delete", 1, start + 2)
+    ]
+    assert version == start + 2
+    assert manager.changes_since(version + 1) == (None, version)
@@ -0,0 +1,66 @@
+# tests/test_table_aggregates.py
+import pytest
+
+from app.services.csv_manager import CSVManager
+from app.services.table_aggregates import TableAggregates
+from app.services.table_service import TableService
+from conftest import broker_row
+
+
+@pytest.fixture
+def rows():
+    return [
+        broker_row(1),
+        broker_row(2, pnl=-3.0, max_risk=7.5),
+        broker_row(3, "BrokerB", user="desk_3", pnl=-1.0, margin=50.0, max_risk=2.0),
+    ]
+
+
+def rebuilt(manager, group_by="broker"):
+    return TableAggregates(group_by).result(manager)
+
+
+def test_aggregates_per_broker(manager):
+    service = TableService(manager)
+    assert service.aggregates() == [
+        {"broker": "BrokerA", "count": 2, "total_pnl": 7.0, "total_margin": 300.0,
+         "max_max_risk": 7.5, "avg_max_risk": 6.25, "losing_accounts": 1},
+        {"broker": "BrokerB", "count": 1, "total_pnl": -1.0, "total_margin": 50.0,
+         "max_max_risk": 2.0, "avg_max_risk": 2.0, "losing_accounts": 1},
+    ]
+    assert [group["user_prefix"] for group in service.aggregates("user_prefix")] == [
+        "desk", "user"
+    ]
+
+
+def test_changes_are_applied_incrementally(manager, monkeypatch):
+    service = TableService(manager)
+    service.aggregates()
+    service.aggregates("user_prefix")
+
+    manager.apply_mutations([
+        {"op": "insert", "rows": [{"user": "user_4", "broker": "BrokerC", "pnl": -2.0,
+                                   "margin": 10.0, "max_risk": 1.0}]},
+        {"op": "update", "id": 2, "values": {"max_risk": 3.0, "pnl": 4.0}},
+        {"op": "update", "id": 3, "values": {"broker": "BrokerA", "user": "user_3"}},
+        {"op": "delete", "id": 1},
+    ])
+    expected = rebuilt(manager), rebuilt(manager, "user_prefix")
+
+    # Served from the running totals, without reading the table again
+    monkeypatch.setattr(manager, "read_versioned", lambda: pytest.fail("table was re-read"))
+    assert service.aggregates() == expected[0]
+    assert service.aggregates("user_prefix") == expected[1]
+    assert service.aggregates()[0]["max_max_risk"] == 3.0
+
+
+def test_external_changes_trigger_a_rebuild(manager):
+    service = TableService(manager)
+    service.aggregates()
+
+    other = CSVManager(file_path=manager.file_path, backup_dir=manager.backup_dir)
+    other.delete_row(0)
+    assert service.aggregates()[0]["count"] == 1
+
+    manager.restore_backup(manager.get_previous_backups(1)[0])
+    assert service.aggregates() == rebuilt(manager)
@@ -0,0 +1,84 @@
+# tests/test_table_backups.py
+import json
+
+import pytest
+
+from app.config import get_settings
+from app.services.table_backups import BackupStore
+
+settings = get_settings()
+
+
+def manifest(manager):
+    return json.loads((manager.backup_dir / "manifest.json").read_text())["backups"]
+
+
+def test_names_are_unique_and_ordered(manager):
+    names = [manager.backups.create(manager.file_path) for _ in range(20)]
+    assert len(set(names)) == 20
+    assert manager.backups.names() == names[::-1]
+    assert manager.get_previous_backups(3) == names[:-4:-1]
+
+
+def test_snapshot_is_unaffected_by_later_appends(manager, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_COMPRESS", False)
+    name = manager.backup()
+    manager.append_row({"user": "user_3", "pnl": 3.0})
+
+    # A hard link to the live file, read up to its size at snapshot time
+    assert (manager.backup_dir / name).stat().st_ino == manager.file_path.stat().st_ino
+    assert manager.backups.load(name)["user"].tolist() == ["user_1", "user_2"]
+    manager.restore_backup(name)
+    assert len(manager.read()) == 2
+
+
+def test_csv_snapshots_are_compressed_in_the_background(manager):
+    name = manager.backup()
+    manager.append_row({"user": "user_3", "pnl": 3.0})
+    manager.backups.flush()
+
+    entry = next(entry for entry in manifest(manager) if entry["name"] == name)
+    assert entry["compressed"] and entry["file"] == f"{name}.gz"
+    assert not (manager.backup_dir / name).exists()
+    assert manager.backups.load(name)["user"].tolist() == ["user_1", "user_2"]
+    manager.restore_backup(name)
+    assert len(manager.read()) == 2
+
+
+def test_retention_by_age_and_size_keeps_the_latest(manager, monkeypatch):
+    names = [manager.backup() for _ in range(3)]
+    monkeypatch.setattr(settings, "BACKUP_RETENTION_DAYS", 1e-9)
+    manager.backup()
+    manager.backups.flush()
+    assert len(manager.get_previous_backups()) == 1
+
+    monkeypatch.setattr(settings, "BACKUP_RETENTION_DAYS", 0)
+    monkeypatch.setattr(settings, "BACKUP_RETENTION_MB", 1e-6)
+    latest = manager.backup()
+    manager.backups.flush()
+    assert manager.get_previous_backups() == [latest]
+    assert not any(manager.backups.exists(name) for name in names)
+    # The journal starts at the oldest remaining snapshot
+    entries = list(manager.journal.entries())
+    assert entries[0]["op"] == "snapshot" and entries[0]["file"] == latest
+
+
+def test_manifest_is_built_from_existing_snapshots(manager, tmp_path, monkeypatch):
+    backup_dir = tmp_path / "legacy"
+    backup_dir.mkdir()
+    manager.export_csv(backup_dir / "backend_table_20240101_000000_000000_3.csv")
+    manager.export_csv(backup_dir / "backend_table_20230101_142218.csv")
+    store = BackupStore(backup_dir)
+    store.flush()
+    assert store.names() == [
+        "backend_table_20240101_000000_000000_3.csv", "backend_table_20230101_142218.csv"
+    ]
+    assert len(store.load("backend_table_20240101_000000_000000_3.csv")) == 2
+
+    # Backups from before snapshots had a seq are kept as they are
+    assert [entry["seq"] for entry in store._entries()] == [None, 3]
+    monkeypatch.setattr(settings, "CSV_SNAPSHOT_RETENTION", 1)
+    assert store.create(manager.file_path).endswith("_4.csv")
+    store.flush()
+    assert len(store.names()) == 2
+    assert (backup_dir / "backend_table_20230101_142218.csv").exists()
@@ -0,0 +1,63 @@
+# tests/test_table_diff.py
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app.services.table_diff import diff_tables
+from conftest import ROWS
+
+
+@pytest.fixture
+def rows():
+    return [*ROWS[:2], {**ROWS[2], "margin": None}]
+
+
+def test_diff_between_backup_and_current(manager):
+    name = manager.backup()
+    manager.update_row(0, {"pnl": 11.0, "broker": "BrokerC"})
+    manager.delete_row(1)
+    manager.append_row({"user": "user_4", "broker": "BrokerB", "pnl": 4.0})
+
+    diff = diff_tables(manager.read_backup(name), manager.read())
+    assert diff["key"] == "id"
+    assert diff["summary"] == {
+        "added": 1, "removed": 1, "changed": 1, "unchanged": 1,
+        "changed_columns": {"broker": 1, "pnl": 1},
+    }
+    assert [row["user"] for row in diff["added"]] == ["user_4"]
+    assert diff["removed"][0]["id"] == 2
+    assert diff["changed"] == [{"id": 1, "changes": {
+        "broker": {"old": "BrokerA", "new": "BrokerC"},
+        "pnl": {"old": 10.0, "new": 11.0},
+    }}]
+
+    assert set(diff_tables(manager.read_backup(name), manager.read(), summary=True)) == {
+        "key", "summary"
+    }
+
+
+def test_diff_limit_and_missing_values(manager):
+    before = manager.read()
+    after = before.copy()
+    after["margin"] = 1.0
+    diff = diff_tables(before, after, limit=2)
+    assert diff["summary"]["changed"] == 3
+    assert [row["id"] for row in diff["changed"]] == [1, 2]
+
+    # Missing on both sides is not a change
+    assert diff_tables(before, before.copy())["summary"]["changed"] == 0
+
+
+def test_diff_by_user_without_ids(manager):
+    before = manager.read().drop(columns="id")
+    after = before.iloc[::-1].copy()
+    after.loc[after["user"] == "user_2", "pnl"] = 0.0
+    diff = diff_tables(before, after)
+    assert diff["key"] == "user"
+    assert diff["changed"] == [{"user": "user_2", "changes": {"pnl": {"old": 20.0, "new": 0.0}}}]
+
+    with pytest.raises(HTTPException) as error:
+        diff_tables(before, pd.concat([after, after]))
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        manager.read_backup("missing.csv")
@@ -0,0 +1,48 @@
+# tests/test_table_json.py
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.services import table_json
+from app.services.table_json import columns, dumps
+from app.services.table_schema import apply_schema
+
+
+def frame():
+    return apply_schema(pd.DataFrame([
+        {"id": 1, "user": "user_1", "broker": "BrokerA", "pnl": 0.1 + 0.2, "margin": 1e21},
+        {"id": 2, "user": None, "broker": None, "pnl": float("nan"), "margin": -3.0},
+    ]))
+
+
+def test_records_match_the_stdlib_encoding():
+    records = frame().to_dict('records')
+    expected = json.dumps(
+        [{k: None if isinstance(v, float) and np.isnan(v) else v for k, v in row.items()}
+         for row in records]
+    )
+    assert json.loads(dumps(records)) == json.loads(expected)
+    assert b"0.30000000000000004" in dumps(records)
+    assert json.loads(dumps(records))[1]["pnl"] is None
+
+
+def test_columns():
+    assert json.loads(dumps(columns(frame()))) == {
+        "id": [1, 2], "user": ["user_1", None], "broker": ["BrokerA", None],
+        "pnl": [0.30000000000000004, None], "margin": [1e21, -3.0],
+    }
+
+
+def test_ndjson_lines_match_dumps():
+    lines = table_json.ndjson(frame()).splitlines()
+    assert lines == [dumps(record) for record in frame().to_dict('records')]
+    assert b"0.30000000000000004" in lines[0]
+
+
+def test_stdlib_fallback(monkeypatch):
+    monkeypatch.setattr(table_json, "orjson", None)
+    content = {"rows": frame().to_dict('records'), "columns": columns(frame())}
+    with_orjson = json.loads(dumps(content))
+    monkeypatch.undo()
+    assert json.loads(dumps(content)) == with_orjson
@@ -0,0 +1,232 @@
+# tests/test_table_partitions.py
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app.services.table_partitions import PartitionedTableManager, _key_stripe
+from conftest import ROWS, broker_row
+
+
+def row(n: int, broker: str) -> dict:
+    return broker_row(n, broker, pnl=float(n), margin=1.0, max_risk=1.0)
+
+
+@pytest.fixture
+def rows():
+    return ROWS
+
+
+@pytest.fixture
+def manager(csv_path, tmp_path):
+    return PartitionedTableManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+
+
+def status(results: list) -> list:
+    return [None if error is None else error.status_code for error in results]
+
+
+def test_existing_table_is_split_by_broker(manager):
+    assert sorted(path.name for path in manager.partition_dir.glob("*.csv")) == [
+        "BrokerA.csv", "BrokerB.csv"
+    ]
+    assert manager.partition("BrokerA").read()["id"].tolist() == [1, 3]
+    # Whole-table reads merge the partitions in id order
+    assert [(r["id"], r["user"]) for r in manager.read_records()] == [
+        (1, "user_1"), (2, "user_2"), (3, "user_3")
+    ]
+    assert manager.read_cached(broker="BrokerB")["user"].tolist() == ["user_2"]
+    assert manager.read_cached(broker="BrokerC").empty
+
+
+def test_ids_and_unique_keys_span_partitions(manager):
+    results = manager.apply_mutations([
+        {"op": "insert", "rows": [row(4, "BrokerC")]},
+        {"op": "insert", "rows": [row(5, "BrokerB")]},
+        {"op": "insert", "rows": [{**row(6, "BrokerC"), "user": "user_1"}]},
+        {"op": "insert", "rows": [{**row(7, "BrokerA"), "API key": "APIKEY_4"}]},
+    ])
+    assert status(results) == [None, None, 409, 409]
+    assert manager.read()["id"].tolist() == [1, 2, 3, 4, 5]
+    assert manager.get_row("user", "user_4")["broker"] == "BrokerC"
+
+    # A fresh manager, as in another process, carries on from the same ids
+    other = PartitionedTableManager(file_path=manager.csv_path, backup_dir=manager.backup_dir)
+    other.append_row(row(8, "BrokerA"))
+    assert other.get_row("user", "user_8")["id"] == 6
+    assert manager.get_row("user", "user_8")["id"] == 6
+
+
+def test_writes_lock_only_the_unique_values_they_write(manager):
+    stripes = lambda n: {_key_stripe(c, f"{p}_{n}") for c, p in
+                         (("user", "user"), ("API key", "APIKEY"), ("API secret", "APISECRET"))}
+    free = next(n for n in range(5, 100) if not stripes(n) & stripes(4))
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        # Another writer of user_4
+        with manager.key_locks[_key_stripe("user", "user_4")].write():
+            held.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    try:
+        for lock in manager.key_locks:
+            lock.timeout = 0.1
+        manager.append_row(row(free, "BrokerB"))
+        manager.update_row(0, {"pnl": 1.0})
+        with pytest.raises(HTTPException) as busy:
+            manager.append_row(row(4, "BrokerC"))
+        assert busy.value.status_code == 503
+    finally:
+        release.set()
+        holder.join()
+    manager.append_row(row(4, "BrokerC"))
+
+
+def test_partitions_are_listed_without_scanning_the_directory(manager, monkeypatch):
+    other = PartitionedTableManager(file_path=manager.csv_path, backup_dir=manager.backup_dir)
+    other.append_row(row(4, "BrokerC"))
+    monkeypatch.setattr(Path, "glob", lambda *args: pytest.fail("directory was scanned"))
+    assert [name for name, _ in manager._all()] == ["BrokerA", "BrokerB", "BrokerC"]
+    assert manager.get_row("user", "user_4")["id"] == 4
+    manager.etag()
+
+
+def test_changes_touch_only_their_partition(manager):
+    untouched = manager.partition("BrokerB").state_token()
+    results = manager.apply_mutations([
+        {"op": "update", "key": ["user", "user_3"], "values": {"pnl": -1.0}},
+        {"op": "delete", "index": 0},
+        {"op": "update", "index": 1, "values": {"pnl": -3.0}},
+        {"op": "update", "id": 99, "values": {"pnl": 0.0}},
+    ])
+    assert status(results) == [None, None, None, 404]
+    assert manager.partition("BrokerB").state_token() == untouched
+    assert [(r["id"], r["pnl"]) for r in manager.read_records()] == [(2, 20.0), (3, -3.0)]
+
+
+def test_later_mutations_see_earlier_ones(manager):
+    results = manager.apply_mutations([
+        {"op": "insert", "rows": [row(4, "BrokerB")]},
+        {"op": "update", "key": ["user", "user_4"], "values": {"pnl": 44.0}},
+        {"op": "delete", "key": ["user", "user_1"]},
+        {"op": "insert", "rows": [{**row(5, "BrokerB"), "user": "user_1"}]},
+        {"op": "delete", "index": 2},
+    ])
+    assert status(results) == [None, None, None, None, None]
+    assert [(r["user"], r["pnl"]) for r in manager.read_records()] == [
+        ("user_2", 20.0), ("user_3", 30.0), ("user_1", 5.0)
+    ]
+
+
+def test_changing_the_broker_moves_the_row(manager):
+    manager.update_row(0, {"broker": "BrokerB", "pnl": 1.0})
+    assert manager.partition("BrokerA").read()["id"].tolist() == [3]
+    assert manager.partition("BrokerB").read()["id"].tolist() == [1, 2]
+    assert [(r["id"], r["broker"], r["pnl"]) for r in manager.read_records()] == [
+        (1, "BrokerB", 1.0), (2, "BrokerB", 20.0), (3, "BrokerA", 30.0)
+    ]
+    assert manager.changes_since(0)[0][0]["id"] == 1
+
+    # To a new partition, after earlier changes to the row, or all or nothing
+    results = manager.apply_mutations([
+        {"op": "update", "id": 3, "values": {"pnl": 3.0}},
+        {"op": "update", "key": ["user", "user_3"], "values": {"broker": "BrokerC"}},
+        {"op": "update", "id": 2, "values": {"broker": "BrokerC", "user": "user_3"}},
+        {"op": "update", "id": 99, "values": {"broker": "BrokerC"}},
+    ])
+    assert status(results) == [None, None, 409, 404]
+    assert manager.get_row("user", "user_3") == manager.partition("BrokerC").get_row("id", 3)
+    assert manager.get_row("id", 3)["pnl"] == 3.0
+    results = manager.apply_mutations([
+        {"op": "update", "id": 1, "values": {"broker": "BrokerA"}},
+        {"op": "update", "id": 2, "values": {"pnl": "lots"}},
+    ], atomic=True)
+    assert status(results) == [None, 400]
+    assert manager.get_row("id", 1)["broker"] == "BrokerB"
+    with pytest.raises(HTTPException) as exc:
+        manager.update_row(0, {"broker": "Broker A"})
+    assert exc.value.status_code == 400
+
+
+def test_atomic_groups_span_partitions(manager):
+    before = manager.read()
+    results = manager.apply_mutations([
+        {"op": "update", "id": 1, "values": {"pnl": 0.0}},
+        {"op": "update", "id": 2, "values": {"pnl": "lots"}},
+    ], atomic=True)
+    assert status(results) == [None, 400]
+    pd.testing.assert_frame_equal(manager.read(), before)
+
+    manager.apply_mutations([
+        {"op": "update", "id": 1, "values": {"pnl": 0.0}},
+        {"op": "update", "id": 2, "values": {"pnl": 0.0}},
+    ], atomic=True)
+    assert manager.read()["pnl"].tolist() == [0.0, 0.0, 30.0]
+
+
+def test_change_feed_and_changes_since(manager):
+    published = []
+    manager.changes.subscribe(lambda changes, before, after: published.append(changes))
+    manager.append_row(row(4, "BrokerC"))
+    manager.update_row(0, {"pnl": 1.0})
+    assert [changes[0]["op"] for changes in published] == ["insert", "update"]
+
+    events, version = manager.changes_since(0)
+    assert version == 2
+    assert [(event["op"], event["id"]) for event in events] == [("insert", 4), ("update", 1)]
+    assert manager.changes_since(1)[0][0]["op"] == "update"
+
+
+def test_backups_and_restores_per_partition(manager):
+    name = manager.backup()[0]
+    assert name.startswith("BrokerA/")
+    assert name in manager.get_previous_backups(10)
+    manager.delete_row(0)
+    manager.update_row(0, {"pnl": 0.0})
+    assert manager.read_backup(name)["id"].tolist() == [1, 3]
+
+    manager.restore_backup(name)
+    # BrokerB is left as it is
+    assert [(r["id"], r["pnl"]) for r in manager.read_records()] == [
+        (1, 10.0), (2, 0.0), (3, 30.0)
+    ]
+    with pytest.raises(HTTPException) as exc:
+        manager.read_backup("BrokerZ/" + name.split("/")[1])
+    assert exc.value.status_code == 404
+
+
+def test_restore_to_a_point_in_time(manager):
+    moment = datetime.utcnow()
+    manager.update_row(0, {"pnl": 0.0})
+    manager.append_row(row(4, "BrokerC"))
+
+    manager.restore_to(moment)
+    assert [(r["id"], r["pnl"]) for r in manager.read_records()] == [
+        (1, 10.0), (2, 20.0), (3, 30.0)
+    ]
+    with pytest.raises(HTTPException) as exc:
+        manager.restore_to(moment - timedelta(days=1))
+    assert exc.value.status_code == 404
+
+
+def test_snapshots_merge_partitions_in_id_order(manager, tmp_path):
+    manager.append_rows([row(n, "BrokerB") for n in range(4, 9)])
+    manager.append_row(row(9, "BrokerA"))
+    snapshot = manager.open_snapshot()
+    try:
+        chunks = list(snapshot.iter_records(2))
+    finally:
+        snapshot.close()
+    assert pd.concat(chunks)["id"].tolist() == list(range(1, 10))
+
+    manager.export_csv(tmp_path / "export.csv")
+    exported = pd.read_csv(tmp_path / "export.csv")
+    assert exported["id"].tolist() == list(range(1, 10))
+    assert list(exported.columns) == list(manager.read().columns)
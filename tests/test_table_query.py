@@ -0,0 +1,50 @@
+# tests/test_table_query.py
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from app.services.table_query import query_table
+from app.services.table_rows import apply_mutations, with_ids
+from app.services.table_schema import apply_schema
+
+
+@pytest.fixture
+def table():
+    return pd.DataFrame({
+        "user": ["user_1", "user_2", "user_3", "user_4"],
+        "broker": ["BrokerA", "BrokerB", "BrokerA", "BrokerC"],
+        "API key": ["APIKEY_1", "APIKEY_2", "APIKEY_3", "APIKEY_4"],
+        "pnl": [10.0, -5.0, -1.0, 3.0],
+        "max_risk": [5.0, 7.0, 2.0, 9.0],
+    })
+
+
+def test_filters_by_equality_and_range(table):
+    page, total = query_table(table, {"broker": "BrokerA", "pnl_lt": "0"})
+    assert total == 1
+    assert page["user"].tolist() == ["user_3"]
+
+    page, _ = query_table(table, {"max_risk_gte": "5", "broker_in": "BrokerB,BrokerC"})
+    assert page["user"].tolist() == ["user_2", "user_4"]
+
+
+def test_projection_sort_and_pagination(table):
+    page, total = query_table(table, fields="user,api_key", sort="-pnl", offset=1, limit=2)
+    assert total == 4
+    assert list(page.columns) == ["user", "API key"]
+    assert page["user"].tolist() == ["user_4", "user_3"]
+
+
+def test_unknown_filter_is_rejected(table):
+    with pytest.raises(HTTPException) as exc:
+        query_table(table, {"nickname": "x"})
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        query_table(table, {"pnl_gt": "abc"})
+
+
+def test_sort_by_broker_after_an_update_adds_one(table):
+    table = apply_schema(with_ids(table))
+    table, _ = apply_mutations(table, [{"op": "update", "id": 2, "values": {"broker": "AAA"}}])
+    page, _ = query_table(table, sort="broker,user")
+    assert page["broker"].tolist() == ["AAA", "BrokerA", "BrokerA", "BrokerC"]
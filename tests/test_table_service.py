@@ -0,0 +1,133 @@
+# tests/test_table_service.py
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.table_partitions import PartitionedTableManager
+from app.services.table_service import TableService
+from conftest import ROWS
+
+
+@pytest.fixture
+def rows():
+    return ROWS[:1]
+
+
+def test_mutations_run_on_the_writer_thread(manager):
+    service = TableService(manager, read_workers=2, queue_size=4)
+    threads = []
+
+    def append(row):
+        threads.append(threading.current_thread().name)
+        manager.append_row(row)
+
+    async def scenario():
+        await asyncio.gather(*(
+            service.submit(append, {"user": f"user_{i}"}) for i in range(2, 5)
+        ))
+        return await service.read(manager.read_records)
+
+    try:
+        records = asyncio.run(scenario())
+    finally:
+        service.stop()
+    assert len(records) == 4
+    assert set(threads) == {"table-writer"}
+
+
+def test_full_queue_answers_503_with_retry_after(manager):
+    service = TableService(manager, read_workers=1, queue_size=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(service.submit(release.wait))
+        await asyncio.sleep(0.05)  # writer picks up the blocking job
+        queued = asyncio.ensure_future(service.submit(lambda: None))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as exc:
+            await service.submit(lambda: None)
+        release.set()
+        await asyncio.gather(blocked, queued)
+        return exc.value
+
+    try:
+        error = asyncio.run(scenario())
+    finally:
+        release.set()
+        service.stop()
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+
+
+def test_concurrent_mutations_are_group_committed(manager, monkeypatch):
+    service = TableService(manager, read_workers=1, queue_size=16)
+    release = threading.Event()
+    calls = []
+    apply_mutations = manager.apply_mutations
+
+    def record(mutations):
+        calls.append(len(mutations))
+        return apply_mutations(mutations)
+
+    monkeypatch.setattr(manager, "apply_mutations", record)
+
+    async def scenario():
+        blocked = asyncio.ensure_future(service.submit(release.wait))
+        await asyncio.sleep(0.05)
+        mutations = [
+            service.mutate("update", user_id=1, index=0, values={"pnl": 5.0}),
+            service.mutate("insert", user_id=2, rows=[{"user": "user_2"}]),
+            service.mutate("delete", user_id=3, index=7),
+            service.mutate("update", user_id=4, index=1, values={"pnl": 6.0}),
+        ]
+        tasks = [asyncio.ensure_future(m) for m in mutations]
+        await asyncio.sleep(0.05)
+        release.set()
+        await blocked
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        release.set()
+        service.stop()
+
+    assert calls == [4]
+    assert results[0] is None and results[1] is None and results[3] is None
+    assert isinstance(results[2], HTTPException) and results[2].status_code == 404
+    records = manager.read_records()
+    assert [(r["user"], r["pnl"]) for r in records] == [("user_1", 5.0), ("user_2", 6.0)]
+    assert [e["op"] for e in manager.journal.entries()] == ["snapshot", "batch"]
+
+
+def test_partitions_are_written_by_writers_of_their_own(csv_path, tmp_path, monkeypatch):
+    manager = PartitionedTableManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    service = TableService(manager, read_workers=1, queue_size=4)
+    threads = {}
+    apply_mutations = manager.apply_mutations
+
+    def record(mutations):
+        for mutation in mutations:
+            threads[mutation["user_id"]] = threading.current_thread().name
+        return apply_mutations(mutations)
+
+    monkeypatch.setattr(manager, "apply_mutations", record)
+
+    async def scenario():
+        await asyncio.gather(
+            service.mutate("insert", user_id=1, rows=[{"user": "user_2", "broker": "BrokerB"}]),
+            service.mutate("update", user_id=2, id=1, values={"pnl": 1.0}),
+            service.mutate("update", user_id=3, index=0, values={"pnl": 2.0}),
+        )
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        service.stop()
+    assert threads == {1: "table-writer-BrokerB", 2: "table-writer-BrokerA", 3: "table-writer"}
+    # The two updates of user_1 commit in either order
+    assert [(r["user"], r["pnl"] in (1.0, 2.0)) for r in manager.read_records()] == [
+        ("user_1", True), ("user_2", False)
+    ]
@@ -0,0 +1,58 @@
+# tests/test_table_shared.py
+import pandas as pd
+import pytest
+
+from app.config import get_settings
+from app.services.csv_manager import CSVManager
+from conftest import ROWS
+
+settings = get_settings()
+
+
+@pytest.fixture
+def managers(csv_path, tmp_path, monkeypatch):
+    """Two managers of one table, as in two worker processes."""
+    monkeypatch.setattr(settings, "CSV_SHARED_SNAPSHOT", True)
+    monkeypatch.setattr(settings, "CSV_SHARED_SNAPSHOT_DIR", tmp_path / "shared")
+    return [
+        CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups") for _ in range(2)
+    ]
+
+
+def test_a_parsed_table_is_published(managers):
+    writer, reader = managers
+    assert reader.shared.load(reader._file_signature()) is None
+    expected = writer.read()
+    writer.shared.flush()
+    assert writer.shared.version() == 1
+
+    loaded = reader.shared.load(reader._file_signature())
+    pd.testing.assert_frame_equal(loaded, expected)
+
+
+def test_commits_publish_the_new_table(managers, monkeypatch):
+    writer, reader = managers
+    writer.update_row(0, {"pnl": -1.0})
+    writer.append_row({"user": "user_3", "broker": "BrokerC", "pnl": 3.0})
+    writer.shared.flush()
+
+    # The reader maps the snapshot rather than parsing the file
+    monkeypatch.setattr(reader.storage, "read", pytest.fail)
+    df = reader.read()
+    assert df["pnl"].tolist() == [-1.0, 20.0, 3.0]
+    assert df["id"].tolist() == [1, 2, 3]
+
+    # Mapped frames are copied before they are changed
+    reader.update_row(2, {"pnl": 30.0})
+    assert writer.read()["pnl"].tolist() == [-1.0, 20.0, 30.0]
+
+
+def test_stale_snapshots_are_ignored(managers):
+    writer, reader = managers
+    writer.read()
+    writer.shared.flush()
+    # Changed by a process without shared snapshots
+    pd.DataFrame(ROWS[:1]).to_csv(writer.file_path, index=False)
+
+    assert reader.shared.load(reader._file_signature()) is None
+    assert reader.read()["id"].tolist() == [1]
@@ -0,0 +1,89 @@
+# tests/test_table_storage.py
+import pandas as pd
+import pytest
+
+from app.services.csv_manager import CSVManager
+from app.services.table_storage import get_storage
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(params=["csv", "feather", "parquet"])
+def manager(request, csv_path, tmp_path):
+    return CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups", storage=request.param)
+
+
+def test_existing_csv_is_imported(manager):
+    assert manager.file_path.suffix == manager.storage.suffix
+    assert manager.file_path.exists()
+    assert [(r["id"], r["user"]) for r in manager.read_records()] == [(1, "user_1"), (2, "user_2")]
+
+
+def test_row_changes_round_trip(manager):
+    manager.append_row({"user": "user_3", "pnl": 1.0})
+    manager.update_row(0, {"pnl": 11.0})
+    manager.delete_row(1)
+
+    # A fresh manager reads what was written, not the cache
+    reopened = CSVManager(
+        file_path=manager.csv_path, backup_dir=manager.backup_dir, storage=manager.storage.name
+    )
+    records = reopened.read_records()
+    assert [(r["id"], r["user"], r["pnl"]) for r in records] == [
+        (1, "user_1", 11.0), (3, "user_3", 1.0)
+    ]
+
+
+def test_backup_and_restore(manager):
+    name = manager.backup()
+    assert name.endswith(manager.storage.suffix)
+    manager.delete_row(0)
+    manager.restore_backup(name)
+    assert [r["user"] for r in manager.read_records()] == ["user_1", "user_2"]
+
+
+def test_snapshot_streams_records_and_csv(manager):
+    snapshot = manager.open_snapshot()
+    try:
+        chunks = list(snapshot.iter_records(1))
+    finally:
+        snapshot.close()
+    assert [len(chunk) for chunk in chunks] == [1, 1]
+    assert pd.concat(chunks)["user"].tolist() == ["user_1", "user_2"]
+
+    snapshot = manager.open_snapshot()
+    try:
+        text = b"".join(snapshot.iter_csv(1, 16)).decode()
+    finally:
+        snapshot.close()
+    assert text.splitlines()[0] == "id,user,broker,API key,API secret,pnl,margin,max_risk"
+    assert len(text.splitlines()) == 3
+
+
+def test_export_and_import_csv(manager, tmp_path):
+    export_path = tmp_path / "export.csv"
+    manager.export_csv(export_path)
+    exported = pd.read_csv(export_path)
+    assert exported["user"].tolist() == ["user_1", "user_2"]
+
+    exported.loc[0, "pnl"] = 42.0
+    exported.to_csv(export_path, index=False)
+    manager.import_csv(export_path)
+    assert manager.read_records()[0]["pnl"] == 42.0
+
+
+def test_snapshots_from_another_storage_can_be_restored(csv_path, tmp_path):
+    csv_manager = CSVManager(file_path=csv_path, backup_dir=tmp_path / "backups")
+    name = csv_manager.backup()
+
+    feather_manager = CSVManager(
+        file_path=csv_path, backup_dir=tmp_path / "backups", storage="feather"
+    )
+    feather_manager.delete_row(0)
+    feather_manager.restore_backup(name)
+    assert [r["user"] for r in feather_manager.read_records()] == ["user_1", "user_2"]
+
+
+def test_unknown_storage_is_rejected():
+    with pytest.raises(ValueError):
+        get_storage("xlsx")
@@ -0,0 +1,53 @@
+# tests/test_table_validation.py
+import random
+import time
+
+from app.services.table_validation import (
+    VECTORIZE_MIN_ROWS, _column_problems, _row_problems, validate_rows
+)
+
+
+def row(number: int, **values) -> dict:
+    return {"user": f"user_{number}", "broker": "BrokerA", "API key": f"APIKEY_{number}",
+            "API secret": f"APISECRET_{number}", "pnl": 1.5, "margin": 10, "max_risk": 5,
+            **values}
+
+
+def test_errors_are_reported_per_row():
+    rows = [row(1), row(2, broker="BrokerD", max_risk=-1), {"user": "user_3", "pnl": "x"}]
+    assert validate_rows(rows * VECTORIZE_MIN_ROWS)[:3] == validate_rows(rows) == [
+        None,
+        "broker must match ^Broker[A-C]$; max_risk must be between 0 and 100",
+        "broker is required; API key is required; API secret is required; "
+        "pnl must be a number; margin is required; max_risk is required",
+    ]
+    assert validate_rows([{"pnl": None}, {"max_risk": "101"}], partial=True) == [
+        None, "max_risk must be between 0 and 100"
+    ]
+
+
+def test_row_and_column_checks_agree():
+    choices = {
+        "user": ["user_1", "bob", None, 5, float("nan")],
+        "broker": ["BrokerA", "BrokerD", None],
+        "API key": ["APIKEY_2", "APIKEY_", 2.5],
+        "API secret": ["APISECRET_3", None],
+        "pnl": [1, "2.5", "x", None, True, "nan"],
+        "margin": [0.0, "1e3", []],
+        "max_risk": [0, 100, 100.5, -1, "50", None],
+    }
+    generator = random.Random(0)
+    rows = [
+        {column: generator.choice(values) for column, values in choices.items()
+         if generator.random() < 0.9}
+        for _ in range(500)
+    ]
+    for partial in (False, True):
+        assert [_row_problems(r, partial) for r in rows] == _column_problems(rows, partial)
+
+
+def test_large_payloads_validate_quickly():
+    rows = [row(number) for number in range(100_000)]
+    start = time.perf_counter()
+    assert set(validate_rows(rows)) == {None}
+    assert time.perf_counter() - start < 1